@@ -0,0 +1,93 @@
+"""Benchmark PDF text extraction throughput in pages per second
+
+Compares the original string-concatenating extractor with the page generator
+and the process-pool mode on synthetic PDFs.
+
+    python benchmarks/bench_extract.py --pages 100 1000 --workers 4
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from PyPDF2 import PdfReader  # noqa: E402
+
+from pdfchat.pdf import count_pdf_pages, iter_pdf_pages, iter_pdf_pages_parallel  # noqa: E402
+from synthetic_pdf import make_pdf  # noqa: E402
+
+
+def legacy_extract(data):
+    """The extractor as originally written, kept as the baseline"""
+    pdf_reader = PdfReader(io.BytesIO(data))
+    text = ""
+    for page in pdf_reader.pages:
+        text += page.extract_text() + "\n"
+    return text, len(pdf_reader.pages)
+
+
+def generator_extract(data):
+    texts = [text for _, text in iter_pdf_pages(data)]
+    return "".join(t + "\n" for t in texts), len(texts)
+
+
+def parallel_extract(data, workers):
+    texts = [text for _, text in iter_pdf_pages_parallel(data, workers)]
+    return "".join(t + "\n" for t in texts), len(texts)
+
+
+def timed(fn, *args, repeat=1):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    # Warm the worker pool so process start-up is not billed to the first size
+    parallel_extract(make_pdf(args.workers), args.workers)
+
+    results = []
+    for pages in args.pages:
+        data = make_pdf(pages)
+        count_time, _ = timed(count_pdf_pages, data, repeat=args.repeat)
+        row = {'pages': pages, 'bytes': len(data), 'page_count_sec': count_time}
+        reference = None
+        for name, fn, extra in [
+            ('legacy', legacy_extract, ()),
+            ('generator', generator_extract, ()),
+            ('parallel', parallel_extract, (args.workers,)),
+        ]:
+            elapsed, (text, count) = timed(fn, data, *extra, repeat=args.repeat)
+            if reference is None:
+                reference = text
+            assert text == reference and count == pages, f'{name} output differs'
+            row[f'{name}_sec'] = elapsed
+            row[f'{name}_pages_per_sec'] = pages / elapsed
+        results.append(row)
+        print(
+            f"{pages:>6} pages  count {count_time * 1000:8.1f} ms  "
+            f"legacy {row['legacy_pages_per_sec']:8.0f} p/s  "
+            f"generator {row['generator_pages_per_sec']:8.0f} p/s  "
+            f"parallel x{args.workers} {row['parallel_pages_per_sec']:8.0f} p/s"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'workers': args.workers, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
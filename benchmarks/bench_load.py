@@ -0,0 +1,426 @@
+"""Load test: concurrent user sessions against one Streamlit server process
+
+Starts ``streamlit run src/app.py`` headless with the fake Gemini client, using
+lognormal (long-tailed) latencies. Simulated users then connect to it the way
+browser tabs do, over Streamlit's websocket protocol, all at once. Each user
+enters an API key and uploads their own PDF. They wait for ingestion while the
+progress fragment polls, click a suggested question, then type follow-up
+questions, with think time between actions.
+
+Each concurrency level gets a fresh server. It reports p50/p95/p99 latency of
+interactive reruns and of question reruns (which include the model's
+answer), reruns and questions per second, and the server's peak memory,
+thread count and CPU use. The table is a capacity curve for sizing one
+process. ``--slo-ms`` marks the highest level whose interactive p95 stays
+within it. Needs ``websockets`` and ``httpx``.
+
+AppTest cannot drive sessions concurrently because every run swaps a
+process-wide runtime, so the harness speaks the protocol itself.
+
+    python benchmarks/bench_load.py --users 1 5 10 20 40 --output capacity.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+APP = os.path.join(ROOT, 'src', 'app.py')
+
+FOLLOW_UPS = (
+    'What does the document say about {}?',
+    'Where is {} mentioned, and on which page?',
+    'Summarize the section that covers {}.',
+    'How does {} relate to the main conclusions?',
+)
+
+# Rerun kinds that count as interactive (not waiting on a model answer)
+INTERACTIVE = ('render', 'upload', 'poll')
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def serve(port, profile):
+    """Run the app in this process with the fake client installed"""
+    sys.path.insert(0, HERE)
+    import fake_gemini
+    from streamlit.web import cli
+
+    fake_gemini.install()
+    fake_gemini.configure(distribution='lognormal', **parse_profile(profile))
+    sys.argv = [
+        'streamlit', 'run', APP, '--server.port', str(port), '--server.address', '127.0.0.1',
+        '--server.headless', 'true', '--server.fileWatcherType', 'none',
+        '--server.enableXsrfProtection', 'false', '--browser.gatherUsageStats', 'false',
+    ]
+    cli.main()
+
+
+def parse_profile(pairs):
+    """KEY=VALUE overrides of the fake client's profile"""
+    import fake_gemini
+
+    profile = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        default = fake_gemini.DEFAULT_PROFILE.get(key)
+        profile[key] = type(default)(value) if default is not None else value
+    return profile
+
+
+def _status(pid):
+    """(resident bytes, thread count, CPU seconds) of a process (Linux)"""
+    with open(f'/proc/{pid}/status') as f:
+        fields = dict(line.split(':', 1) for line in f)
+    with open(f'/proc/{pid}/stat') as f:
+        stat = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(stat[11]) + int(stat[12])) / os.sysconf('SC_CLK_TCK')
+    return int(fields['VmRSS'].split()[0]) * 1024, int(fields['Threads']), cpu
+
+
+class PeakSampler(threading.Thread):
+    """Polls another process's memory and threads every 10 ms and keeps the peaks"""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.baseline = _status(pid)
+        self.peak = self.baseline[:2]
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(0.01):
+            self.peak = tuple(map(max, self.peak, _status(self.pid)[:2]))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak, _status(self.pid)[2] - self.baseline[2]
+
+
+class Session:
+    """One simulated browser tab speaking Streamlit's websocket protocol
+
+    Keeps the widget values a browser would send with every rerun and the
+    widgets and exceptions of the latest script run.
+    """
+
+    def __init__(self, base_url, timeout):
+        self.ws_url = base_url.replace('http', 'ws', 1) + '/_stcore/stream'
+        self.timeout = timeout
+        self.ws = None
+        self.session_id = None
+        self.query_string = ''
+        self.widgets = {}
+        self.elements = []
+        self.errors = []
+        self.auto_rerun = None
+
+    async def __aenter__(self):
+        from websockets.asyncio.client import connect
+
+        self.ws = await connect(self.ws_url, subprotocols=['streamlit'], max_size=None)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.ws.close()
+
+    def find(self, kind, key=''):
+        """Widgets of a type in the latest run, optionally by user key"""
+        return [proto for name, proto in self.elements if name == kind and key in proto.id]
+
+    def set_value(self, proto, **value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        self.widgets[proto.id] = WidgetState(id=proto.id, **value)
+
+    async def rerun(self, trigger=None, fragment_id=''):
+        """Send a rerun like the browser does and wait for the script to finish"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        msg = BackMsg()
+        client_state = msg.rerun_script
+        client_state.query_string = self.query_string
+        client_state.widget_states.widgets.extend(self.widgets.values())
+        if trigger is not None:
+            client_state.widget_states.widgets.append(trigger)
+        if fragment_id:
+            client_state.fragment_id = fragment_id
+            client_state.is_auto_rerun = True
+        await self.ws.send(msg.SerializeToString())
+        # 2 is FINISHED_EARLY_FOR_RERUN: st.rerun() started another run
+        await self._receive_until(lambda fm: fm.WhichOneof('type') == 'script_finished' and fm.script_finished != 2)
+
+    async def click(self, button):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        await self.rerun(WidgetState(id=button.id, trigger_value=True))
+
+    async def chat(self, chat_input, text):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        trigger = WidgetState(id=chat_input.id)
+        trigger.chat_input_value.data = text
+        await self.rerun(trigger)
+
+    async def upload(self, http, uploader, name, data):
+        """Upload a file as the browser's file uploader does, then rerun"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.Common_pb2 import UploadedFileInfo
+
+        msg = BackMsg()
+        msg.file_urls_request.request_id = uuid.uuid4().hex
+        msg.file_urls_request.file_names.append(name)
+        msg.file_urls_request.session_id = self.session_id
+        await self.ws.send(msg.SerializeToString())
+        response = await self._receive_until(lambda fm: fm.WhichOneof('type') == 'file_urls_response')
+        urls = response.file_urls_response.file_urls[0]
+        reply = await http.put(urls.upload_url, files={'file': (name, data, 'application/pdf')})
+        reply.raise_for_status()
+
+        info = UploadedFileInfo(name=name, size=len(data), file_id=urls.file_id)
+        info.file_urls.CopyFrom(urls)
+        self.set_value(uploader)
+        self.widgets[uploader.id].file_uploader_state_value.uploaded_file_info.append(info)
+        await self.rerun()
+
+    async def _receive_until(self, done):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            data = await asyncio.wait_for(self.ws.recv(), max(deadline - time.monotonic(), 0))
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            self._handle(msg)
+            if done(msg):
+                return msg
+
+    def _handle(self, msg):
+        kind = msg.WhichOneof('type')
+        if kind == 'new_session':
+            self.session_id = msg.new_session.initialize.session_id or self.session_id
+            if not msg.new_session.fragment_ids_this_run:
+                self.elements = []
+                self.auto_rerun = None
+        elif kind == 'delta' and msg.delta.WhichOneof('type') == 'new_element':
+            element = msg.delta.new_element
+            name = element.WhichOneof('type')
+            if name == 'exception':
+                self.errors.append(element.exception.message)
+            elif name in ('button', 'text_input', 'file_uploader', 'chat_input'):
+                self.elements.append((name, getattr(element, name)))
+        elif kind == 'page_info_changed':
+            self.query_string = msg.page_info_changed.query_string
+        elif kind == 'auto_rerun':
+            self.auto_rerun = (msg.auto_rerun.interval, msg.auto_rerun.fragment_id)
+        elif kind == 'stop_auto_rerun':
+            self.auto_rerun = None
+
+
+async def simulate_user(index, base_url, pdf_data, args, samples):
+    """One user's visit; appends (kind, seconds) for every rerun to samples"""
+    import httpx
+    from streamlit.proto.TextInput_pb2 import TextInput
+
+    rng = random.Random(index)
+
+    async def timed(kind, step):
+        start = time.perf_counter()
+        await step
+        samples.append((kind, time.perf_counter() - start))
+        if session.errors:
+            raise RuntimeError(session.errors[0])
+
+    async def think():
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_sec)
+
+    async with Session(base_url, args.timeout) as session, \
+            httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as http:
+        await timed('render', session.rerun())
+        await think()
+        api_key = [proto for proto in session.find('text_input') if proto.type == TextInput.PASSWORD][0]
+        session.set_value(api_key, string_value=f'load-key-{index}')
+        await timed('render', session.rerun())
+        await think()
+        await timed('upload', session.upload(http, session.find('file_uploader')[0], f'user{index}.pdf', pdf_data))
+
+        deadline = time.perf_counter() + args.timeout
+        while not session.find('button', 'suggestion_'):
+            if time.perf_counter() > deadline:
+                raise RuntimeError('ingestion did not finish')
+            if session.auto_rerun:
+                interval, fragment_id = session.auto_rerun
+                await asyncio.sleep(interval)
+                await timed('poll', session.rerun(fragment_id=fragment_id))
+            else:
+                await asyncio.sleep(args.think_sec)
+                await timed('render', session.rerun())
+
+        await think()
+        await timed('question', session.click(rng.choice(session.find('button', 'suggestion_'))))
+        for _ in range(args.questions):
+            await think()
+            term = f'term{rng.randrange(args.pages * 250) % 4999}'
+            await timed('question', session.chat(session.find('chat_input')[0], rng.choice(FOLLOW_UPS).format(term)))
+
+
+async def drive(users, base_url, pdfs, args):
+    """Run every user's visit at once, their starts spread over the ramp"""
+    samples = []
+    errors = []
+
+    async def user(index):
+        await asyncio.sleep(index * args.ramp_sec / users)
+        try:
+            await simulate_user(index, base_url, pdfs[index], args, samples)
+        except Exception as e:
+            errors.append(f'{type(e).__name__}: {e}')
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+    return samples, errors
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_healthy(base_url, server, timeout=60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('the Streamlit server exited')
+        try:
+            if httpx.get(base_url + '/_stcore/health').status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('the Streamlit server did not start')
+
+
+def run_level(users, pdfs, args):
+    """Start a fresh server, run ``users`` concurrent visits against it; return a result row"""
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(os.environ, PDF_CHAT_DATA_DIR=data_dir)
+        if args.backend:
+            env['PDF_CHAT_RETRIEVAL_BACKEND'] = args.backend
+        with open(os.path.join(data_dir, 'server.log'), 'w') as log:
+            server = subprocess.Popen(
+                [sys.executable, __file__, '--serve', str(port), '--profile', *args.profile],
+                cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+            try:
+                _wait_healthy(base_url, server)
+                sampler = PeakSampler(server.pid)
+                sampler.start()
+                start = time.perf_counter()
+                samples, errors = asyncio.run(drive(users, base_url, pdfs, args))
+                elapsed = time.perf_counter() - start
+                (peak_rss, peak_threads), cpu_sec = sampler.stop()
+            finally:
+                server.terminate()
+                server.wait()
+
+    interactive = [sec for kind, sec in samples if kind in INTERACTIVE]
+    questions = [sec for kind, sec in samples if kind == 'question']
+    row = {
+        'users': users,
+        'elapsed_sec': elapsed,
+        'reruns': len(samples),
+        'reruns_per_sec': len(samples) / elapsed,
+        'questions_per_sec': len(questions) / elapsed,
+        'peak_rss_mb': peak_rss / 2 ** 20,
+        'rss_per_user_mb': (peak_rss - sampler.baseline[0]) / users / 2 ** 20,
+        'peak_threads': peak_threads,
+        'server_cpu_pct': 100 * cpu_sec / elapsed,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+    }
+    for name, values in (('rerun', interactive), ('question', questions)):
+        for q in (0.5, 0.95, 0.99):
+            value = percentile(values, q)
+            row[f'{name}_p{int(q * 100)}_ms'] = None if value is None else value * 1000
+    return row
+
+
+def _ms(value):
+    return f'{value:7.0f}' if value is not None else '      -'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 5, 10, 20, 40],
+                        help='concurrency levels; each runs against a fresh server')
+    parser.add_argument('--questions', type=int, default=3, help='typed follow-ups per user')
+    parser.add_argument('--pages', type=int, default=10, help='pages of each uploaded PDF')
+    parser.add_argument('--think-sec', type=float, default=1.0, help='mean pause between actions')
+    parser.add_argument('--ramp-sec', type=float, default=2.0, help='spread session starts over this time')
+    parser.add_argument('--backend', help='retrieval backend (PDF_CHAT_RETRIEVAL_BACKEND)')
+    parser.add_argument('--profile', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='fake client overrides, e.g. first_token=0.8 sigma=0.7')
+    parser.add_argument('--timeout', type=float, default=300, help='per-rerun and ingestion timeout')
+    parser.add_argument('--slo-ms', type=float, default=500, help='p95 target for interactive reruns')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.profile)
+        return
+
+    sys.path.insert(0, HERE)
+    from synthetic_pdf import make_pdf
+
+    # Every user uploads a distinct file, so no ingestion is shared
+    pdf = make_pdf(args.pages)
+    pdfs = [pdf + b'%% user %d\n' % i for i in range(max(args.users))]
+
+    print(f"{'users':>5} {'reruns/s':>9} {'q/s':>6} {'rerun p50':>10} {'p95':>7} {'p99':>7} "
+          f"{'question p50':>13} {'p95':>7} {'p99':>7} {'peak MB':>8} {'threads':>8} {'cpu %':>6} {'errors':>7}")
+    results = []
+    for users in args.users:
+        row = run_level(users, pdfs, args)
+        results.append(row)
+        print(f"{users:>5} {row['reruns_per_sec']:>9.1f} {row['questions_per_sec']:>6.2f} "
+              f"{_ms(row['rerun_p50_ms']):>10} {_ms(row['rerun_p95_ms'])} {_ms(row['rerun_p99_ms'])} "
+              f"{_ms(row['question_p50_ms']):>13} {_ms(row['question_p95_ms'])} {_ms(row['question_p99_ms'])} "
+              f"{row['peak_rss_mb']:>8.0f} {row['peak_threads']:>8} {row['server_cpu_pct']:>6.0f} "
+              f"{row['errors']:>7}")
+        if row['first_error']:
+            print(f"      first error: {row['first_error']}")
+
+    within = [
+        row['users'] for row in results
+        if not row['errors'] and row['rerun_p95_ms'] is not None and row['rerun_p95_ms'] <= args.slo_ms
+    ]
+    capacity = max(within) if within else None
+    print(f'Highest tested concurrency with interactive rerun p95 <= {args.slo_ms:.0f} ms: {capacity or "none"}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'slo_ms': args.slo_ms, 'capacity_users': capacity, 'levels': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
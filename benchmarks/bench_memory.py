@@ -0,0 +1,158 @@
+"""Benchmark peak memory per concurrent upload, before and after spooling
+
+Every upload is handled the way ingestion does before the SDK call: store it,
+take its size, extract its text, hash it for the content key. ``legacy`` is
+the original path, which read the upload into bytes and parsed, hashed and
+re-wrote those; ``spooled`` copies the upload to disk once in chunks and reads
+that file (PDF parsing through a memory map). Uploads come from disk-backed
+file objects, as Starlette hands them to the HTTP API. Each mode and
+concurrency runs in a fresh process that samples its resident memory; the
+peak above the baseline is divided by the number of concurrent uploads.
+``private`` is anonymous memory (what each upload really costs), ``rss`` also
+counts mapped file pages, which the kernel shares and can reclaim.
+
+    python benchmarks/bench_memory.py --size-mb 50 --concurrency 1 4 8
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from PyPDF2 import PdfReader  # noqa: E402
+
+from pdfchat.pdf import extract_pages_from_pdf, save_uploaded_file  # noqa: E402
+from pdfchat.store_index import compute_content_key  # noqa: E402
+from synthetic_pdf import make_pdf  # noqa: E402
+
+
+def legacy_upload(upload):
+    """The upload path as originally written, kept as the baseline"""
+    data = upload.read()
+    size = len(data)
+    pages = [page.extract_text() for page in PdfReader(io.BytesIO(data)).pages]
+    key = hashlib.sha256(data).hexdigest()
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+        tmp_file.write(data)
+    os.unlink(tmp_file.name)
+    return size, len(pages), key
+
+
+def spooled_upload(upload):
+    path = save_uploaded_file(upload)
+    try:
+        size = os.path.getsize(path)
+        pages = extract_pages_from_pdf(path)
+        key = compute_content_key(path, None)
+    finally:
+        os.unlink(path)
+    return size, len(pages), key
+
+
+MODES = {'legacy': legacy_upload, 'spooled': spooled_upload}
+
+
+def _memory():
+    """(anonymous, total) resident memory of this process in bytes (Linux)"""
+    with open('/proc/self/status') as f:
+        fields = dict(line.split(':', 1) for line in f)
+    return int(fields['RssAnon'].split()[0]) * 1024, int(fields['VmRSS'].split()[0]) * 1024
+
+
+class PeakSampler(threading.Thread):
+    """Polls resident memory every millisecond and keeps the peaks"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.baseline = _memory()
+        self.peak = self.baseline
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(0.001):
+            self.peak = tuple(map(max, self.peak, _memory()))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = tuple(map(max, self.peak, _memory()))
+        return [peak - base for peak, base in zip(self.peak, self.baseline)]
+
+
+def run_child(mode, path, concurrency):
+    """Handle ``concurrency`` uploads of the PDF at path at once; print a JSON row"""
+    handle = MODES[mode]
+    uploads = [open(path, 'rb') for _ in range(concurrency)]
+    sampler = PeakSampler()
+    sampler.start()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=handle, args=(upload,)) for upload in uploads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    private, rss = sampler.stop()
+    for upload in uploads:
+        upload.close()
+    print(json.dumps({
+        'mode': mode,
+        'concurrency': concurrency,
+        'sec': elapsed,
+        'peak_private_mb': private / 2 ** 20,
+        'peak_rss_mb': rss / 2 ** 20,
+        'peak_private_per_upload_mb': private / concurrency / 2 ** 20,
+        'peak_rss_per_upload_mb': rss / concurrency / 2 ** 20,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=50)
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--child', nargs=3, metavar=('MODE', 'PATH', 'CONCURRENCY'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, path, concurrency = args.child
+        run_child(mode, path, int(concurrency))
+        return
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+        tmp_file.write(make_pdf(args.pages, image_kb=int(args.size_mb * 1024 / args.pages)))
+    size = os.path.getsize(tmp_file.name)
+    print(f'{args.pages} pages, {size / 2 ** 20:.1f} MB per upload')
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            for mode in MODES:
+                out = subprocess.run(
+                    [sys.executable, __file__, '--child', mode, tmp_file.name, str(concurrency)],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                row = json.loads(out.splitlines()[-1])
+                row['bytes'] = size
+                results.append(row)
+                print(
+                    f"{mode:>8} x{concurrency:<3} per upload: private {row['peak_private_per_upload_mb']:7.1f} MB  "
+                    f"rss {row['peak_rss_per_upload_mb']:7.1f} MB  {row['sec']:6.2f}s"
+                )
+    finally:
+        os.unlink(tmp_file.name)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Benchmark session persistence as replicas are added
+
+Each replica is a process whose sessions (threads, like Streamlit script
+runs) rerun in a loop: simulated script work, then the session's state and one
+chat message are saved. ``sync`` writes each save to the store before the
+rerun ends; ``write_behind`` queues it on a SessionWriter. Reports reruns per
+second over all replicas and the time a rerun spends saving, then checks that
+every session can be resumed with all of its messages. Redis runs against
+the local stand-in in fake_redis.py.
+
+    python benchmarks/bench_sessions.py --stores sqlite redis --replicas 1 2 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.sessions import RedisSessionStore, SessionUpdate, SessionWriter, SqliteSessionStore  # noqa: E402
+
+import fake_redis  # noqa: E402
+
+MODES = ('sync', 'write_behind')
+
+
+def open_store(kind, target):
+    return SqliteSessionStore(target) if kind == 'sqlite' else RedisSessionStore(target)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def run_replica(kind, target, mode, sessions, reruns, rerun_ms):
+    """Run one replica's sessions; print its tokens, elapsed time and save latencies as JSON"""
+    store = open_store(kind, target)
+    writer = SessionWriter(store) if mode == 'write_behind' else None
+    tokens = [uuid.uuid4().hex for _ in range(sessions)]
+    save_times = []
+    lock = threading.Lock()
+
+    def session(token):
+        state = {'store_name': 'fileSearchStores/bench', 'pdf_name': 'report.pdf', 'question_count': 0}
+        times = []
+        for i in range(reruns):
+            time.sleep(rerun_ms / 1000)
+            state['question_count'] = i + 1
+            message = {'role': 'user', 'content': f'question {i} ' * 10}
+            start = time.perf_counter()
+            if writer is not None:
+                writer.update(token, state)
+                writer.append(token, message)
+            else:
+                update = SessionUpdate()
+                update.state = dict(state)
+                update.messages.append(message)
+                store.apply({token: update})
+            times.append(time.perf_counter() - start)
+        with lock:
+            save_times.extend(times)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(token,)) for token in tokens]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if writer is not None:
+        writer.flush()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'tokens': tokens, 'elapsed': elapsed, 'save_times': save_times}))
+
+
+def run(kind, target, mode, replicas, args):
+    procs = [
+        subprocess.Popen(
+            [sys.executable, __file__, '--child', kind, target, mode,
+             str(args.sessions), str(args.reruns), str(args.rerun_ms)],
+            stdout=subprocess.PIPE, text=True
+        )
+        for _ in range(replicas)
+    ]
+    outputs = [json.loads(proc.communicate()[0].splitlines()[-1]) for proc in procs]
+    save_times = [t for out in outputs for t in out['save_times']]
+    elapsed = max(out['elapsed'] for out in outputs)
+    store = open_store(kind, target)
+    resumed = sum(
+        1 for out in outputs for token in out['tokens']
+        if (stored := store.load(token)) and len(stored[1]) == args.reruns
+        and stored[0]['question_count'] == args.reruns
+    )
+    return {
+        'store': kind,
+        'mode': mode,
+        'replicas': replicas,
+        'reruns_per_sec': len(save_times) / elapsed,
+        'save_p50_ms': percentile(save_times, 0.5) * 1000,
+        'save_p99_ms': percentile(save_times, 0.99) * 1000,
+        'resumed': resumed,
+        'sessions': replicas * args.sessions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stores', nargs='+', default=['sqlite', 'redis'], choices=['sqlite', 'redis'])
+    parser.add_argument('--replicas', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--sessions', type=int, default=20, help='concurrent sessions per replica')
+    parser.add_argument('--reruns', type=int, default=50, help='reruns per session')
+    parser.add_argument('--rerun-ms', type=float, default=20, help='simulated script time per rerun')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--child', nargs=6, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, target, mode, sessions, reruns, rerun_ms = args.child
+        run_replica(kind, target, mode, int(sessions), int(reruns), float(rerun_ms))
+        return
+
+    results = []
+    server = fake_redis.start()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for kind in args.stores:
+            for mode in MODES:
+                for replicas in args.replicas:
+                    if kind == 'sqlite':
+                        target = os.path.join(tmp_dir, f'{mode}-{replicas}.sqlite3')
+                    else:
+                        target = server.url
+                    row = run(kind, target, mode, replicas, args)
+                    results.append(row)
+                    print(
+                        f"{kind:>6} {mode:>12} x{replicas:<2} {row['reruns_per_sec']:8.0f} reruns/s  "
+                        f"save p50 {row['save_p50_ms']:7.3f} ms  p99 {row['save_p99_ms']:7.3f} ms  "
+                        f"resumed {row['resumed']}/{row['sessions']}"
+                    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
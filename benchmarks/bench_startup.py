@@ -0,0 +1,98 @@
+"""Benchmark cold start: import time and time to first render of the app
+
+Every repeat runs in a fresh interpreter, as after a scale-to-zero start:
+import Streamlit, render the page once without an API key (what the first
+visitor waits for), then enter a key with the fake Gemini client. That step
+includes the first import of the SDK. Reports the median of each step and
+which heavy modules were loaded by then. Exits with status 1 if the first render's median
+exceeds ``--budget-ms``.
+
+    python benchmarks/bench_startup.py --repeat 5 --budget-ms 600
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP = os.path.join(ROOT, 'src', 'app.py')
+
+# Modules that should only be imported on the code paths that need them
+HEAVY_MODULES = ('google.genai', 'PyPDF2', 'numpy', 'scipy', 'dotenv')
+
+
+def run_child():
+    """Measure one cold start in this fresh interpreter; print a JSON row"""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    row = {'streamlit_import_sec': time.perf_counter() - start}
+
+    start = time.perf_counter()
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.run()
+    row['first_render_sec'] = time.perf_counter() - start
+    row['loaded_before_key'] = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    start = time.perf_counter()
+    sys.path.insert(0, os.path.dirname(__file__))
+    import fake_gemini
+    fake_gemini.install()
+    fake_gemini.configure(connect=0.0)
+    at.sidebar.text_input[0].input('bench-key').run()
+    row['api_key_render_sec'] = time.perf_counter() - start
+    row['loaded_after_key'] = [m for m in HEAVY_MODULES if m in sys.modules]
+    row['exception'] = bool(at.exception)
+    print(json.dumps(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=600,
+                        help='fail if the median first render takes longer')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    rows = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(os.environ, PDF_CHAT_DATA_DIR=data_dir)
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, __file__, '--child'], check=True, capture_output=True, text=True, env=env
+            ).stdout
+            rows.append(json.loads(out.splitlines()[-1]))
+
+    result = {
+        key: statistics.median(row[key] for row in rows)
+        for key in ('streamlit_import_sec', 'first_render_sec', 'api_key_render_sec')
+    }
+    result['loaded_before_key'] = rows[-1]['loaded_before_key']
+    result['loaded_after_key'] = rows[-1]['loaded_after_key']
+    result['budget_sec'] = args.budget_ms / 1000
+    result['within_budget'] = result['first_render_sec'] <= result['budget_sec']
+    print(f"streamlit import     {result['streamlit_import_sec'] * 1000:7.0f} ms")
+    print(f"first render, no key {result['first_render_sec'] * 1000:7.0f} ms  "
+          f"(budget {args.budget_ms:.0f} ms)  loaded: {', '.join(result['loaded_before_key']) or 'none'}")
+    print(f"render with API key  {result['api_key_render_sec'] * 1000:7.0f} ms  "
+          f"loaded: {', '.join(result['loaded_after_key']) or 'none'}")
+    if any(row['exception'] for row in rows):
+        print('The app raised an exception')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if not result['within_budget']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
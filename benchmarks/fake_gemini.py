@@ -0,0 +1,315 @@
+"""Offline stand-in for google.genai.Client used by benchmarks
+
+Implements the parts of the SDK the app calls (file_search_stores,
+operations, caches, models and aio.models) with configurable latency and failure injection.
+Install it in place of the real client with ``install()`` before the app or
+the pdfchat helpers create a client.
+"""
+import asyncio
+import itertools
+import math
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+# Mean latency in seconds of each simulated call; jitter is +/- a fraction.
+# With distribution 'lognormal' the means are medians and sigma sets the tail.
+DEFAULT_PROFILE = {
+    # Connection setup (TCP + TLS) paid by the first call of each client
+    'connect': 0.15,
+    'create_store': 0.05,
+    'upload': 0.1,
+    'indexing': 0.5,
+    'poll': 0.02,
+    'delete': 0.03,
+    'create_cache': 0.3,
+    'get': 0.02,
+    'first_token': 0.3,
+    'tokens_per_sec': 400.0,
+    'jitter': 0.2,
+    'distribution': 'uniform',
+    'sigma': 0.5,
+    'failure_rate': 0.0,
+    'failure_message': '429 RESOURCE_EXHAUSTED: simulated rate limit',
+    'answer_words': 120,
+}
+
+_profile = dict(DEFAULT_PROFILE)
+_store_ids = itertools.count()
+
+
+def configure(**overrides):
+    """Change the latency/failure profile used by clients created afterwards"""
+    unknown = set(overrides) - set(DEFAULT_PROFILE)
+    if unknown:
+        raise ValueError(f'unknown profile keys: {sorted(unknown)}')
+    _profile.clear()
+    _profile.update(DEFAULT_PROFILE, **overrides)
+
+
+def current_profile():
+    """Return a copy of the active profile"""
+    return dict(_profile)
+
+
+# The real google.genai.Client, kept by install() for construction benchmarks
+original_client = None
+
+
+def install():
+    """Replace google.genai.Client with FakeClient"""
+    global original_client
+    from google import genai
+    if genai.Client is not FakeClient:
+        original_client = genai.Client
+    genai.Client = FakeClient
+
+
+class FakeAPIError(Exception):
+    """Injected API failure"""
+
+
+class CallStats:
+    """Thread-safe counters of simulated API calls"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}
+
+    def add(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+
+stats = CallStats()
+
+
+def _latency(key, profile):
+    mean = profile[key]
+    if profile['distribution'] == 'lognormal':
+        # Long right tail, like the latencies of a real API
+        return random.lognormvariate(math.log(mean), profile['sigma']) if mean > 0 else 0.0
+    jitter = profile['jitter']
+    return max(random.uniform(mean * (1 - jitter), mean * (1 + jitter)), 0.0)
+
+
+def _connect_delay(profile):
+    """Connection setup latency, paid once per client (profile is per client)"""
+    if profile.get('_connected'):
+        return 0.0
+    profile['_connected'] = True
+    stats.add('connect')
+    return _latency('connect', profile)
+
+
+def _call(name, key, profile):
+    stats.add(name)
+    time.sleep(_connect_delay(profile) + _latency(key, profile))
+    if profile['failure_rate'] and random.random() < profile['failure_rate']:
+        raise FakeAPIError(profile['failure_message'])
+
+
+async def _acall(name, key, profile):
+    stats.add(name)
+    await asyncio.sleep(_connect_delay(profile) + _latency(key, profile))
+    if profile['failure_rate'] and random.random() < profile['failure_rate']:
+        raise FakeAPIError(profile['failure_message'])
+
+
+def _answer_words(contents, profile):
+    question = contents if isinstance(contents, str) else str(contents)
+    words = question.split()[:12] or ['document']
+    return [words[i % len(words)] for i in range(profile['answer_words'])]
+
+
+def _grounding_metadata():
+    return {
+        'grounding_chunks': [
+            {'retrieved_context': {'title': 'document', 'text': 'Simulated passage', 'page': 1}}
+        ]
+    }
+
+
+def _usage(contents, output_words, cached_tokens=0):
+    prompt_tokens = len(str(contents).split()) + cached_tokens
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_words,
+        total_token_count=prompt_tokens + output_words,
+        cached_content_token_count=cached_tokens
+    )
+
+
+class FakeOperation:
+    """Long-running operation that finishes after the indexing delay"""
+
+    def __init__(self, duration):
+        self.name = f'operations/op-{next(_store_ids)}'
+        self.ready_at = time.time() + duration
+        self.done = False
+        self.response = SimpleNamespace(name='documents/doc')
+        self.error = None
+
+
+class FakeOperations:
+    def __init__(self, profile):
+        self._profile = profile
+
+    def get(self, operation):
+        _call('operations.get', 'poll', self._profile)
+        operation.done = time.time() >= operation.ready_at
+        return operation
+
+
+class FakeFileSearchStores:
+    def __init__(self, profile):
+        self._profile = profile
+        self._stores = {}
+
+    def create(self, config=None):
+        _call('file_search_stores.create', 'create_store', self._profile)
+        name = f'fileSearchStores/fake-{next(_store_ids)}'
+        store = SimpleNamespace(name=name, display_name=(config or {}).get('display_name'))
+        self._stores[name] = store
+        return store
+
+    def get(self, name=None, config=None):
+        _call('file_search_stores.get', 'get', self._profile)
+        return SimpleNamespace(name=name)
+
+    def list(self, config=None):
+        _call('file_search_stores.list', 'get', self._profile)
+        return list(self._stores.values())
+
+    def delete(self, name=None, config=None):
+        _call('file_search_stores.delete', 'delete', self._profile)
+        self._stores.pop(name, None)
+
+    def upload_to_file_search_store(self, file=None, file_search_store_name=None, config=None):
+        _call('file_search_stores.upload', 'upload', self._profile)
+        return FakeOperation(_latency('indexing', self._profile))
+
+
+class FakeCaches:
+    """Cached contexts; the cached token count is reported by later answers"""
+
+    def __init__(self, profile):
+        self._profile = profile
+        self.tokens = {}
+
+    def create(self, model=None, config=None):
+        _call('caches.create', 'create_cache', self._profile)
+        name = f'cachedContents/fake-{next(_store_ids)}'
+        contents = getattr(config, 'contents', None) or []
+        self.tokens[name] = len(' '.join(str(c) for c in contents).split())
+        return SimpleNamespace(name=name, model=model, display_name=getattr(config, 'display_name', None))
+
+    def get(self, name=None, config=None):
+        _call('caches.get', 'get', self._profile)
+        if name not in self.tokens:
+            raise FakeAPIError(f'404 NOT_FOUND: {name}')
+        return SimpleNamespace(name=name)
+
+    def update(self, name=None, config=None):
+        _call('caches.update', 'get', self._profile)
+        return self.get(name)
+
+    def delete(self, name=None, config=None):
+        _call('caches.delete', 'delete', self._profile)
+        self.tokens.pop(name, None)
+
+
+def _cached_tokens(caches, config):
+    return caches.tokens.get(getattr(config, 'cached_content', None), 0)
+
+
+class FakeModels:
+    def __init__(self, profile, caches):
+        self._profile = profile
+        self._caches = caches
+
+    def list(self, config=None):
+        _call('models.list', 'get', self._profile)
+        return [SimpleNamespace(name='models/gemini-2.5-flash')]
+
+    def generate_content(self, model=None, contents=None, config=None):
+        _call('models.generate_content', 'first_token', self._profile)
+        words = _answer_words(contents, self._profile)
+        time.sleep(len(words) / self._profile['tokens_per_sec'])
+        return SimpleNamespace(
+            text=' '.join(words),
+            candidates=[SimpleNamespace(grounding_metadata=_grounding_metadata())],
+            usage_metadata=_usage(contents, len(words), _cached_tokens(self._caches, config))
+        )
+
+    def generate_content_stream(self, model=None, contents=None, config=None):
+        _call('models.generate_content_stream', 'first_token', self._profile)
+        words = _answer_words(contents, self._profile)
+        per_word = 1 / self._profile['tokens_per_sec']
+        for word in words:
+            yield SimpleNamespace(
+                text=word + ' ',
+                candidates=[SimpleNamespace(grounding_metadata=None)],
+                usage_metadata=None
+            )
+            time.sleep(per_word)
+        yield SimpleNamespace(
+            text=None,
+            candidates=[SimpleNamespace(grounding_metadata=_grounding_metadata())],
+            usage_metadata=_usage(contents, len(words), _cached_tokens(self._caches, config))
+        )
+
+
+class FakeAsyncModels:
+    """client.aio.models: the same answers, waiting on the event loop"""
+
+    def __init__(self, profile, caches):
+        self._profile = profile
+        self._caches = caches
+
+    async def generate_content(self, model=None, contents=None, config=None):
+        await _acall('aio.models.generate_content', 'first_token', self._profile)
+        words = _answer_words(contents, self._profile)
+        await asyncio.sleep(len(words) / self._profile['tokens_per_sec'])
+        return SimpleNamespace(
+            text=' '.join(words),
+            candidates=[SimpleNamespace(grounding_metadata=_grounding_metadata())],
+            usage_metadata=_usage(contents, len(words), _cached_tokens(self._caches, config))
+        )
+
+    async def generate_content_stream(self, model=None, contents=None, config=None):
+        await _acall('aio.models.generate_content_stream', 'first_token', self._profile)
+        return self._stream(contents, config)
+
+    async def _stream(self, contents, config):
+        words = _answer_words(contents, self._profile)
+        per_word = 1 / self._profile['tokens_per_sec']
+        for word in words:
+            yield SimpleNamespace(
+                text=word + ' ',
+                candidates=[SimpleNamespace(grounding_metadata=None)],
+                usage_metadata=None
+            )
+            await asyncio.sleep(per_word)
+        yield SimpleNamespace(
+            text=None,
+            candidates=[SimpleNamespace(grounding_metadata=_grounding_metadata())],
+            usage_metadata=_usage(contents, len(words), _cached_tokens(self._caches, config))
+        )
+
+
+class FakeClient:
+    """Drop-in replacement for google.genai.Client"""
+
+    def __init__(self, api_key=None, **kwargs):
+        self.api_key = api_key
+        profile = dict(_profile)
+        self.file_search_stores = FakeFileSearchStores(profile)
+        self.operations = FakeOperations(profile)
+        self.caches = FakeCaches(profile)
+        self.models = FakeModels(profile, self.caches)
+        self.aio = SimpleNamespace(models=FakeAsyncModels(profile, self.caches))
+
+    def close(self):
+        pass
@@ -0,0 +1,137 @@
+"""Local stand-in for a Redis server used by benchmarks
+
+Speaks enough of the Redis protocol (RESP2) for pdfchat.sessions:
+PING, AUTH, SELECT, GET, SET [EX], DEL, EXPIRE, RPUSH, LRANGE, DBSIZE and
+FLUSHALL, on a thread per connection. Start it in-process with ``start()``
+or on its own with ``python benchmarks/fake_redis.py --port 6390``.
+"""
+import argparse
+import socket
+import socketserver
+import threading
+import time
+
+
+class _Data:
+    """Keys shared by every connection, with optional expiry times"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.expires = {}
+
+    def get(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.time():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return self.values.get(key)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Like Redis: pipelined replies must not wait for delayed ACKs
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            with self.server.data.lock:
+                reply = self._execute(command[0].upper().decode(), command[1:])
+            self.wfile.write(reply)
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _execute(self, name, args):
+        data = self.server.data
+        if name in ('PING', 'AUTH', 'SELECT'):
+            return b'+OK\r\n' if name != 'PING' else b'+PONG\r\n'
+        if name == 'GET':
+            value = data.get(args[0])
+            return b'$-1\r\n' if value is None else _bulk(value)
+        if name == 'SET':
+            data.values[args[0]] = args[1]
+            data.expires.pop(args[0], None)
+            if len(args) > 3 and args[2].upper() == b'EX':
+                data.expires[args[0]] = time.time() + int(args[3])
+            return b'+OK\r\n'
+        if name == 'DEL':
+            removed = sum(data.values.pop(key, None) is not None for key in args)
+            for key in args:
+                data.expires.pop(key, None)
+            return b':%d\r\n' % removed
+        if name == 'EXPIRE':
+            if data.get(args[0]) is None:
+                return b':0\r\n'
+            data.expires[args[0]] = time.time() + int(args[1])
+            return b':1\r\n'
+        if name == 'RPUSH':
+            values = data.get(args[0])
+            if values is None:
+                values = data.values[args[0]] = []
+            values.extend(args[1:])
+            return b':%d\r\n' % len(values)
+        if name == 'LRANGE':
+            values = data.get(args[0]) or []
+            start, stop = int(args[1]), int(args[2])
+            stop = len(values) if stop == -1 else stop + 1
+            items = values[start:stop]
+            return b'*%d\r\n' % len(items) + b''.join(_bulk(item) for item in items)
+        if name == 'DBSIZE':
+            return b':%d\r\n' % len(data.values)
+        if name == 'FLUSHALL':
+            data.values.clear()
+            data.expires.clear()
+            return b'+OK\r\n'
+        return b'-ERR unknown command ' + name.encode() + b'\r\n'
+
+
+def _bulk(value):
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _Handler)
+        self.data = _Data()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'redis://{host}:{port}/0'
+
+
+def start(host='127.0.0.1', port=0):
+    """Serve on a background thread; returns the server (see its ``url``)"""
+    server = FakeRedisServer((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    server = FakeRedisServer((args.host, args.port))
+    print(f'Serving {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+"""Offline micro-benchmark suite for the PDF Chat helpers and app reruns
+
+Every Gemini call goes to benchmarks/fake_gemini.py, so the suite needs no
+API key or network. Results are written as JSON for diffing between releases:
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --compare baseline.json --threshold 0.2
+
+Use --full to include 5,000-page PDFs and --profile key=value to change the
+fake client's latency/failure profile (see fake_gemini.DEFAULT_PROFILE).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, '..', 'src', 'app.py')
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+# Keep benchmark state (store index, answer cache) away from real deployments
+os.environ.setdefault('PDF_CHAT_DATA_DIR', tempfile.mkdtemp(prefix='pdfchat-bench-'))
+
+import fake_gemini  # noqa: E402
+from synthetic_pdf import make_pdf  # noqa: E402
+
+fake_gemini.install()
+
+from pdfchat.chat import export_chat_history  # noqa: E402
+from pdfchat.gemini import query_file_search, stream_file_search, upload_file_to_store  # noqa: E402
+from pdfchat.pdf import extract_text_from_pdf, save_uploaded_file  # noqa: E402
+
+QUICK_PAGES = [1, 10, 100, 1000]
+FULL_PAGES = QUICK_PAGES + [5000]
+
+
+def summarize(samples):
+    """Summary statistics in seconds for a list of timings"""
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'p95': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        'max': ordered[-1],
+    }
+
+
+def measure(fn, repeat):
+    """Time fn() repeat times; return (summary, last result)"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples), result
+
+
+def bench_extract(pdfs, repeat):
+    results = {}
+    for pages, data in pdfs.items():
+        summary, (_, count) = measure(lambda: extract_text_from_pdf(io.BytesIO(data)), repeat)
+        assert count == pages
+        summary['pages_per_sec'] = pages / summary['median']
+        results[str(pages)] = summary
+    return results
+
+
+def bench_save(pdfs, repeat):
+    results = {}
+    for pages, data in pdfs.items():
+        def save():
+            path = save_uploaded_file(io.BytesIO(data))
+            os.unlink(path)
+        summary, _ = measure(save, repeat)
+        summary['mb_per_sec'] = len(data) / 1e6 / summary['median']
+        results[str(pages)] = summary
+    return results
+
+
+def bench_upload(client, pdf_path, repeat):
+    """Upload including the operation polling loop, counting polls per upload"""
+    polls_before = fake_gemini.stats.calls.get('operations.get', 0)
+    store = client.file_search_stores.create(config={'display_name': 'bench'})
+    summary, _ = measure(lambda: upload_file_to_store(client, pdf_path, store.name, 'bench'), repeat)
+    polls = fake_gemini.stats.calls.get('operations.get', 0) - polls_before
+    summary['polls_per_upload'] = polls / repeat
+    summary['simulated_indexing_sec'] = fake_gemini.current_profile()['indexing']
+    return summary
+
+
+def bench_query(client, repeat):
+    blocking, _ = measure(lambda: query_file_search(client, 'What is this about?', 'stores/bench', 'bench-model'), repeat)
+
+    ttfts = []
+
+    def stream():
+        answer = {}
+        for _ in stream_file_search(client, 'What is this about?', 'stores/bench', 'bench-model', answer):
+            pass
+        ttfts.append(answer['ttft'])
+    streaming, _ = measure(stream, repeat)
+    streaming['ttft'] = summarize(ttfts)
+    return {'blocking': blocking, 'streaming': streaming}
+
+
+def bench_clients(repeat):
+    """Query latency with a new client per request (cold) vs the shared registry (warm)"""
+    from pdfchat.clients import ClientRegistry
+
+    results = {}
+    if fake_gemini.original_client:
+        # Building the real SDK client, without any network traffic
+        results['construct_sdk_client'], _ = measure(
+            lambda: fake_gemini.original_client(api_key='bench'), repeat
+        )
+
+    def cold():
+        client = fake_gemini.FakeClient(api_key='bench')
+        query_file_search(client, 'What is this about?', 'stores/bench', 'bench-model')
+    results['cold'], _ = measure(cold, repeat)
+
+    registry = ClientRegistry()
+    query_file_search(registry.get('bench'), 'What is this about?', 'stores/bench', 'bench-model')
+    results['warm'], _ = measure(
+        lambda: query_file_search(registry.get('bench'), 'What is this about?', 'stores/bench', 'bench-model'),
+        repeat
+    )
+    results['warm']['saved_vs_cold'] = results['cold']['median'] - results['warm']['median']
+    return results
+
+
+def bench_export(repeat):
+    """Export on download: NDJSON written message by message, spilled turns included"""
+    from pdfchat.history import ChatHistory
+
+    results = {}
+    spill_dir = tempfile.mkdtemp(prefix='pdfchat-bench-export-')
+    sources = [{'document': 'bench.pdf', 'page': 3, 'chunk': 'A retrieved passage. ' * 20}]
+    for turns in [10, 100, 1000]:
+        history = ChatHistory(os.path.join(spill_dir, f'{turns}.jsonl'), keep_in_memory=200)
+        for i in range(turns):
+            history.append('user', f'Question {i} about the document?')
+            history.append('assistant', 'An answer sentence. ' * 40, ttft=0.3, latency=1.2, sources=sources)
+        summary, export = measure(lambda: export_chat_history(history), repeat)
+        summary['bytes'] = len(export.read())
+        results[str(turns)] = summary
+        history.clear()
+    return results
+
+
+def bench_reruns(pdf_data, repeat):
+    """Full Streamlit script executions through AppTest"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    results = {}
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - start)
+    results['no_api_key'] = summarize(samples)
+
+    at.sidebar.text_input[0].input('bench-key').run()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - start)
+    results['idle_with_key'] = summarize(samples)
+
+    # Upload: time until the background ingestion has been applied
+    start = time.perf_counter()
+    at.sidebar.file_uploader[0].set_value(('bench.pdf', pdf_data, 'application/pdf')).run()
+    while not at.session_state.pdf_uploaded and time.perf_counter() - start < 120:
+        time.sleep(0.02)
+        at.run()
+    results['upload_until_ready'] = summarize([time.perf_counter() - start])
+
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        at.chat_input[0].set_value(f'Benchmark question {i}?').run()
+        samples.append(time.perf_counter() - start)
+    results['question'] = summarize(samples)
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - start)
+    results['idle_with_history'] = summarize(samples)
+    return results
+
+
+def bench_api(pdf_data, levels=(1, 10, 50)):
+    """Concurrent streamed questions served by the HTTP API in one event loop"""
+    import asyncio
+
+    import httpx
+    from pdfchat.api import create_app
+
+    headers = {'x-goog-api-key': 'bench'}
+
+    async def run():
+        results = {}
+        api = create_app()
+        transport = httpx.ASGITransport(app=api)
+        async with api.router.lifespan_context(api), \
+                httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=120) as http:
+            start = time.perf_counter()
+            response = await http.post('/documents', headers=headers, files={'files': ('bench.pdf', pdf_data, 'application/pdf')})
+            job_id = response.json()['job_id']
+            while True:
+                status = (await http.get(f'/jobs/{job_id}')).json()
+                if status['status'] != 'running':
+                    break
+                await asyncio.sleep(0.02)
+            results['ingest_until_ready'] = summarize([time.perf_counter() - start])
+            collection = status['result']
+
+            async def ask(question, latencies):
+                start = time.perf_counter()
+                body = {'handle': collection['handle'], 'backend': collection['backend'], 'question': question}
+                async with http.stream('POST', '/questions', headers=headers, json=body) as response:
+                    async for _ in response.aiter_lines():
+                        pass
+                latencies.append(time.perf_counter() - start)
+
+            for concurrency in levels:
+                latencies = []
+                start = time.perf_counter()
+                await asyncio.gather(*(ask(f'Question {concurrency}-{i}?', latencies) for i in range(concurrency)))
+                elapsed = time.perf_counter() - start
+                summary = summarize(latencies)
+                summary['requests_per_sec'] = concurrency / elapsed
+                results[f'concurrency_{concurrency}'] = summary
+        return results
+
+    return asyncio.run(run())
+
+
+def bench_history_reruns(pdf_data, repeat):
+    """Idle rerun time as the conversation grows; should stay flat"""
+    from streamlit.testing.v1 import AppTest
+    from pdfchat.history import ChatHistory
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    at.sidebar.text_input[0].input('bench-key').run()
+    at.sidebar.file_uploader[0].set_value(('bench.pdf', pdf_data, 'application/pdf')).run()
+    start = time.perf_counter()
+    while not at.session_state.pdf_uploaded and time.perf_counter() - start < 120:
+        time.sleep(0.02)
+        at.run()
+
+    results = {}
+    spill_dir = tempfile.mkdtemp(prefix='pdfchat-bench-history-')
+    for turns in [10, 100, 1000]:
+        history = ChatHistory(os.path.join(spill_dir, f'{turns}.jsonl'), keep_in_memory=200)
+        for i in range(turns):
+            history.append('user', f'Question {i} about the document?')
+            history.append('assistant', 'An answer sentence. ' * 40, ttft=0.3, latency=1.2)
+        at.session_state.chat_history = history
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            at.run()
+            samples.append(time.perf_counter() - start)
+        results[str(turns)] = summarize(samples)
+        history.clear()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """Map 'benchmark.case.median' style paths to median timings"""
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict) and 'median' in value:
+            flat[path] = value['median']
+        if isinstance(value, dict):
+            flat.update(flatten({k: v for k, v in value.items() if isinstance(v, dict)}, path))
+    return flat
+
+
+def compare(current, baseline, threshold):
+    """Print median changes against a baseline; return the regressed paths"""
+    now, before = flatten(current['results']), flatten(baseline['results'])
+    regressions = []
+    for path in sorted(now):
+        if path not in before or before[path] <= 0:
+            continue
+        change = now[path] / before[path] - 1
+        flag = 'REGRESSION' if change > threshold else ''
+        if flag:
+            regressions.append(path)
+        print(f'{path:55s} {before[path] * 1000:10.2f} ms -> {now[path] * 1000:10.2f} ms  {change:+7.1%} {flag}')
+    return regressions
+
+
+def parse_profile(pairs):
+    profile = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        default = fake_gemini.DEFAULT_PROFILE.get(key)
+        profile[key] = type(default)(value) if default is not None else value
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON to compare medians against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown counted as a regression')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--full', action='store_true', help='include 5,000-page PDFs')
+    parser.add_argument('--only', nargs='+', help='run only these benchmarks')
+    parser.add_argument('--profile', nargs='*', default=[], metavar='KEY=VALUE')
+    args = parser.parse_args()
+
+    profile = parse_profile(args.profile)
+    fake_gemini.configure(**profile)
+    client = fake_gemini.FakeClient(api_key='bench')
+
+    page_counts = FULL_PAGES if args.full else QUICK_PAGES
+    pdfs = {pages: make_pdf(pages) for pages in page_counts}
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+        tmp.write(pdfs[10])
+        pdf_path = tmp.name
+
+    suites = {
+        'extract_text_from_pdf': lambda: bench_extract(pdfs, max(args.repeat // 2, 1)),
+        'save_uploaded_file': lambda: bench_save(pdfs, args.repeat),
+        'upload_file_to_store': lambda: bench_upload(client, pdf_path, args.repeat),
+        'query_file_search': lambda: bench_query(client, args.repeat),
+        'client_reuse': lambda: bench_clients(args.repeat),
+        'export_chat_history': lambda: bench_export(args.repeat),
+        'script_reruns': lambda: bench_reruns(pdfs[10], args.repeat),
+        'history_reruns': lambda: bench_history_reruns(pdfs[10], args.repeat),
+        'http_api': lambda: bench_api(pdfs[10]),
+    }
+    results = {}
+    try:
+        for name, run in suites.items():
+            if args.only and name not in args.only:
+                continue
+            print(f'running {name}...', file=sys.stderr)
+            results[name] = run()
+    finally:
+        os.unlink(pdf_path)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'profile': fake_gemini.current_profile(),
+            'api_calls': fake_gemini.stats.calls,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) above {args.threshold:.0%}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Generate synthetic text PDFs of any size for benchmarks"""
+import os
+
+
+def make_pdf(pages, words_per_page=250, image_kb=0):
+    """Build a valid PDF with one line of distinct words on every page
+
+    With ``image_kb``, every page also carries an incompressible image of
+    about that size, like a scanned document.
+    """
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+    }
+    kids = []
+    for i in range(pages):
+        text = ' '.join(f'term{(i * words_per_page + j) % 4999}' for j in range(words_per_page))
+        stream = f'BT /F1 9 Tf 20 800 Td ({text}) Tj ET'.encode('latin-1')
+        page_id, content_id, image_id = 4 + 3 * i, 5 + 3 * i, 6 + 3 * i
+        kids.append(f'{page_id} 0 R')
+        resources = '/Font << /F1 3 0 R >>'
+        if image_kb:
+            side = int((image_kb * 1024 / 3) ** 0.5)
+            pixels = os.urandom(side * side * 3)
+            objects[image_id] = b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB ' \
+                                b'/BitsPerComponent 8 /Length %d >>\nstream\n%s\nendstream' % (
+                                    side, side, len(pixels), pixels)
+            resources += f' /XObject << /Im1 {image_id} 0 R >>'
+            stream = b'q 612 0 0 842 0 0 cm /Im1 Do Q ' + stream
+        objects[page_id] = (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] '
+            f'/Resources << {resources} >> /Contents {content_id} 0 R >>'
+        ).encode('latin-1')
+        objects[content_id] = b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream)
+    objects[2] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {pages} >>'.encode('latin-1')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += b'%d 0 obj\n%s\nendobj\n' % (obj_id, objects[obj_id])
+    xref_offset = len(out)
+    size = max(objects) + 1
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % size
+    for obj_id in range(1, size):
+        if obj_id in offsets:
+            out += b'%010d 00000 n \n' % offsets[obj_id]
+        else:
+            out += b'0000000000 65535 f \n'
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, xref_offset)
+    return bytes(out)
@@ -1,209 +1,195 @@
+import logging
 import streamlit as st
-import os
 import time
-import random
-import string
-import tempfile
-import json
-from pathlib import Path
+import uuid
 from datetime import datetime
-from PyPDF2 import PdfReader
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
-
-# App text
-APP_TEXT = {
-    'page_title': 'PDF Chat with Gemini AI',
-    'page_icon': '📚',
-    'main_title': '📚 Intelligent PDF Chat Assistant',
-    'subtitle': "Powered by Google's Gemini AI - Upload any PDF and have an intelligent conversation about its content",
-    'model': 'AI Model',
-    'api_key_label': 'Enter your Gemini API Key',
-    'api_key_help': 'Get your free API key from https://makersuite.google.com/app/apikey',
-    'api_key_warning': 'Security Notice',
-    'api_key_warning_text': 'Your API key is stored only in your browser session and is never saved or shared. Keep your API key private.',
-    'api_key_required': 'Please enter your Gemini API key in the sidebar to get started',
-    'sidebar_header': 'Document Upload',
-    'choose_file': 'Choose a PDF file',
-    'processing': 'Processing your document...',
-    'upload_success': 'Successfully uploaded: {}',
-    'current_pdf': 'Current Document: {}',
-    'clear_button': 'Clear Document & Start Over',
-    'about_header': 'About This App',
-    'about_text': "This intelligent assistant uses Google's Gemini AI with advanced File Search capabilities to help you explore and understand your PDF documents through natural conversation.",
-    'upload_prompt': 'Upload a PDF file from the sidebar to begin your intelligent conversation',
-    'chat_input': 'Ask me anything about your document...',
-    'thinking': 'Analyzing...',
-    'view_sources': 'View Source References',
-    'error_response': "I couldn't generate a response. Please try rephrasing your question.",
-    'footer': 'Built with Streamlit and Google Gemini AI',
-    'error_api_key': 'API key is required.',
-    'error_pdf_extract': 'Error extracting text from PDF: {}',
-    'error_save_file': 'Error saving file: {}',
-    'error_create_store': 'Error creating file search store: {}',
-    'error_upload_store': 'Error uploading file to store: {}',
-    'error_query': 'Error querying file search: {}',
-    'error_cleanup': 'Error cleaning up store: {}',
-    'pdf_info': 'Document Information',
-    'pages': 'Pages',
-    'file_size': 'File Size',
-    'uploaded_at': 'Uploaded',
-    'export_chat': 'Export Chat History',
-    'clear_chat': 'Clear Chat History',
-    'suggested_questions': 'Suggested Questions',
-    'stats_header': 'Session Statistics',
-    'total_questions': 'Questions Asked',
-    'copy_response': 'Copy',
-    'copied': 'Copied!'
-}
+from pdfchat import settings
+from pdfchat.chat import export_chat_history, extract_citations, get_suggested_questions
+from pdfchat.clients import ClientRegistry, hash_api_key
+from pdfchat.history import ChatHistory
+from pdfchat.ingest import STAGES
+from pdfchat.lifecycle import Owner
+from pdfchat.metrics import REGISTRY, start_metrics_server
+from pdfchat.pdf import save_uploaded_file
+from pdfchat.retrieval import AutoBackend, ContextCacheBackend, FileSearchBackend, LocalBm25Backend
+from pdfchat.service import ChatService
+from pdfchat.sessions import SessionWriter, open_session_store
+from pdfchat.text import format_file_size, get_text
+
+logger = logging.getLogger('pdfchat.app')
+
+# Hidden messages previewed in the collapsed summary above the chat window
+HIDDEN_PREVIEW_MESSAGES = 20
+
+# Session fields kept in the session store so the session can resume anywhere
+PERSISTED_FIELDS = (
+    'store_name', 'backend', 'model', 'stream_responses', 'pdf_uploaded', 'pdf_name', 'pdf_pages',
+    'pdf_size', 'documents', 'upload_time', 'question_count', 'cache_hits', 'key_hash'
+)
 
-def get_text(key):
-    """Get text for the given key"""
-    return APP_TEXT.get(key, key)
+BACKEND_LABELS = {
+    AutoBackend.name: 'backend_auto',
+    FileSearchBackend.name: 'backend_file_search',
+    ContextCacheBackend.name: 'backend_context_cache',
+    LocalBm25Backend.name: 'backend_local'
+}
 
 # Helper Functions
-def generate_random_id(length=8):
-    """Generate a random ID for store naming"""
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
-
-def wait_operation(client, op, sleep_sec=2, max_wait_sec=300):
-    """Wait for Operations API to complete with timeout"""
-    start = time.time()
-    while not op.done:
-        if time.time() - start > max_wait_sec:
-            raise TimeoutError("Operation timed out.")
-        time.sleep(sleep_sec)
-        op = client.operations.get(op)
-    return op
-
-def extract_text_from_pdf(pdf_file):
-    """Extract text content from uploaded PDF file"""
-    try:
-        pdf_reader = PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text, len(pdf_reader.pages)
-    except Exception as e:
-        st.error(get_text('error_pdf_extract').format(e))
-        return None, 0
-
-def save_uploaded_file(uploaded_file):
-    """Save uploaded file to temporary location"""
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            return tmp_file.name
-    except Exception as e:
-        st.error(get_text('error_save_file').format(e))
-        return None
-
-def create_file_search_store(client, store_name):
-    """Create a new File Search Store"""
-    try:
-        store = client.file_search_stores.create(
-            config={'display_name': store_name}
+@st.cache_resource
+def get_service():
+    """Process-wide backends, ingestion jobs and answer cache shared by all sessions"""
+    return ChatService.from_settings(get_client_registry())
+
+@st.cache_resource
+def get_client_registry():
+    """Process-wide Gemini clients, one per API key, with pooled connections"""
+    return ClientRegistry.from_settings()
+
+@st.cache_resource
+def start_store_reaper():
+    """Delete expired, failed and stuck File Search Stores in the background"""
+    return get_service().start_reaper(get_client_registry().get_by_hash)
+
+@st.cache_resource
+def get_session_writer():
+    """Process-wide write-behind queue to the shared session store, or None if disabled"""
+    store = open_session_store()
+    return SessionWriter(store, settings.SESSION_FLUSH_SEC) if store else None
+
+@st.fragment(run_every=settings.JOB_STATUS_POLL_SEC)
+def show_ingest_progress():
+    """Show ingestion progress and apply the outcome once the job finishes"""
+    service = get_service()
+    job = service.get_job(st.session_state.ingest_job_id)
+    if job is not None and not job.done:
+        stage = STAGES.index(job.stage) if job.stage in STAGES else 0
+        st.progress(
+            stage / len(STAGES),
+            text=get_text('ingest_progress').format(
+                get_text('stage_' + job.stage), time.time() - job.started_at
+            )
         )
-        return store
-    except Exception as e:
-        st.error(get_text('error_create_store').format(e))
-        return None
+        for name, item_stage in job.items.items():
+            st.caption(f"{name}: {get_text('stage_' + item_stage)}")
+        return
+
+    st.session_state.ingest_job_id = None
+    if job is not None:
+        service.pop_job(job.id)
+        st.session_state.ingest_messages = list(job.messages)
+        st.session_state.session_metrics['ingest'] = stage_durations(job)
+        if job.status == 'done':
+            result = job.result
+            documents = result['documents']
+            st.session_state.store_name = result['handle']
+            st.session_state.documents = documents
+            st.session_state.pdf_name = ', '.join(d['name'] for d in documents)
+            st.session_state.pdf_pages = sum(d['pages'] for d in documents)
+            st.session_state.pdf_size = sum(d['size'] for d in documents)
+            st.session_state.pdf_uploaded = True
+            message = 'upload_reused' if result['reused'] else 'upload_success'
+            st.session_state.ingest_messages.append(
+                ('success', get_text(message).format(st.session_state.pdf_name))
+            )
+            if result['failed']:
+                st.session_state.ingest_messages.append(
+                    ('warning', get_text('upload_partial').format(', '.join(result['failed'])))
+                )
+    st.rerun()
 
-def upload_file_to_store(client, file_path, store_name, display_name):
-    """Upload file to File Search Store with size validation"""
-    try:
-        # Check file size (Gemini API has a 5MB limit for some operations)
-        file_size = os.path.getsize(file_path)
-        max_size = 5 * 1024 * 1024  # 5MB in bytes
-
-        if file_size > max_size:
-            st.warning(f"⚠️ Large file detected ({format_file_size(file_size)}). This may take longer to process or fail with large PDFs. Consider using a smaller file.")
-
-        upload_op = client.file_search_stores.upload_to_file_search_store(
-            file=file_path,
-            file_search_store_name=store_name,
-            config={
-                'display_name': display_name,
-                'custom_metadata': [
-                    {"key": "source", "string_value": "streamlit_upload"},
-                    {"key": "timestamp", "numeric_value": int(time.time())}
-                ]
-            }
-        )
-        upload_op = wait_operation(client, upload_op, max_wait_sec=600)  # Increase timeout for large files
-        return upload_op.response
-    except TimeoutError as e:
-        st.error("⏱️ Upload timed out. The file may be too large. Try a smaller PDF (under 2-3 MB recommended).")
+@st.cache_resource
+def start_metrics():
+    """Configure the metrics log and start the metrics endpoint once per process"""
+    REGISTRY.log_path = settings.METRICS_LOG
+    if not settings.METRICS_PORT:
         return None
-    except Exception as e:
-        error_msg = str(e)
-        if "400" in error_msg or "bad request" in error_msg.lower():
-            st.error(f"❌ Bad Request: The file may be too large or in an unsupported format. Try a smaller PDF (under 2 MB recommended). Error: {e}")
-        elif "413" in error_msg or "too large" in error_msg.lower():
-            st.error(f"📦 File too large: Try a PDF under 2 MB. Error: {e}")
-        else:
-            st.error(get_text('error_upload_store').format(e))
-        return None
-
-def query_file_search(client, question, store_name, model):
-    """Query the File Search Store with a question"""
     try:
-        response = client.models.generate_content(
-            model=model,
-            contents=question,
-            config=types.GenerateContentConfig(
-                tools=[
-                    types.Tool(
-                        file_search=types.FileSearch(
-                            file_search_store_names=[store_name]
-                        )
-                    )
-                ]
-            )
-        )
-        return response
-    except Exception as e:
-        st.error(get_text('error_query').format(e))
+        return start_metrics_server(int(settings.METRICS_PORT))
+    except OSError as e:
+        logger.warning('Metrics endpoint not started: %s', e)
         return None
 
-def cleanup_store(client, store_name):
-    """Delete the File Search Store"""
+def new_chat_history():
+    """Chat history of this session, spilling older turns to disk if enabled"""
+    spill_path = None
+    if settings.CHAT_MEMORY_MESSAGES:
+        spill_path = settings.CHAT_SPILL_DIR / f"{st.session_state.session_id}.jsonl"
+    return ChatHistory(spill_path, settings.CHAT_MEMORY_MESSAGES)
+
+def add_message(role, content, **fields):
+    """Append to this session's chat history and queue it for the session store"""
+    history = st.session_state.chat_history
+    history.append(role, content, **fields)
+    writer = get_session_writer()
+    if writer is not None:
+        writer.append(st.session_state.session_id, history[-1].to_dict())
+
+def resume_session(token, key_hash):
+    """Take over a stored session of the same API key; False if unknown, expired or another key's
+
+    The session moves to this page's own token and the old one is deleted, so
+    a link resumes in one tab only and two tabs never write to one chat.
+    """
+    writer = get_session_writer()
     try:
-        client.file_search_stores.delete(
-            name=store_name,
-            config={'force': True}
-        )
-        return True
-    except Exception as e:
-        st.error(get_text('error_cleanup').format(e))
+        stored = writer.load(token) if writer and token else None
+    except Exception:
+        logger.exception('Session not resumed')
         return False
-
-def export_chat_history(chat_history):
-    """Export chat history as JSON"""
-    export_data = {
-        'exported_at': datetime.now().isoformat(),
-        'conversation': chat_history
-    }
-    return json.dumps(export_data, indent=2)
-
-def get_suggested_questions(pdf_name):
-    """Generate suggested questions based on PDF type"""
-    suggestions = [
-        "What are the main topics covered in this document?",
-        "Can you provide a summary of the key points?",
-        "What are the most important findings or conclusions?",
-        "Are there any specific recommendations or action items mentioned?"
-    ]
-    return suggestions
-
-def format_file_size(size_bytes):
-    """Format file size in human-readable format"""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size_bytes < 1024.0:
-            return f"{size_bytes:.1f} {unit}"
-        size_bytes /= 1024.0
-    return f"{size_bytes:.1f} TB"
+    if stored is None or stored[0].get('key_hash') != key_hash:
+        return False
+    state, messages = stored
+    st.session_state.chat_history = new_chat_history()
+    for message in messages:
+        add_message(**message)
+    writer.delete(token)
+    get_service().transfer_holds(Owner(token, key_hash), Owner(st.session_state.session_id, key_hash))
+    if state.get('upload_time'):
+        state['upload_time'] = datetime.fromtimestamp(state['upload_time'])
+    if state.get('pdf_uploaded') and not get_service().available(state['backend'], state['store_name']):
+        # Collections held in another process's memory cannot follow the session
+        st.session_state.ingest_messages = [
+            ('info', get_text('session_resumed_reupload').format(state['pdf_name']))
+        ]
+        state = {name: state[name] for name in ('backend', 'model', 'stream_responses') if name in state}
+    elif state.get('pdf_uploaded'):
+        st.session_state.ingest_messages = [('info', get_text('session_resumed').format(state['pdf_name']))]
+    for name in PERSISTED_FIELDS:
+        if name in state:
+            st.session_state[name] = state[name]
+    return True
+
+def session_snapshot():
+    """The persisted fields of this session as JSON-compatible data"""
+    state = {name: st.session_state[name] for name in PERSISTED_FIELDS}
+    if state['upload_time']:
+        state['upload_time'] = state['upload_time'].timestamp()
+    return state
+
+def save_session():
+    """Queue this session's state for the session store if it changed since the last save"""
+    writer = get_session_writer()
+    if writer is None:
+        return
+    state = session_snapshot()
+    if state != st.session_state.saved_state:
+        writer.update(st.session_state.session_id, state)
+        st.session_state.saved_state = state
+
+def new_session_metrics():
+    """Empty per-session latency and token statistics"""
+    return {'latencies': [], 'ttfts': [], 'tokens': {}, 'ingest': {}}
+
+def stage_durations(job):
+    """Seconds spent in each stage of a finished job"""
+    entered = sorted(job.stage_times.items(), key=lambda item: item[1])
+    ends = [offset for _, offset in entered[1:]] + [job.finished_at - job.started_at]
+    return {stage: end - offset for (stage, offset), end in zip(entered, ends)}
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
 
 # Streamlit UI
 st.set_page_config(
@@ -212,6 +198,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+start_metrics()
 
 # Custom CSS for better styling
 st.markdown("""
@@ -248,11 +235,21 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize session state
+# Initialize session state; the session named in the URL is resumed once the
+# API key that owns it is entered
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.resume_token = st.query_params.get('session')
+if 'key_hash' not in st.session_state:
+    st.session_state.key_hash = None
+if 'saved_state' not in st.session_state:
+    st.session_state.saved_state = None
 if 'store_name' not in st.session_state:
     st.session_state.store_name = None
 if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+    st.session_state.chat_history = new_chat_history()
+if 'history_window' not in st.session_state:
+    st.session_state.history_window = settings.CHAT_WINDOW_TURNS
 if 'pdf_uploaded' not in st.session_state:
     st.session_state.pdf_uploaded = False
 if 'pdf_name' not in st.session_state:
@@ -267,8 +264,24 @@ if 'upload_time' not in st.session_state:
     st.session_state.upload_time = None
 if 'question_count' not in st.session_state:
     st.session_state.question_count = 0
+if 'ingest_job_id' not in st.session_state:
+    st.session_state.ingest_job_id = None
+if 'ingest_file_ids' not in st.session_state:
+    st.session_state.ingest_file_ids = None
+if 'documents' not in st.session_state:
+    st.session_state.documents = []
+if 'ingest_messages' not in st.session_state:
+    st.session_state.ingest_messages = []
+if 'backend' not in st.session_state:
+    st.session_state.backend = settings.RETRIEVAL_BACKEND
 if 'pending_question' not in st.session_state:
     st.session_state.pending_question = None
+if 'session_metrics' not in st.session_state:
+    st.session_state.session_metrics = new_session_metrics()
+if 'cache_hits' not in st.session_state:
+    st.session_state.cache_hits = 0
+if 'stream_responses' not in st.session_state:
+    st.session_state.stream_responses = True
 
 # Header
 st.markdown(f"""
@@ -297,12 +310,20 @@ with st.sidebar:
         st.warning(get_text('api_key_required'))
         st.stop()
 
-    # Initialize Gemini client with user's API key
+    # Shared Gemini client for this API key; the SDK is first imported here
     try:
-        client = genai.Client(api_key=api_key_input)
+        client = get_client_registry().get(api_key_input)
     except Exception as e:
         st.error(f"API Key Error: {e}")
         st.stop()
+    start_store_reaper()
+    key_hash = hash_api_key(api_key_input)
+    if st.session_state.resume_token:
+        resume_session(st.session_state.resume_token, key_hash)
+        st.session_state.resume_token = None
+    st.session_state.key_hash = key_hash
+    if st.query_params.get('session') != st.session_state.session_id:
+        st.query_params['session'] = st.session_state.session_id
 
     # Model selector
     model_options = [
@@ -316,63 +337,60 @@ with st.sidebar:
         help="Choose the AI model for processing your documents"
     )
     st.session_state.model = selected_model
+    st.session_state.stream_responses = st.toggle(
+        get_text('stream_responses'),
+        value=st.session_state.stream_responses
+    )
+
+    # Retrieval backend, fixed once a document is loaded
+    backend_options = list(BACKEND_LABELS)
+    st.session_state.backend = st.selectbox(
+        get_text('retrieval_backend'),
+        options=backend_options,
+        index=backend_options.index(st.session_state.backend),
+        format_func=lambda name: get_text(BACKEND_LABELS[name]),
+        disabled=st.session_state.pdf_uploaded or bool(st.session_state.ingest_job_id),
+        help=get_text('retrieval_backend_help')
+    )
 
     st.markdown("---")
     st.header(get_text('sidebar_header'))
 
-    uploaded_file = st.file_uploader(get_text('choose_file'), type=['pdf'])
-
-    if uploaded_file is not None and not st.session_state.pdf_uploaded:
-        with st.spinner(get_text('processing')):
-            # Save uploaded file
-            temp_file_path = save_uploaded_file(uploaded_file)
-
-            if temp_file_path:
-                # Get PDF metadata
-                file_size = len(uploaded_file.getvalue())
-                st.session_state.pdf_size = file_size
-                st.session_state.upload_time = datetime.now()
-
-                # Extract page count
-                text, page_count = extract_text_from_pdf(uploaded_file)
-                st.session_state.pdf_pages = page_count
-
-                # Create unique store name
-                unique_id = generate_random_id()
-                store_display_name = f'pdf-chat-store-{unique_id}'
-
-                # Create file search store
-                store = create_file_search_store(client, store_display_name)
-
-                if store:
-                    # Upload file to store
-                    file_display_name = Path(uploaded_file.name).stem
-                    uploaded = upload_file_to_store(
-                        client,
-                        temp_file_path,
-                        store.name,
-                        file_display_name
-                    )
+    uploaded_files = st.file_uploader(get_text('choose_file'), type=['pdf'], accept_multiple_files=True)
+    file_ids = [f.file_id for f in uploaded_files]
+
+    # Start background ingestion of newly uploaded files into one collection
+    if (uploaded_files and not st.session_state.pdf_uploaded
+            and file_ids != st.session_state.ingest_file_ids):
+        st.session_state.upload_time = datetime.now()
+        st.session_state.ingest_file_ids = file_ids
+        st.session_state.ingest_messages = []
+        # Spool each upload to disk once; ingestion reads only those files
+        spooled = [(f.name, save_uploaded_file(f)) for f in uploaded_files]
+        st.session_state.ingest_job_id = get_service().submit_ingest(
+            client,
+            [(name, path) for name, path in spooled if path],
+            st.session_state.backend,
+            st.session_state.model,
+            Owner(st.session_state.session_id, hash_api_key(api_key_input))
+        )
 
-                    if uploaded:
-                        st.session_state.store_name = store.name
-                        st.session_state.pdf_uploaded = True
-                        st.session_state.pdf_name = uploaded_file.name
-                        st.success(get_text('upload_success').format(uploaded_file.name))
+    if st.session_state.ingest_job_id:
+        show_ingest_progress()
 
-                    # Clean up temporary file
-                    try:
-                        os.unlink(temp_file_path)
-                    except:
-                        pass
+    for level, message in st.session_state.ingest_messages:
+        getattr(st, level)(message)
+    if st.session_state.pdf_uploaded:
+        st.session_state.ingest_messages = []
 
     if st.session_state.pdf_uploaded:
         # PDF Information Box
         st.markdown("### 📊 " + get_text('pdf_info'))
+        document_lines = "<br/>".join(d['name'] for d in st.session_state.documents)
         st.markdown(f"""
         <div class="info-box">
             <strong>{get_text('current_pdf')}</strong><br/>
-            {st.session_state.pdf_name}<br/><br/>
+            {document_lines}<br/><br/>
             <strong>{get_text('pages')}:</strong> {st.session_state.pdf_pages}<br/>
             <strong>{get_text('file_size')}:</strong> {format_file_size(st.session_state.pdf_size)}<br/>
             <strong>{get_text('uploaded_at')}:</strong> {st.session_state.upload_time.strftime('%H:%M:%S')}
@@ -398,42 +416,161 @@ with st.sidebar:
                 <p style="margin:0;">Exchanges</p>
             </div>
             """, unsafe_allow_html=True)
+        st.markdown(f"""
+        <div class="stat-box" style="margin-top:0.5rem;">
+            <h2 style="margin:0;">{st.session_state.cache_hits}</h2>
+            <p style="margin:0;">{get_text('cache_hits')}</p>
+        </div>
+        """, unsafe_allow_html=True)
+        if st.session_state.question_count:
+            st.caption(get_text('cache_hit_rate').format(
+                st.session_state.cache_hits / st.session_state.question_count,
+                st.session_state.cache_hits
+            ))
+
+        session_metrics = st.session_state.session_metrics
+        latencies = session_metrics['latencies']
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown(f"""
+            <div class="stat-box" style="margin-top:0.5rem;">
+                <h2 style="margin:0;">{f"{percentile(latencies, 0.5):.1f}s" if latencies else "–"}</h2>
+                <p style="margin:0;">{get_text('median_latency')}</p>
+            </div>
+            """, unsafe_allow_html=True)
+        with col2:
+            st.markdown(f"""
+            <div class="stat-box" style="margin-top:0.5rem;">
+                <h2 style="margin:0;">{session_metrics['tokens'].get('total', 0):,}</h2>
+                <p style="margin:0;">{get_text('tokens_used')}</p>
+            </div>
+            """, unsafe_allow_html=True)
+        with st.expander(get_text('latency_details')):
+            if latencies:
+                st.caption(get_text('latency_percentiles').format(
+                    percentile(latencies, 0.5), percentile(latencies, 0.95), percentile(latencies, 0.99)
+                ))
+            if session_metrics['ttfts']:
+                st.caption(get_text('ttft_median').format(percentile(session_metrics['ttfts'], 0.5)))
+            tokens = session_metrics['tokens']
+            if tokens:
+                st.caption(get_text('token_breakdown').format(tokens.get('prompt', 0), tokens.get('output', 0)))
+            for stage, seconds in session_metrics['ingest'].items():
+                st.caption(f"{get_text('stage_' + stage)} {seconds:.1f}s")
 
         st.markdown("")
 
         # Export and Clear buttons
         col1, col2 = st.columns(2)
         with col1:
-            if len(st.session_state.chat_history) > 0:
-                export_data = export_chat_history(st.session_state.chat_history)
+            if st.session_state.chat_history:
+                # Built only when the button is clicked, not on every rerun
+                history = st.session_state.chat_history
                 st.download_button(
                     label="💾 " + get_text('export_chat'),
-                    data=export_data,
-                    file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                    mime="application/json"
+                    data=lambda: export_chat_history(history),
+                    file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson",
+                    mime="application/x-ndjson",
+                    on_click="ignore"
                 )
 
         with col2:
             if st.button("🗑️ " + get_text('clear_button')):
                 # Cleanup store
                 if st.session_state.store_name:
-                    cleanup_store(client, st.session_state.store_name)
+                    get_service().release(
+                        client, st.session_state.backend, st.session_state.store_name,
+                        Owner(st.session_state.session_id, hash_api_key(api_key_input))
+                    )
 
                 # Reset session state
                 st.session_state.store_name = None
-                st.session_state.chat_history = []
+                st.session_state.chat_history.clear()
+                if get_session_writer() is not None:
+                    get_session_writer().reset_messages(st.session_state.session_id)
+                st.session_state.history_window = settings.CHAT_WINDOW_TURNS
                 st.session_state.pdf_uploaded = False
                 st.session_state.pdf_name = None
                 st.session_state.pdf_pages = 0
                 st.session_state.pdf_size = 0
                 st.session_state.upload_time = None
                 st.session_state.question_count = 0
+                st.session_state.cache_hits = 0
+                st.session_state.session_metrics = new_session_metrics()
+                st.session_state.ingest_file_ids = None
+                st.session_state.documents = []
                 st.rerun()
 
     st.markdown("---")
     st.markdown("### " + get_text('about_header'))
     st.markdown(get_text('about_text'))
 
+def format_answer_timing(message):
+    """Format the recorded latency of an assistant message"""
+    if message.ttft is not None:
+        return get_text('answer_timing').format(message.ttft, message.latency)
+    return get_text('answer_latency').format(message.latency)
+
+def show_history_summary(history, first_shown):
+    """Collapse the turns before the rendered window into a short summary"""
+    recent_hidden = history.slice(max(first_shown - HIDDEN_PREVIEW_MESSAGES, 0), first_shown)
+    with st.expander(get_text('history_hidden').format(first_shown)):
+        for message in recent_hidden:
+            if message.role == "user":
+                st.caption("• " + message.content[:120])
+        if first_shown > HIDDEN_PREVIEW_MESSAGES:
+            st.caption(get_text('history_more').format(first_shown - HIDDEN_PREVIEW_MESSAGES))
+    if st.button(get_text('load_older'), key="load_older", type="secondary"):
+        st.session_state.history_window += settings.CHAT_WINDOW_TURNS
+        st.rerun()
+
+def record_session_query(latency, ttft, usage):
+    """Add one model call to this session's latency and token statistics"""
+    session_metrics = st.session_state.session_metrics
+    if latency is not None:
+        session_metrics['latencies'].append(latency)
+    if ttft is not None:
+        session_metrics['ttfts'].append(ttft)
+    for kind, count in (usage or {}).items():
+        session_metrics['tokens'][kind] = session_metrics['tokens'].get(kind, 0) + count
+
+def answer_question(client, prompt):
+    """Answer a question inside the current chat message and record it in history"""
+    service = get_service()
+    args = (client, st.session_state.backend, st.session_state.store_name, st.session_state.model, prompt)
+
+    if st.session_state.stream_responses:
+        answer = {}
+        st.write_stream(service.stream_answer(*args, answer, session=st.session_state.session_id))
+    else:
+        with st.spinner(get_text('thinking')):
+            answer = service.answer(*args, session=st.session_state.session_id)
+        if answer['text']:
+            st.markdown(answer['text'])
+    text = answer['text']
+    gm = answer['grounding_metadata']
+    sources = extract_citations(gm)
+
+    if answer['cached']:
+        st.session_state.cache_hits += 1
+        st.caption(get_text('cached_answer'))
+        add_message("assistant", text, cached=True, sources=sources)
+    elif text:
+        record_session_query(answer['latency'], answer['ttft'], answer['usage'])
+        add_message("assistant", text, ttft=answer['ttft'], latency=answer['latency'], sources=sources)
+        st.caption(format_answer_timing(st.session_state.chat_history[-1]))
+    else:
+        record_session_query(answer['latency'], answer['ttft'], answer['usage'])
+        error_msg = get_text('error_response')
+        st.error(error_msg)
+        add_message("assistant", error_msg)
+        return
+
+    # Show grounding metadata if available
+    if gm:
+        with st.expander(get_text('view_sources')):
+            st.write(gm)
+
 # Main chat interface
 if not st.session_state.pdf_uploaded:
     st.info(get_text('upload_prompt'))
@@ -463,7 +600,7 @@ if not st.session_state.pdf_uploaded:
         """)
 else:
     # Suggested questions (show only if no chat history)
-    if len(st.session_state.chat_history) == 0:
+    if not st.session_state.chat_history:
         st.markdown("### 💡 " + get_text('suggested_questions'))
         suggestions = get_suggested_questions(st.session_state.pdf_name)
         cols = st.columns(2)
@@ -475,13 +612,21 @@ else:
                     st.session_state.question_count += 1
                     st.rerun()
 
-    # Display chat history
-    for idx, message in enumerate(st.session_state.chat_history):
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    # Display the most recent turns of the chat history
+    history = st.session_state.chat_history
+    first_shown = max(len(history) - 2 * st.session_state.history_window, 0)
+    if first_shown:
+        show_history_summary(history, first_shown)
+    for idx, message in enumerate(history.slice(first_shown, len(history)), start=first_shown):
+        with st.chat_message(message.role):
+            st.markdown(message.content)
+            if message.cached:
+                st.caption(get_text('cached_answer'))
+            elif message.latency is not None:
+                st.caption(format_answer_timing(message))
 
             # Add copy button for assistant responses
-            if message["role"] == "assistant":
+            if message.role == "assistant":
                 if st.button(get_text('copy_response'), key=f"copy_{idx}", type="secondary"):
                     st.toast(get_text('copied'))
 
@@ -491,7 +636,7 @@ else:
         st.session_state.pending_question = None  # Clear it
 
         # Add user message to chat history
-        st.session_state.chat_history.append({"role": "user", "content": prompt})
+        add_message("user", prompt)
 
         # Display user message
         with st.chat_message("user"):
@@ -499,36 +644,12 @@ else:
 
         # Generate response
         with st.chat_message("assistant"):
-            with st.spinner(get_text('thinking')):
-                response = query_file_search(client, prompt, st.session_state.store_name, st.session_state.model)
-
-                if response and response.text:
-                    st.markdown(response.text)
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": response.text
-                    })
-
-                    # Show grounding metadata if available
-                    try:
-                        gm = response.candidates[0].grounding_metadata
-                        if gm:
-                            with st.expander(get_text('view_sources')):
-                                st.write(gm)
-                    except:
-                        pass
-                else:
-                    error_msg = get_text('error_response')
-                    st.error(error_msg)
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": error_msg
-                    })
+            answer_question(client, prompt)
 
     # Chat input
     if prompt := st.chat_input(get_text('chat_input')):
         # Add user message to chat history
-        st.session_state.chat_history.append({"role": "user", "content": prompt})
+        add_message("user", prompt)
         st.session_state.question_count += 1
 
         # Display user message
@@ -537,31 +658,9 @@ else:
 
         # Generate response
         with st.chat_message("assistant"):
-            with st.spinner(get_text('thinking')):
-                response = query_file_search(client, prompt, st.session_state.store_name, st.session_state.model)
-
-                if response and response.text:
-                    st.markdown(response.text)
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": response.text
-                    })
-
-                    # Show grounding metadata if available
-                    try:
-                        gm = response.candidates[0].grounding_metadata
-                        if gm:
-                            with st.expander(get_text('view_sources')):
-                                st.write(gm)
-                    except:
-                        pass
-                else:
-                    error_msg = get_text('error_response')
-                    st.error(error_msg)
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": error_msg
-                    })
+            answer_question(client, prompt)
+
+save_session()
 
 # Footer
 st.markdown("---")
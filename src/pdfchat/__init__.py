@@ -0,0 +1 @@
+"""Support modules for the PDF Chat Streamlit app"""
@@ -0,0 +1,106 @@
+"""Persistent LRU cache of answers keyed by store, model and question
+
+Entries live in SQLite so they survive restarts and are shared by every
+session of a deployment. The cache is bounded by entry count (least recently
+used entries are evicted first) and by age (entries older than the TTL are
+treated as misses and purged).
+"""
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+
+from .db import transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    cache_key TEXT PRIMARY KEY,
+    store_name TEXT NOT NULL,
+    text TEXT NOT NULL,
+    grounding_metadata TEXT,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+)
+"""
+INDEX = 'CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used_at)'
+
+
+def normalize_question(question):
+    """Normalize case, whitespace and trailing punctuation of a question"""
+    question = re.sub(r'\s+', ' ', question.casefold()).strip()
+    return question.rstrip('?!. ')
+
+
+def make_cache_key(store_name, model, question):
+    """Build the cache key for a question asked against a store"""
+    raw = json.dumps([store_name, model, normalize_question(question)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def to_jsonable(grounding_metadata):
+    """Convert grounding metadata from the SDK into plain JSON data"""
+    if grounding_metadata is None:
+        return None
+    if hasattr(grounding_metadata, 'model_dump'):
+        return grounding_metadata.model_dump(mode='json', exclude_none=True)
+    return grounding_metadata
+
+
+class AnswerCache:
+    """Size- and age-bounded answer cache persisted to SQLite"""
+
+    def __init__(self, db_path, max_entries=1000, ttl_sec=86400):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+            conn.execute(INDEX)
+
+    def _connect(self):
+        return transaction(self.db_path)
+
+    def get(self, store_name, model, question):
+        """Return a cached answer dict with text and grounding metadata, or None"""
+        key = make_cache_key(store_name, model, question)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT text, grounding_metadata, created_at FROM answers WHERE cache_key = ?',
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            text, gm, created_at = row
+            if now - created_at > self.ttl_sec:
+                conn.execute('DELETE FROM answers WHERE cache_key = ?', (key,))
+                return None
+            conn.execute('UPDATE answers SET last_used_at = ? WHERE cache_key = ?', (now, key))
+        return {
+            'text': text,
+            'grounding_metadata': json.loads(gm) if gm else None
+        }
+
+    def put(self, store_name, model, question, text, grounding_metadata=None):
+        """Cache an answer, evicting expired and least recently used entries"""
+        key = make_cache_key(store_name, model, question)
+        gm = to_jsonable(grounding_metadata)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)',
+                (key, store_name, text, json.dumps(gm) if gm is not None else None, now, now)
+            )
+            conn.execute('DELETE FROM answers WHERE created_at < ?', (now - self.ttl_sec,))
+            conn.execute(
+                'DELETE FROM answers WHERE cache_key IN ('
+                ' SELECT cache_key FROM answers ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def invalidate_store(self, store_name):
+        """Drop every answer cached for a store"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM answers WHERE store_name = ?', (store_name,))
+
@@ -0,0 +1,225 @@
+"""Asynchronous HTTP API over ChatService, independent of Streamlit reruns
+
+Run it from the src/ directory::
+
+    uvicorn pdfchat.api:app --host 0.0.0.0 --port 8000
+
+Run a single worker per deployment: ingestion jobs, local BM25 indexes and
+direct-context handles live in the worker's memory, so a request routed to
+another worker would not find them. Scale out with more concurrent requests
+per worker (everything waiting on Gemini is a coroutine or pooled thread).
+
+Endpoints (the Gemini API key goes in the ``X-Goog-Api-Key`` header):
+
+    POST   /documents               multipart ``files`` (+ ``backend``, ``model``, ``owner``) -> 202 job
+    GET    /jobs/{job_id}           ingestion stage, per-file progress and result
+    POST   /questions               JSON ``handle``, ``question`` (+ ``backend``, ``model``,
+                                    ``stream``, ``owner``) -> NDJSON text chunks, or one JSON answer
+    DELETE /collections/{handle}    release a collection (``?backend=``, ``?owner=``); only the owner
+                                    and API key that ingested it can, once per ingestion
+    GET    /health                  client registry stats; with a key header, also checks the key
+
+Ingestion runs on the service's job pool and answers stream from the SDK's
+asyncio client, so a client waiting on an answer holds a coroutine rather than
+a thread.
+"""
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from . import settings
+from .answer_cache import to_jsonable
+from .clients import ClientRegistry, hash_api_key
+from .lifecycle import Owner
+from .pdf import save_uploaded_file
+from .report import capture_messages
+from .service import ChatService
+
+API_KEY_HEADER = 'x-goog-api-key'
+
+
+class ApiError(Exception):
+    """Request error returned to the caller as JSON with an HTTP status"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _client(request):
+    api_key = request.headers.get(API_KEY_HEADER)
+    if not api_key:
+        raise ApiError(401, f"Missing {API_KEY_HEADER} header")
+    return request.app.state.clients.get(api_key)
+
+
+def _service(request):
+    return request.app.state.service
+
+
+def _job_status(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'stage': job.stage,
+        'items': job.items,
+        'messages': [{'level': level, 'message': message} for level, message in job.messages],
+        'result': job.result,
+        'elapsed': (job.finished_at or time.time()) - job.started_at,
+    }
+
+
+def _answer_body(answer, messages):
+    return {
+        'text': answer.get('text'),
+        'cached': answer.get('cached'),
+        'sources': to_jsonable(answer.get('grounding_metadata')),
+        'ttft': answer.get('ttft'),
+        'latency': answer.get('latency'),
+        'usage': answer.get('usage'),
+        'messages': messages,
+    }
+
+
+def _spool(upload):
+    """Copy an uploaded file to a temporary file in chunks; return its path"""
+    errors = []
+    with capture_messages(lambda level, message: errors.append(message)):
+        path = save_uploaded_file(upload.file)
+    if not path:
+        raise ApiError(500, errors[0] if errors else f"Could not store {upload.filename}")
+    return path
+
+
+async def create_documents(request):
+    client = _client(request)
+    form = await request.form()
+    uploads = [f for f in form.getlist('files') if hasattr(f, 'read')]
+    if not uploads:
+        raise ApiError(400, "No files uploaded")
+    backend = form.get('backend') or settings.RETRIEVAL_BACKEND
+    _service(request).backend(backend)
+    model = form.get('model') or settings.DEFAULT_MODEL
+    owner = Owner(form.get('owner') or 'api', hash_api_key(request.headers[API_KEY_HEADER]))
+    files = []
+    try:
+        for upload in uploads:
+            files.append((upload.filename, await run_in_threadpool(_spool, upload)))
+    except BaseException:
+        for _, path in files:
+            os.unlink(path)
+        raise
+    job_id = _service(request).submit_ingest(client, files, backend, model, owner)
+    return JSONResponse({'job_id': job_id, 'backend': backend}, status_code=202)
+
+
+async def get_job(request):
+    job = _service(request).get_job(request.path_params['job_id'])
+    if job is None:
+        raise ApiError(404, "Unknown job")
+    return JSONResponse(_job_status(job))
+
+
+async def create_question(request):
+    client = _client(request)
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ApiError(400, "Request body must be JSON") from None
+    if not body.get('handle') or not body.get('question'):
+        raise ApiError(400, "Both 'handle' and 'question' are required")
+    service = _service(request)
+    backend = body.get('backend') or settings.RETRIEVAL_BACKEND
+    service.backend(backend)
+    args = (client, backend, body['handle'], body.get('model') or settings.DEFAULT_MODEL, body['question'])
+    session = body.get('owner') or 'api'
+
+    async def chunks():
+        answer = {}
+        messages = []
+        with capture_messages(lambda level, message: messages.append({'level': level, 'message': message})):
+            async for text in service.astream_answer(*args, answer, session):
+                yield json.dumps({'text': text}) + '\n'
+        yield json.dumps({'done': True, **_answer_body(answer, messages)}) + '\n'
+
+    if body.get('stream', True):
+        return StreamingResponse(chunks(), media_type='application/x-ndjson')
+    answer = {}
+    messages = []
+    with capture_messages(lambda level, message: messages.append({'level': level, 'message': message})):
+        async for _ in service.astream_answer(*args, answer, session):
+            pass
+    return JSONResponse(_answer_body(answer, messages))
+
+
+async def delete_collection(request):
+    client = _client(request)
+    backend = request.query_params.get('backend') or settings.RETRIEVAL_BACKEND
+    owner = Owner(request.query_params.get('owner') or 'api', hash_api_key(request.headers[API_KEY_HEADER]))
+    # Releasing may delete the store or cache over the network
+    released = await run_in_threadpool(
+        _service(request).release, client, backend, request.path_params['handle'], owner
+    )
+    return JSONResponse({'released': bool(released)})
+
+
+async def health(request):
+    clients = request.app.state.clients
+    body = {'status': 'ok'}
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key:
+        # Deep check: one authenticated call through the pooled client
+        body['api_key_valid'] = await run_in_threadpool(clients.check, api_key)
+        if not body['api_key_valid']:
+            body['status'] = 'degraded'
+    body['clients'] = clients.stats()
+    body['scheduler'] = _service(request).scheduler.stats()
+    return JSONResponse(body)
+
+
+async def _api_error(request, exc):
+    return JSONResponse({'error': str(exc)}, status_code=exc.status_code)
+
+
+async def _value_error(request, exc):
+    return JSONResponse({'error': str(exc)}, status_code=400)
+
+
+def create_app(service=None, clients=None):
+    """Build the ASGI app around a ChatService and ClientRegistry (by default from settings)
+
+    The service, clients and store reaper are set up when the server starts
+    the app (its lifespan), not at import.
+    """
+
+    @asynccontextmanager
+    async def lifespan(api):
+        api.state.clients = clients or ClientRegistry.from_settings()
+        api.state.service = service or ChatService.from_settings(api.state.clients)
+        reaper = api.state.service.start_reaper(api.state.clients.get_by_hash)
+        try:
+            yield
+        finally:
+            if reaper is not None:
+                reaper.stop()
+
+    return Starlette(
+        routes=[
+            Route('/documents', create_documents, methods=['POST']),
+            Route('/jobs/{job_id}', get_job, methods=['GET']),
+            Route('/questions', create_question, methods=['POST']),
+            Route('/collections/{handle:path}', delete_collection, methods=['DELETE']),
+            Route('/health', health, methods=['GET']),
+        ],
+        exception_handlers={ApiError: _api_error, ValueError: _value_error},
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
@@ -0,0 +1,80 @@
+"""Vectorized BM25 index over page-aware text chunks
+
+NumPy and SciPy are imported when the first index is built, so processes that
+never use the local backend do not pay for them at start-up.
+"""
+import re
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def chunk_pages(pages, chunk_words=200, overlap_words=40, source=None):
+    """Split page texts into overlapping word windows
+
+    Returns a list of (source, page_number, text) tuples with 1-based page
+    numbers. Chunks never span pages so every passage can be cited to one page.
+    """
+    step = max(chunk_words - overlap_words, 1)
+    chunks = []
+    for page_number, text in enumerate(pages, start=1):
+        words = text.split()
+        for start in range(0, max(len(words) - overlap_words, 1), step):
+            window = words[start:start + chunk_words]
+            if window:
+                chunks.append((source, page_number, ' '.join(window)))
+    return chunks
+
+
+class Bm25Index:
+    """Okapi BM25 scores precomputed into a sparse chunk-by-term matrix"""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        import numpy as np
+        from scipy import sparse
+
+        self.chunks = chunks
+        self.vocabulary = {}
+        rows, cols = [], []
+        for row, (_, _, text) in enumerate(chunks):
+            for token in tokenize(text):
+                rows.append(row)
+                cols.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+
+        shape = (len(chunks), max(len(self.vocabulary), 1))
+        data = np.ones(len(rows), dtype=np.float32)
+        # Duplicate (row, col) pairs are summed into term frequencies
+        tf = sparse.csr_matrix((data, (rows, cols)), shape=shape)
+        tf.sum_duplicates()
+
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if len(doc_len) else 0.0
+        doc_freq = np.bincount(tf.indices, minlength=shape[1])
+        idf = np.log1p((shape[0] - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+        # Fold the length normalization and idf into the stored weights so a
+        # query is just a column sum over its terms.
+        norm = k1 * (1 - b + b * doc_len / avg_len) if avg_len else np.full(shape[0], k1)
+        row_norm = np.repeat(norm, np.diff(tf.indptr)).astype(np.float32)
+        tf.data = idf[tf.indices] * tf.data * (k1 + 1) / (tf.data + row_norm)
+        self.weights = tf.tocsc()
+
+    def search(self, query, top_k=5):
+        """Return up to top_k (score, source, page_number, text) tuples, best first"""
+        import numpy as np
+
+        term_ids = sorted({self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary})
+        if not term_ids or not self.chunks:
+            return []
+        scores = np.asarray(self.weights[:, term_ids].sum(axis=1)).ravel()
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            (float(scores[i]),) + tuple(self.chunks[i])
+            for i in best if scores[i] > 0
+        ]
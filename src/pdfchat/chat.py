@@ -0,0 +1,79 @@
+"""Chat history export, answer citations and question suggestions"""
+import io
+import json
+from datetime import datetime
+
+from .answer_cache import to_jsonable
+
+
+def extract_citations(grounding_metadata):
+    """Reduce an answer's grounding metadata to a list of citations
+
+    Each citation is a dict with the ``document`` name, the ``page`` (or None
+    when the backend does not report one) and the retrieved ``chunk`` of text.
+    Handles File Search grounding chunks, including parts of split PDFs whose
+    page numbers are shifted back to the original document, and the passages
+    of the local search backend. Duplicate citations are dropped.
+    """
+    data = to_jsonable(grounding_metadata) or {}
+    citations = []
+    seen = set()
+
+    def add(document, page, chunk):
+        key = (document, page, chunk)
+        if key not in seen:
+            seen.add(key)
+            citations.append({'document': document, 'page': page, 'chunk': chunk})
+
+    for passage in data.get('retrieved_passages') or []:
+        add(passage.get('document'), passage.get('page'), passage.get('text'))
+
+    for grounding_chunk in data.get('grounding_chunks') or []:
+        context = grounding_chunk.get('retrieved_context')
+        if not context:
+            continue
+        metadata = {
+            item.get('key'): item.get('string_value', item.get('numeric_value'))
+            for item in context.get('custom_metadata') or []
+        }
+        rag_chunk = context.get('rag_chunk') or {}
+        page = (rag_chunk.get('page_span') or {}).get('first_page') or context.get('page_number') or context.get('page')
+        if page is not None and metadata.get('first_page') is not None:
+            page = int(metadata['first_page']) + int(page) - 1
+        document = metadata.get('source_file') or context.get('title') or context.get('document_name')
+        add(document, page, context.get('text') or rag_chunk.get('text'))
+    return citations
+
+
+def iter_chat_export(messages):
+    """Yield the export as NDJSON lines: a header, then one line per message"""
+    yield json.dumps({'exported_at': datetime.now().isoformat()}) + '\n'
+    for message in messages:
+        if not isinstance(message, dict):
+            message = message.to_dict()
+        yield json.dumps(message, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def export_chat_history(chat_history):
+    """Export chat history as NDJSON in a BytesIO
+
+    Meant to be called only when a download is requested. Lines are encoded
+    and written one message at a time, so a long history is never also held as
+    one string. st.download_button accepts the BytesIO as it is.
+    """
+    export = io.BytesIO()
+    for line in iter_chat_export(chat_history):
+        export.write(line.encode('utf-8'))
+    export.seek(0)
+    return export
+
+
+def get_suggested_questions(pdf_name):
+    """Generate suggested questions based on PDF type"""
+    suggestions = [
+        "What are the main topics covered in this document?",
+        "Can you provide a summary of the key points?",
+        "What are the most important findings or conclusions?",
+        "Are there any specific recommendations or action items mentioned?"
+    ]
+    return suggestions
@@ -0,0 +1,165 @@
+"""Process-wide registry of Gemini clients with pooled keep-alive connections
+
+Building a ``genai.Client`` is not free, and every new client opens fresh
+HTTP connections (TCP and TLS handshakes) on its first request. The registry
+keeps one client per API key for the life of the process, so reruns, sessions
+and API requests with the same key reuse warm connections. Keys are held only
+as SHA-256 hashes in the registry's index. Work that outlives the request
+that got the client (ingestion, prefetching, streaming, the reaper) holds a
+lease on it, and leased clients are never evicted.
+
+The SDK is imported when the first client is built, not when this module is,
+so a page waiting for an API key does not pay for it.
+"""
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from . import settings
+
+
+def hash_api_key(api_key):
+    """Registry key for an API key, so the key itself is never used as an index"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+def http_options(pool_size, timeout_sec, keepalive_sec):
+    """HttpOptions giving the sync and async transports a bounded keep-alive pool"""
+    import httpx
+    from google.genai import types
+
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=keepalive_sec
+    )
+    return types.HttpOptions(
+        timeout=int(timeout_sec * 1000),
+        client_args={'limits': limits},
+        async_client_args={'limits': limits}
+    )
+
+
+class _Entry:
+    __slots__ = ('client', 'created_at', 'last_used', 'leases')
+
+    def __init__(self, client):
+        self.client = client
+        self.created_at = self.last_used = time.time()
+        self.leases = 0
+
+
+class ClientRegistry:
+    """One pooled client per API key, evicted after idle_ttl_sec without use or leases"""
+
+    def __init__(self, pool_size=10, timeout_sec=120, idle_ttl_sec=1800, keepalive_sec=60):
+        self.pool_size = pool_size
+        self.timeout_sec = timeout_sec
+        self.idle_ttl_sec = idle_ttl_sec
+        self.keepalive_sec = keepalive_sec
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            pool_size=settings.CLIENT_POOL_SIZE,
+            timeout_sec=settings.CLIENT_TIMEOUT_SEC,
+            idle_ttl_sec=settings.CLIENT_IDLE_TTL_SEC,
+            keepalive_sec=settings.CLIENT_KEEPALIVE_SEC
+        )
+
+    def get(self, api_key):
+        """Return the shared client for an API key, creating it on first use"""
+        key = hash_api_key(api_key)
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(key)
+            if entry is None:
+                from google import genai
+
+                client = genai.Client(
+                    api_key=api_key,
+                    http_options=http_options(self.pool_size, self.timeout_sec, self.keepalive_sec)
+                )
+                entry = self._entries[key] = _Entry(client)
+                self.created += 1
+            else:
+                self.reused += 1
+            entry.last_used = time.time()
+            return entry.client
+
+    def get_by_hash(self, key_hash):
+        """Return the live client of a hashed API key, or None; does not extend its life"""
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            return entry.client if entry is not None else None
+
+    def acquire(self, client):
+        """Take a lease on a client of this registry; it is not evicted until released"""
+        with self._lock:
+            entry = self._entry_of(client)
+            if entry is not None:
+                entry.leases += 1
+
+    def release(self, client):
+        """Give back a lease taken with acquire(); counts as a use of the client"""
+        with self._lock:
+            entry = self._entry_of(client)
+            if entry is not None:
+                entry.leases = max(entry.leases - 1, 0)
+                entry.last_used = time.time()
+
+    @contextmanager
+    def lease(self, client):
+        """Hold a lease on client for the duration of a block"""
+        self.acquire(client)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def discard(self, api_key):
+        """Close and forget the client of an API key, for example after it was rejected"""
+        with self._lock:
+            entry = self._entries.pop(hash_api_key(api_key), None)
+        if entry is not None:
+            _close(entry.client)
+
+    def check(self, api_key):
+        """Make one cheap authenticated call; return True if the client works"""
+        try:
+            next(iter(self.get(api_key).models.list(config={'page_size': 1})), None)
+            return True
+        except Exception:
+            return False
+
+    def stats(self):
+        """Counts for health reporting; no key material"""
+        with self._lock:
+            self._evict_idle()
+            return {
+                'clients': len(self._entries),
+                'leased': sum(1 for e in self._entries.values() if e.leases),
+                'created': self.created,
+                'reused': self.reused,
+                'pool_size': self.pool_size,
+            }
+
+    def _entry_of(self, client):
+        return next((e for e in self._entries.values() if e.client is client), None)
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.idle_ttl_sec
+        for key in [k for k, e in self._entries.items() if not e.leases and e.last_used < cutoff]:
+            _close(self._entries.pop(key).client)
+
+
+def _close(client):
+    try:
+        client.close()
+    except Exception:
+        pass
@@ -0,0 +1,32 @@
+"""Small helpers for the SQLite databases kept under the data directory"""
+import sqlite3
+from pathlib import Path
+
+
+def transaction(db_path):
+    """Open a short-lived connection that runs one write transaction
+
+    A connection per call keeps the databases safe to share between
+    Streamlit script threads and between processes.
+    """
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    return _Transaction(conn)
+
+
+class _Transaction:
+    """Context manager running a connection's statements in one write transaction"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.conn.close()
@@ -0,0 +1,377 @@
+"""Gemini API helpers for File Search Stores and answer generation
+
+``google.genai.types`` is the slowest import of the app, so the helpers that
+build SDK config objects import it when first called.
+"""
+import asyncio
+import random
+import string
+import time
+
+from . import settings
+from .metrics import REGISTRY, record_span, record_usage, span, timed
+from .report import report_error, report_warning
+from .text import get_text
+
+# Display name prefix of every File Search Store this app creates
+STORE_NAME_PREFIX = 'pdf-chat-store-'
+
+
+def generate_random_id(length=8):
+    """Generate a random ID for store naming"""
+    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
+
+
+def wait_operation(client, op, sleep_sec=None, max_wait_sec=300, max_sleep_sec=None, backoff=None):
+    """Wait for Operations API to complete with timeout
+
+    Polls with exponential backoff and jitter: each wait is drawn between half
+    and all of the current delay, which grows by ``backoff`` up to
+    ``max_sleep_sec``. Defaults come from the PDF_CHAT_POLL_* settings.
+    """
+    delay = sleep_sec if sleep_sec is not None else settings.POLL_INITIAL_SEC
+    max_sleep_sec = max_sleep_sec if max_sleep_sec is not None else settings.POLL_MAX_SEC
+    backoff = backoff if backoff is not None else settings.POLL_BACKOFF
+    start = time.time()
+    with span('wait_operation'):
+        while not op.done:
+            remaining = max_wait_sec - (time.time() - start)
+            if remaining <= 0:
+                raise TimeoutError("Operation timed out.")
+            time.sleep(min(random.uniform(delay / 2, delay), remaining))
+            delay = min(delay * backoff, max_sleep_sec)
+            op = client.operations.get(op)
+            REGISTRY.inc('pdfchat_operation_polls_total')
+    return op
+
+
+@timed('create_store')
+def create_file_search_store(client, store_name):
+    """Create a new File Search Store"""
+    try:
+        store = client.file_search_stores.create(
+            config={'display_name': store_name}
+        )
+        return store
+    except Exception as e:
+        report_error(get_text('error_create_store').format(e))
+        return None
+
+
+def is_not_found(error):
+    """Whether an API error says the requested resource does not exist"""
+    message = str(error)
+    return '404' in message or 'NOT_FOUND' in message
+
+
+def store_exists(client, store_name):
+    """Check that a File Search Store still exists remotely
+
+    Only a not-found error means it does not; any other error (timeout, rate
+    limit, authentication) says nothing about the store and is raised.
+    """
+    try:
+        client.file_search_stores.get(name=store_name)
+        return True
+    except Exception as e:
+        if is_not_found(e):
+            return False
+        raise
+
+
+@timed('upload')
+def upload_file_to_store(client, file_path, store_name, display_name, chunking_config=None, progress=None,
+                         metadata=None):
+    """Upload file to File Search Store
+
+    ``progress(stage)`` is called with 'indexing' once the upload is accepted
+    and the service starts indexing. ``metadata`` entries are added to the
+    document's custom metadata. Oversized PDFs are split into parts before
+    they get here (see FileSearchBackend).
+    """
+    try:
+        upload_config = {
+            'display_name': display_name,
+            'custom_metadata': [
+                {"key": "source", "string_value": "streamlit_upload"},
+                {"key": "timestamp", "numeric_value": int(time.time())}
+            ] + list(metadata or [])
+        }
+        if chunking_config:
+            upload_config['chunking_config'] = chunking_config
+
+        upload_op = client.file_search_stores.upload_to_file_search_store(
+            file=file_path,
+            file_search_store_name=store_name,
+            config=upload_config
+        )
+        if progress:
+            progress('indexing')
+        upload_op = wait_operation(client, upload_op, max_wait_sec=600)  # Increase timeout for large files
+        return upload_op.response
+    except TimeoutError as e:
+        report_error("⏱️ Upload timed out. Large PDFs upload faster in smaller parts; lower PDF_CHAT_UPLOAD_PART_MB.")
+        return None
+    except Exception as e:
+        error_msg = str(e)
+        if "400" in error_msg or "bad request" in error_msg.lower():
+            report_error(f"❌ Bad Request: The file may be too large or in an unsupported format. Error: {e}")
+        elif "413" in error_msg or "too large" in error_msg.lower():
+            report_error(f"📦 File too large: lower PDF_CHAT_UPLOAD_PART_MB to upload it in smaller parts. Error: {e}")
+        else:
+            report_error(get_text('error_upload_store').format(e))
+        return None
+
+
+@timed('create_cache')
+def create_context_cache(client, model, contents, system_instruction, ttl_sec, display_name):
+    """Upload document text once into an explicit cached context with a TTL"""
+    from google.genai import types
+
+    try:
+        return client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=display_name,
+                system_instruction=system_instruction,
+                contents=[contents],
+                ttl=f'{int(ttl_sec)}s'
+            )
+        )
+    except Exception as e:
+        report_error(get_text('error_create_cache').format(e))
+        return None
+
+
+def context_cache_exists(client, cache_name):
+    """Check that a cached context has not expired or been deleted
+
+    Like store_exists, errors other than not-found are raised.
+    """
+    try:
+        client.caches.get(name=cache_name)
+        return True
+    except Exception as e:
+        if is_not_found(e):
+            return False
+        raise
+
+
+def extend_context_cache(client, cache_name, ttl_sec):
+    """Push a cached context's expiry ttl_sec into the future; True on success"""
+    from google.genai import types
+
+    try:
+        client.caches.update(name=cache_name, config=types.UpdateCachedContentConfig(ttl=f'{int(ttl_sec)}s'))
+        return True
+    except Exception as e:
+        report_warning(get_text('error_extend_cache').format(e))
+        return False
+
+
+@timed('delete_cache')
+def delete_context_cache(client, cache_name):
+    """Delete a cached context before its TTL runs out"""
+    try:
+        client.caches.delete(name=cache_name)
+        return True
+    except Exception as e:
+        report_error(get_text('error_cleanup').format(e))
+        return False
+
+
+def cached_context_config(cache_name):
+    """Build the generation config that answers against a cached context"""
+    from google.genai import types
+
+    return types.GenerateContentConfig(cached_content=cache_name)
+
+
+def file_search_config(store_name):
+    """Build the generation config that grounds answers in a File Search Store"""
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        tools=[
+            types.Tool(
+                file_search=types.FileSearch(
+                    file_search_store_names=[store_name]
+                )
+            )
+        ]
+    )
+
+
+def query_model(client, model, contents, config=None):
+    """Generate a complete answer in a single blocking call"""
+    attempt = 0
+    while True:
+        try:
+            with span('query', model=model):
+                response = client.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=config
+                )
+            record_usage(model, getattr(response, 'usage_metadata', None))
+            return response
+        except Exception as e:
+            if not _retry_rate_limited(e, attempt, model):
+                report_error(_query_error(e))
+                return None
+            attempt += 1
+
+
+def stream_model(client, model, contents, config, answer):
+    """Yield answer text chunks as they arrive
+
+    Fills ``answer`` with the full text, the grounding metadata (sent with the
+    final chunks), time to first token and total latency in seconds, the
+    token usage reported with the last chunk, and the error shown if the call
+    failed (None otherwise).
+    """
+    stream = _StreamState(model, answer)
+    attempt = 0
+    try:
+        while True:
+            try:
+                for chunk in client.models.generate_content_stream(
+                    model=model,
+                    contents=contents,
+                    config=config
+                ):
+                    text = stream.add(chunk)
+                    if text:
+                        yield text
+                break
+            except Exception as e:
+                # Only retry while nothing has been shown yet
+                if stream.parts or not _retry_rate_limited(e, attempt, model):
+                    raise
+                attempt += 1
+    except Exception as e:
+        answer['error'] = _query_error(e)
+        report_error(answer['error'])
+    finally:
+        stream.finish()
+
+
+async def astream_model(client, model, contents, config, answer):
+    """Asynchronous stream_model on the SDK's asyncio client (``client.aio``)
+
+    Waiting for the model holds a coroutine instead of a thread, so one event
+    loop can serve many concurrent answers.
+    """
+    stream = _StreamState(model, answer)
+    attempt = 0
+    try:
+        while True:
+            try:
+                async for chunk in await client.aio.models.generate_content_stream(
+                    model=model,
+                    contents=contents,
+                    config=config
+                ):
+                    text = stream.add(chunk)
+                    if text:
+                        yield text
+                break
+            except Exception as e:
+                if stream.parts or not is_rate_limited(e) or attempt >= settings.RATE_LIMIT_RETRIES:
+                    raise
+                REGISTRY.inc('pdfchat_rate_limited_total', model=model)
+                await asyncio.sleep(rate_limit_backoff(attempt))
+                attempt += 1
+    except Exception as e:
+        answer['error'] = _query_error(e)
+        report_error(answer['error'])
+    finally:
+        stream.finish()
+
+
+def is_rate_limited(error):
+    """Whether an API error is a 429 / RESOURCE_EXHAUSTED rate limit"""
+    return getattr(error, 'code', None) == 429 or 'RESOURCE_EXHAUSTED' in str(error)
+
+
+def rate_limit_backoff(attempt):
+    """Jittered exponential delay before retry number ``attempt`` (from 0)"""
+    delay = min(settings.RATE_LIMIT_BACKOFF_SEC * 2 ** attempt, settings.RATE_LIMIT_BACKOFF_MAX_SEC)
+    return random.uniform(0.5, 1.0) * delay
+
+
+def _retry_rate_limited(error, attempt, model):
+    """Sleep before retrying a rate-limited call; False if it should not be retried"""
+    if not is_rate_limited(error) or attempt >= settings.RATE_LIMIT_RETRIES:
+        return False
+    REGISTRY.inc('pdfchat_rate_limited_total', model=model)
+    time.sleep(rate_limit_backoff(attempt))
+    return True
+
+
+def _query_error(error):
+    if is_rate_limited(error):
+        return get_text('error_rate_limited')
+    return get_text('error_query').format(error)
+
+
+class _StreamState:
+    """Accumulates the chunks of one streamed answer into its answer dict"""
+
+    def __init__(self, model, answer):
+        self.model = model
+        self.answer = answer
+        self.parts = []
+        self.usage_metadata = None
+        self.start = time.perf_counter()
+        answer.update({
+            'text': '', 'grounding_metadata': None, 'ttft': None, 'latency': None, 'usage': None, 'error': None
+        })
+
+    def add(self, chunk):
+        """Absorb one chunk and return its text, if any"""
+        try:
+            gm = chunk.candidates[0].grounding_metadata
+            if gm:
+                self.answer['grounding_metadata'] = gm
+        except (IndexError, TypeError, AttributeError):
+            pass
+        self.usage_metadata = getattr(chunk, 'usage_metadata', None) or self.usage_metadata
+        if chunk.text:
+            if self.answer['ttft'] is None:
+                self.answer['ttft'] = time.perf_counter() - self.start
+            self.parts.append(chunk.text)
+        return chunk.text
+
+    def finish(self):
+        answer = self.answer
+        answer['text'] = ''.join(self.parts)
+        answer['latency'] = time.perf_counter() - self.start
+        record_span('query', answer['latency'], model=self.model)
+        if answer['ttft'] is not None:
+            REGISTRY.observe('pdfchat_time_to_first_token_seconds', answer['ttft'], model=self.model)
+        answer['usage'] = record_usage(self.model, self.usage_metadata)
+
+
+def query_file_search(client, question, store_name, model):
+    """Query the File Search Store with a question"""
+    return query_model(client, model, question, file_search_config(store_name))
+
+
+def stream_file_search(client, question, store_name, model, answer):
+    """Stream the answer to a question from the File Search Store"""
+    return stream_model(client, model, question, file_search_config(store_name), answer)
+
+
+@timed('cleanup_store')
+def cleanup_store(client, store_name):
+    """Delete the File Search Store"""
+    try:
+        client.file_search_stores.delete(
+            name=store_name,
+            config={'force': True}
+        )
+        return True
+    except Exception as e:
+        report_error(get_text('error_cleanup').format(e))
+        return False
@@ -0,0 +1,148 @@
+"""Compact chat transcript that keeps only recent turns in memory
+
+Messages are small ``__slots__`` records with interned role strings. When a
+spill file is configured, older messages are appended to it as JSON lines and
+dropped from memory; a byte offset per spilled message lets the UI page them
+back in on demand. The page only ever reads the window it renders, so rerun
+time does not grow with the length of the conversation.
+"""
+import json
+import os
+import sys
+import time
+from array import array
+from pathlib import Path
+
+# Spill files of abandoned sessions are removed after this
+SPILL_RETENTION_SEC = 24 * 3600
+
+
+class ChatMessage:
+    """One chat message; assistant replies may carry timing, a cached flag and sources"""
+
+    __slots__ = ('role', 'content', 'ttft', 'latency', 'cached', 'sources')
+
+    def __init__(self, role, content, ttft=None, latency=None, cached=False, sources=None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.ttft = ttft
+        self.latency = latency
+        self.cached = cached
+        self.sources = sources
+
+    def get(self, key, default=None):
+        """Dict-style access to a field, for code written against message dicts"""
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def to_dict(self):
+        """Plain dict with the fields that are set, as stored in exports"""
+        data = {'role': self.role, 'content': self.content}
+        if self.cached:
+            data['cached'] = True
+        elif self.latency is not None:
+            data['ttft'] = self.ttft
+            data['latency'] = self.latency
+        if self.sources:
+            data['sources'] = self.sources
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['role'], data['content'], data.get('ttft'), data.get('latency'), data.get('cached', False),
+            data.get('sources')
+        )
+
+
+class ChatHistory:
+    """Append-only message list with the oldest messages optionally on disk
+
+    With a ``spill_path``, once more than ``keep_in_memory`` messages are held
+    the older half is appended to that file. Indexing, slicing and iteration
+    cover spilled and in-memory messages alike.
+    """
+
+    def __init__(self, spill_path=None, keep_in_memory=200):
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.keep_in_memory = max(keep_in_memory, 2)
+        self._recent = []
+        self._offsets = array('q')
+
+    def __len__(self):
+        return len(self._offsets) + len(self._recent)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('chat history index out of range')
+        return self.slice(index, index + 1)[0]
+
+    def __iter__(self):
+        if self._offsets:
+            with open(self.spill_path, 'rb') as f:
+                for _ in range(len(self._offsets)):
+                    yield ChatMessage.from_dict(json.loads(f.readline()))
+        yield from self._recent
+
+    def append(self, role, content, **fields):
+        """Add a message; spill older ones if the in-memory part grew too large"""
+        self._recent.append(ChatMessage(role, content, **fields))
+        if self.spill_path and len(self._recent) > self.keep_in_memory:
+            self._spill(len(self._recent) - self.keep_in_memory // 2)
+
+    def slice(self, start, stop):
+        """Messages[start:stop], reading only the spilled lines in that range"""
+        spilled = len(self._offsets)
+        start, stop = max(start, 0), min(stop, len(self))
+        messages = []
+        if start < spilled:
+            with open(self.spill_path, 'rb') as f:
+                f.seek(self._offsets[start])
+                for _ in range(min(stop, spilled) - start):
+                    messages.append(ChatMessage.from_dict(json.loads(f.readline())))
+        messages.extend(self._recent[max(start - spilled, 0):max(stop - spilled, 0)])
+        return messages
+
+    def to_dicts(self):
+        return [message.to_dict() for message in self]
+
+    def clear(self):
+        """Forget every message and remove the spill file"""
+        self._recent = []
+        self._offsets = array('q')
+        if self.spill_path:
+            try:
+                self.spill_path.unlink()
+            except OSError:
+                pass
+
+    def _spill(self, count):
+        if not self._offsets:
+            _prune_spill_files(self.spill_path.parent)
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, 'ab') as f:
+            offset = f.tell()
+            for message in self._recent[:count]:
+                line = (json.dumps(message.to_dict()) + '\n').encode('utf-8')
+                self._offsets.append(offset)
+                f.write(line)
+                offset += len(line)
+        del self._recent[:count]
+
+
+def _prune_spill_files(directory):
+    """Remove spill files left behind by sessions that ended without clearing"""
+    if not directory.is_dir():
+        return
+    cutoff = time.time() - SPILL_RETENTION_SEC
+    for path in directory.glob('*.jsonl'):
+        try:
+            if path.stat().st_mtime < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
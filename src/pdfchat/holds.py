@@ -0,0 +1,81 @@
+"""Which owners hold references to which collections
+
+A reference a backend counts for a collection is only released on behalf of
+the owner (UI session or API caller, with a hash of its API key) whose
+ingestion acquired it. Releasing a collection you never acquired, or more
+often than you acquired it, is then a no-op instead of taking a reference
+that another owner still relies on.
+"""
+import time
+from pathlib import Path
+
+from .db import transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS collection_holds (
+    handle TEXT NOT NULL,
+    owner_session TEXT NOT NULL,
+    key_hash TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    acquired_at REAL NOT NULL,
+    PRIMARY KEY (handle, owner_session, key_hash)
+)
+"""
+
+
+class HoldRegistry:
+    """SQLite-backed count of the references each owner holds per collection"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    def _connect(self):
+        return transaction(self.db_path)
+
+    def add(self, handle, owner):
+        """Record one more reference to handle held by owner (a lifecycle.Owner)"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO collection_holds VALUES (?, ?, ?, 1, ?) '
+                'ON CONFLICT (handle, owner_session, key_hash) DO UPDATE SET count = count + 1',
+                (handle, owner.session or '', owner.key_hash or '', time.time())
+            )
+
+    def remove(self, handle, owner):
+        """Give back one of owner's references; False if it holds none"""
+        key = (handle, owner.session or '', owner.key_hash or '')
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT count FROM collection_holds WHERE handle = ? AND owner_session = ? AND key_hash = ?', key
+            ).fetchone()
+            if row is None:
+                return False
+            if row[0] > 1:
+                conn.execute(
+                    'UPDATE collection_holds SET count = count - 1 '
+                    'WHERE handle = ? AND owner_session = ? AND key_hash = ?', key
+                )
+            else:
+                conn.execute(
+                    'DELETE FROM collection_holds WHERE handle = ? AND owner_session = ? AND key_hash = ?', key
+                )
+            return True
+
+    def transfer(self, owner, new_owner):
+        """Hand every reference owner holds to new_owner, e.g. when a session moves to a new token"""
+        old = (owner.session or '', owner.key_hash or '')
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO collection_holds SELECT handle, ?, ?, count, acquired_at FROM collection_holds '
+                'WHERE owner_session = ? AND key_hash = ? '
+                'ON CONFLICT (handle, owner_session, key_hash) DO UPDATE SET count = count + excluded.count',
+                (new_owner.session or '', new_owner.key_hash or '') + old
+            )
+            conn.execute('DELETE FROM collection_holds WHERE owner_session = ? AND key_hash = ?', old)
+
+    def forget(self, handle):
+        """Drop every hold on a collection that no longer exists"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM collection_holds WHERE handle = ?', (handle,))
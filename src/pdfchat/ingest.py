@@ -0,0 +1,50 @@
+"""Document ingestion pipeline: extract text, then index with a backend"""
+import os
+
+from .pdf import count_pages_from_pdf, extract_pages_from_pdf
+from .retrieval import Document
+
+# Ingestion stages in order, used for progress reporting
+STAGES = ['queued', 'extracting', 'caching', 'creating_store', 'uploading', 'indexing']
+
+
+def ingest_documents(job, client, backend, files, model, extract_workers=0, owner=None):
+    """Ingest a collection of PDFs into one index as a background job
+
+    ``files`` is a list of (name, path) pairs of spooled uploads; the job owns
+    the files and deletes them when it ends. Returns a dict with the backend
+    name and handle, whether an existing index was reused, per-document details
+    and the names of documents that failed, or None if nothing could be indexed.
+    """
+    try:
+        job.set_stage('extracting')
+        documents = []
+        for name, path in files:
+            job.set_stage('extracting', name)
+            if backend.needs_text:
+                pages = extract_pages_from_pdf(path, extract_workers)
+                page_count = len(pages) if pages else 0
+            else:
+                pages = None
+                page_count = count_pages_from_pdf(path)
+            documents.append((Document(name, path, os.path.getsize(path), pages), page_count))
+
+        result = backend.ingest(client, [d for d, _ in documents], model, job.set_stage, owner)
+    finally:
+        for _, path in files:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    if not result:
+        return None
+    return {
+        'backend': backend.name,
+        'handle': result.handle,
+        'reused': result.reused,
+        'failed': result.failed,
+        'documents': [
+            {'name': d.name, 'pages': page_count, 'size': d.size}
+            for d, page_count in documents if d.name not in result.failed
+        ]
+    }
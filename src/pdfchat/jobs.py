@@ -0,0 +1,95 @@
+"""Background jobs run on a worker pool shared by every session
+
+The Streamlit script submits a job, keeps only its ID in session state and
+checks the job's status on later reruns, so no script thread is held while a
+document is being indexed.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .report import capture_messages
+
+# Finished jobs nobody collected (for example, closed tabs) are dropped after this
+FINISHED_JOB_TTL_SEC = 3600
+
+
+class Job:
+    """Progress, messages and outcome of one background job"""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'running'
+        self.stage = 'queued'
+        self.stage_times = {}
+        self.items = {}
+        self.messages = []
+        self.result = None
+        self.started_at = time.time()
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status != 'running'
+
+    def set_stage(self, stage, item=None):
+        """Record that the job, or one named item of it, entered a new stage"""
+        if item is not None:
+            self.items[item] = stage
+            return
+        self.stage = stage
+        self.stage_times[stage] = time.time() - self.started_at
+
+    def add_message(self, level, message):
+        """Keep a message reported while the job ran"""
+        self.messages.append((level, message))
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and tracks them by ID"""
+
+    def __init__(self, max_workers):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pdfchat-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(job, *args, **kwargs) in the background and return the job ID
+
+        The function's return value becomes job.result; a falsy result or an
+        exception marks the job as failed.
+        """
+        job = Job(uuid.uuid4().hex)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        # finished_at is set before status, which readers poll to see the end
+        try:
+            with capture_messages(job.add_message):
+                job.result = fn(job, *args, **kwargs)
+            status = 'done' if job.result else 'failed'
+        except Exception as e:
+            job.add_message('error', str(e))
+            status = 'failed'
+        job.finished_at = time.time()
+        job.status = status
+
+    def get(self, job_id):
+        """Return the job with this ID, or None if unknown"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pop(self, job_id):
+        """Stop tracking a job once its outcome has been collected"""
+        with self._lock:
+            return self._jobs.pop(job_id, None)
+
+    def _prune(self):
+        cutoff = time.time() - FINISHED_JOB_TTL_SEC
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
@@ -0,0 +1,317 @@
+"""Lifecycle registry and garbage collector for File Search Stores
+
+Every store the app creates is recorded with its owning session, a hash of the
+API key it was created with, its state and when it was last used. Stores are
+otherwise only deleted by "Clear Document & Start Over", so closed tabs,
+crashed uploads and restarts would leak them. A StoreReaper periodically
+deletes stores that were not used for ``ttl_sec``, that failed, or that have
+been stuck creating/uploading for ``stuck_sec``. An expired store that a
+session still references in the store index is kept and its TTL restarts.
+
+Deleting a store needs a client for the API key that owns it. API keys are
+never written to disk, so the background reaper can only remove stores whose
+owner still has a client in the process (``client_lookup(key_hash)``); the
+command line mode uses GEMINI_API_KEY and also finds untracked remote stores:
+
+    cd src && python -m pdfchat.lifecycle --dry-run
+"""
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+from . import settings
+from .db import transaction
+from .gemini import STORE_NAME_PREFIX, is_not_found
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Who created a store: the UI session (or API caller) and a hash of its API key
+Owner = namedtuple('Owner', ['session', 'key_hash'])
+
+# One store the reaper would remove, and why
+Candidate = namedtuple('Candidate', ['store_name', 'display_name', 'state', 'reason', 'idle_sec', 'key_hash'])
+
+CREATING, UPLOADING, READY, FAILED, DELETED = 'creating', 'uploading', 'ready', 'failed', 'deleted'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS store_lifecycle (
+    store_name TEXT PRIMARY KEY,
+    display_name TEXT,
+    owner_session TEXT,
+    key_hash TEXT,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access_at REAL NOT NULL,
+    delete_attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+)
+"""
+
+# Deleted rows are kept this long for reports, then purged
+DELETED_RETENTION_SEC = 7 * 24 * 3600
+# Reaper runs that may fail to delete a store before it is left alone
+MAX_DELETE_ATTEMPTS = 10
+
+
+class StoreRegistry:
+    """SQLite-backed record of every store created, with state and last access"""
+
+    def __init__(self, db_path, touch_interval_sec=60):
+        self.db_path = Path(db_path)
+        self.touch_interval_sec = touch_interval_sec
+        self._touched = {}
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    def _connect(self):
+        return transaction(self.db_path)
+
+    def record(self, store_name, display_name, owner=None, state=CREATING):
+        """Start tracking a store as soon as it exists remotely"""
+        now = time.time()
+        owner = owner or Owner(None, None)
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO store_lifecycle VALUES (?, ?, ?, ?, ?, ?, ?, 0, NULL)',
+                (store_name, display_name, owner.session, owner.key_hash, state, now, now)
+            )
+
+    def set_state(self, store_name, state, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE store_lifecycle SET state = ?, last_access_at = ?, last_error = ? WHERE store_name = ?',
+                (state, time.time(), error, store_name)
+            )
+
+    def touch(self, store_name, force=False):
+        """Record a use of a store; writes at most once per touch_interval_sec unless forced"""
+        now = time.time()
+        if not force and now - self._touched.get(store_name, 0) < self.touch_interval_sec:
+            return
+        self._touched[store_name] = now
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE store_lifecycle SET last_access_at = ? WHERE store_name = ? AND state != ?',
+                (now, store_name, DELETED)
+            )
+
+    def candidates(self, ttl_sec, stuck_sec, limit=None):
+        """Stores due for deletion, oldest access first"""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT store_name, display_name, state, last_access_at, key_hash FROM store_lifecycle '
+                'WHERE delete_attempts < ? AND (state = ? OR (state = ? AND last_access_at < ?) '
+                'OR (state IN (?, ?) AND last_access_at < ?)) '
+                'ORDER BY last_access_at LIMIT ?',
+                (MAX_DELETE_ATTEMPTS, FAILED, READY, now - ttl_sec, CREATING, UPLOADING, now - stuck_sec, limit or -1)
+            ).fetchall()
+        reasons = {FAILED: 'failed', READY: 'expired', CREATING: 'stuck', UPLOADING: 'stuck'}
+        return [
+            Candidate(name, display_name, state, reasons[state], now - last_access, key_hash)
+            for name, display_name, state, last_access, key_hash in rows
+        ]
+
+    def mark_delete_failed(self, store_name, error):
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE store_lifecycle SET state = ?, delete_attempts = delete_attempts + 1, last_error = ? '
+                'WHERE store_name = ?',
+                (FAILED, str(error), store_name)
+            )
+
+    def known_names(self):
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute('SELECT store_name FROM store_lifecycle')}
+
+    def purge_deleted(self, older_than_sec=DELETED_RETENTION_SEC):
+        with self._connect() as conn:
+            conn.execute(
+                'DELETE FROM store_lifecycle WHERE state = ? AND last_access_at < ?',
+                (DELETED, time.time() - older_than_sec)
+            )
+
+
+class StoreReaper:
+    """Deletes expired, failed and stuck stores in batches on a background thread
+
+    ``client_lookup(key_hash)`` returns a client for the owning API key or None;
+    stores without an available client are left for a later run.
+    ``references(store_name)`` counts the sessions still holding a store;
+    expired stores with references are kept and their TTL restarts.
+    ``on_deleted(store_name)`` lets callers drop index and cache entries, and
+    ``lease(client)`` is a context manager keeping the client alive meanwhile.
+    """
+
+    def __init__(self, registry, client_lookup, ttl_sec, stuck_sec, concurrency=4,
+                 batch_size=50, retries=3, on_deleted=None, lease=None, references=None):
+        self.registry = registry
+        self.client_lookup = client_lookup
+        self.ttl_sec = ttl_sec
+        self.stuck_sec = stuck_sec
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.retries = retries
+        self.on_deleted = on_deleted
+        self.lease = lease or nullcontext
+        self.references = references
+        self._stop = threading.Event()
+        self._thread = None
+
+    def plan(self):
+        """Candidates of the next run, each with whether a client can delete it"""
+        return [
+            (candidate, self.client_lookup(candidate.key_hash) is not None)
+            for candidate in self.registry.candidates(self.ttl_sec, self.stuck_sec, self.batch_size)
+        ]
+
+    def in_use(self, candidate):
+        """Whether an expired store is still referenced by a session"""
+        return candidate.state == READY and self.references is not None and self.references(candidate.store_name) > 0
+
+    def run_once(self, dry_run=False):
+        """Delete one batch; return {'deleted': [...], 'failed': [...], 'skipped': [...]}"""
+        report = {'deleted': [], 'failed': [], 'skipped': []}
+        work = []
+        for candidate, deletable in self.plan():
+            if self.in_use(candidate):
+                # The shared index outranks this process's throttled touches
+                if not dry_run:
+                    self.registry.touch(candidate.store_name, force=True)
+                report['skipped'].append(candidate.store_name)
+            elif not deletable:
+                report['skipped'].append(candidate.store_name)
+            elif dry_run:
+                report['deleted'].append(candidate.store_name)
+            else:
+                work.append(candidate)
+        if work:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='pdfchat-reaper') as pool:
+                outcomes = list(pool.map(self._delete, work))
+            for candidate, ok in zip(work, outcomes):
+                report['deleted' if ok else 'failed'].append(candidate.store_name)
+        if not dry_run:
+            self.registry.purge_deleted()
+            REGISTRY.inc('pdfchat_reaper_deleted_total', len(report['deleted']))
+            REGISTRY.inc('pdfchat_reaper_failed_total', len(report['failed']))
+        return report
+
+    def _delete(self, candidate):
+        """Delete one store with retries and jittered backoff; True on success"""
+        client = self.client_lookup(candidate.key_hash)
+        error = None
+        with self.lease(client):
+            for attempt in range(self.retries):
+                try:
+                    client.file_search_stores.delete(name=candidate.store_name, config={'force': True})
+                    error = None
+                    break
+                except Exception as e:
+                    if is_not_found(e):
+                        error = None
+                        break
+                    error = e
+                    if attempt + 1 < self.retries:
+                        time.sleep(random.uniform(0.5, 1.0) * 2 ** attempt)
+        if error is not None:
+            self.registry.mark_delete_failed(candidate.store_name, error)
+            return False
+        self.registry.set_state(candidate.store_name, DELETED)
+        if self.on_deleted:
+            self.on_deleted(candidate.store_name)
+        return True
+
+    def start(self, interval_sec):
+        """Run a batch every interval_sec on a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._loop, args=(interval_sec,), name='pdfchat-reaper', daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, interval_sec):
+        while not self._stop.wait(interval_sec):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Store reaper run failed')
+
+
+def find_untracked(client, registry, prefix=STORE_NAME_PREFIX):
+    """Remote stores named like ours that the registry has never seen"""
+    known = registry.known_names()
+    return [
+        store for store in client.file_search_stores.list()
+        if (getattr(store, 'display_name', None) or '').startswith(prefix) and store.name not in known
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report or delete orphaned File Search Stores')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be removed')
+    parser.add_argument('--include-untracked', action='store_true',
+                        help='also delete remote pdf-chat stores missing from the registry')
+    args = parser.parse_args()
+
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        parser.error('GEMINI_API_KEY must be set')
+
+    from google import genai
+
+    from .clients import hash_api_key
+    from .store_index import StoreIndex
+
+    client = genai.Client(api_key=api_key)
+    key_hash = hash_api_key(api_key)
+    registry = StoreRegistry(settings.STORE_INDEX_PATH)
+    store_index = StoreIndex(settings.STORE_INDEX_PATH)
+    reaper = StoreReaper(
+        registry,
+        lambda owner_hash: client if owner_hash in (key_hash, None) else None,
+        settings.STORE_TTL_SEC,
+        settings.STORE_STUCK_SEC,
+        settings.REAPER_CONCURRENCY,
+        batch_size=None,
+        retries=settings.REAPER_RETRIES,
+        on_deleted=store_index.forget,
+        references=store_index.references
+    )
+
+    plan = reaper.plan()
+    untracked = find_untracked(client, registry)
+    print(f"{'store':50s} {'state':10s} {'reason':10s} {'idle':>10s}  action")
+    for candidate, deletable in plan:
+        if reaper.in_use(candidate):
+            action = 'keep (in use)'
+        else:
+            action = 'delete' if deletable else 'skip (other API key)'
+        print(f"{candidate.store_name:50s} {candidate.state:10s} {candidate.reason:10s} "
+              f"{candidate.idle_sec / 3600:9.1f}h  {action}")
+    for store in untracked:
+        action = 'delete' if args.include_untracked else 'report only'
+        print(f"{store.name:50s} {'-':10s} {'untracked':10s} {'-':>10s}  {action}")
+    if args.dry_run:
+        return
+
+    if args.include_untracked:
+        for store in untracked:
+            registry.record(store.name, store.display_name, state=FAILED)
+    report = reaper.run_once()
+    print(f"deleted {len(report['deleted'])}, failed {len(report['failed'])}, skipped {len(report['skipped'])}")
+
+
+if __name__ == '__main__':
+    main()
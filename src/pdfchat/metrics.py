@@ -0,0 +1,229 @@
+"""Per-stage timing spans, token counters and their exporters
+
+Helpers wrap their work in ``span('stage')`` (or the ``timed`` decorator).
+Every span is recorded in a process-wide registry, exported in Prometheus text
+format by ``start_metrics_server`` and optionally appended to a JSON-lines log.
+Histograms also keep a window of recent samples for p50/p95/p99.
+"""
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+QUANTILES = (0.5, 0.95, 0.99)
+# Recent samples kept per series for quantiles
+WINDOW = 1024
+
+
+class Histogram:
+    """Cumulative bucket counts plus a window of recent samples"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=WINDOW)
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantiles(self):
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {}
+        return {q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] for q in QUANTILES}
+
+
+class Registry:
+    """Thread-safe store of histograms, counters and gauges keyed by name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.log_path = None
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.histograms.setdefault(key, Histogram()).observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """Set a gauge to its current value"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def log(self, record):
+        """Append one record to the JSON-lines log, if configured"""
+        if not self.log_path:
+            return
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.log_path, 'a') as f:
+                f.write(line + '\n')
+
+    def to_prometheus(self):
+        """Render all series in Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        seen = set()
+        for (name, labels), hist in histograms:
+            if name not in seen:
+                lines.append(f'# TYPE {name} histogram')
+                seen.add(name)
+            for bound, count in zip(BUCKETS, hist.counts):
+                lines.append(f'{name}_bucket{_labels(labels, le=bound)} {count}')
+            lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {hist.count}')
+            lines.append(f'{name}_sum{_labels(labels)} {hist.sum}')
+            lines.append(f'{name}_count{_labels(labels)} {hist.count}')
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f'# TYPE {name} counter')
+                seen.add(name)
+            lines.append(f'{name}{_labels(labels)} {value}')
+        for (name, labels), value in gauges:
+            if name not in seen:
+                lines.append(f'# TYPE {name} gauge')
+                seen.add(name)
+            lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """JSON-friendly view with count, sum and quantiles of each series"""
+        with self._lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+            gauges = list(self.gauges.items())
+        return {
+            'histograms': [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': hist.count,
+                    'sum': hist.sum,
+                    'quantiles': {str(q): v for q, v in hist.quantiles().items()},
+                }
+                for (name, labels), hist in histograms
+            ],
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in counters
+            ],
+            'gauges': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in gauges
+            ],
+        }
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time a block as one stage and record it, even if it raises"""
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - start, status, **labels)
+
+
+def record_span(stage, duration, status='ok', **labels):
+    """Record a stage duration measured elsewhere"""
+    REGISTRY.observe('pdfchat_stage_seconds', duration, stage=stage, **labels)
+    REGISTRY.log({'ts': time.time(), 'type': 'span', 'stage': stage,
+                  'duration': duration, 'status': status, **labels})
+
+
+def timed(stage):
+    """Decorator recording every call of a function as a span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def usage_counts(usage_metadata):
+    """Token counts of a response's usage_metadata as a dict, or None"""
+    if usage_metadata is None:
+        return None
+    return {
+        'prompt': getattr(usage_metadata, 'prompt_token_count', None) or 0,
+        'output': getattr(usage_metadata, 'candidates_token_count', None) or 0,
+        'cached': getattr(usage_metadata, 'cached_content_token_count', None) or 0,
+        'total': getattr(usage_metadata, 'total_token_count', None) or 0,
+    }
+
+
+def record_usage(model, usage_metadata):
+    """Count the tokens reported by a response; return them as a dict"""
+    usage = usage_counts(usage_metadata)
+    if usage is None:
+        return None
+    for kind, count in usage.items():
+        REGISTRY.inc('pdfchat_tokens_total', count, model=model, kind=kind)
+    REGISTRY.log({'ts': time.time(), 'type': 'usage', 'model': model, **usage})
+    return usage
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps(REGISTRY.snapshot()).encode('utf-8')
+            content_type = 'application/json'
+        elif self.path.startswith('/metrics'):
+            body = REGISTRY.to_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """Serve /metrics (Prometheus) and /metrics.json on a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='pdfchat-metrics', daemon=True).start()
+    return server
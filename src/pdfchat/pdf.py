@@ -0,0 +1,204 @@
+"""PDF reading and temporary file handling
+
+Uploads are spooled to a temporary file once, in fixed-size chunks, and every
+later step (page counting, extraction, splitting, hashing, upload) reads that
+file. Readers map the file into memory instead of loading it, so concurrent
+large uploads share the page cache rather than each holding private copies.
+PyPDF2 is imported on first use.
+"""
+import io
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .metrics import timed
+from .report import report_error
+from .text import get_text
+
+# Page ranges per worker in parallel extraction; each range re-opens the PDF
+TASKS_PER_WORKER = 2
+
+# Bytes copied at a time when spooling an upload to disk
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+# A page range of a larger PDF written to its own file; 1-based, inclusive pages
+PdfPart = namedtuple('PdfPart', ['path', 'first_page', 'last_page'])
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def map_file(path):
+    """Read-only memory map of a file; it stays valid after the file is closed"""
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _reader(source):
+    """Open a PdfReader over a path, raw bytes or a file-like object
+
+    A path is memory-mapped; PdfReader would otherwise read it all into memory.
+    """
+    from PyPDF2 import PdfReader
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        source = map_file(source)
+    return PdfReader(source)
+
+
+def count_pdf_pages(source):
+    """Read the page count from the page tree without extracting any text"""
+    return len(_reader(source).pages)
+
+
+def iter_pdf_pages(source, start=0, stop=None):
+    """Lazily yield (page_number, text) for pages[start:stop], 1-based numbers"""
+    reader = _reader(source)
+    pages = reader.pages
+    stop = len(pages) if stop is None else min(stop, len(pages))
+    for index in range(start, stop):
+        text = pages[index].extract_text() or ""
+        # The reader keeps every object it resolved, images included; drop
+        # them so memory is bounded by one page rather than the whole file
+        reader.resolved_objects.clear()
+        yield index + 1, text
+
+
+def _extract_range(source, start, stop):
+    """Extract the text of one page range (runs in a worker process)"""
+    return [text for _, text in iter_pdf_pages(source, start, stop)]
+
+
+def _get_pool(workers):
+    """Shared process pool, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers avoid forking the multi-threaded server process
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def iter_pdf_pages_parallel(source, workers=None):
+    """Yield (page_number, text) in order, extracting page ranges across processes
+
+    ``source`` must be a path or bytes so it can be sent to the workers; a
+    file-like object is read into bytes first. The pool is sized by the first
+    call and shared by every session afterwards.
+    """
+    if hasattr(source, 'getvalue'):
+        source = source.getvalue()
+    elif hasattr(source, 'read'):
+        source = source.read()
+    workers = workers or os.cpu_count()
+    page_count = count_pdf_pages(source)
+    pool = _get_pool(workers)
+    pages_per_task = max(-(-page_count // (workers * TASKS_PER_WORKER)), 1)
+    ranges = [
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+    futures = [pool.submit(_extract_range, source, start, stop) for start, stop in ranges]
+    for (start, _), future in zip(ranges, futures):
+        for offset, text in enumerate(future.result()):
+            yield start + offset + 1, text
+
+
+def _write_pages(reader, start, stop):
+    """Write pages[start:stop] to a new temporary PDF; return its path"""
+    from PyPDF2 import PdfWriter
+
+    writer = PdfWriter()
+    for index in range(start, stop):
+        writer.add_page(reader.pages[index])
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+        writer.write(tmp_file)
+        return tmp_file.name
+
+
+def split_pdf(source, max_part_bytes):
+    """Yield PdfParts of consecutive pages, each written to at most max_part_bytes
+
+    Pages per part start from the document's average page size and shrink
+    whenever a written part comes out too large. A single page larger than
+    the limit becomes a part of its own. The caller deletes the part files.
+    """
+    reader = _reader(source)
+    page_count = len(reader.pages)
+    size = len(source) if isinstance(source, (bytes, bytearray, memoryview)) else os.path.getsize(source)
+    pages_per_part = max(int(page_count * max_part_bytes / max(size, 1) * 0.9), 1)
+    start = 0
+    while start < page_count:
+        count = min(pages_per_part, page_count - start)
+        while True:
+            path = _write_pages(reader, start, start + count)
+            part_size = os.path.getsize(path)
+            if part_size <= max_part_bytes or count == 1:
+                break
+            os.unlink(path)
+            count = max(min(int(count * max_part_bytes / part_size * 0.9), count - 1), 1)
+        yield PdfPart(path, start + 1, start + count)
+        start += count
+
+
+@timed('page_count')
+def count_pages_from_pdf(pdf_file):
+    """Get the page count of an uploaded PDF file without extracting text"""
+    try:
+        return count_pdf_pages(pdf_file)
+    except Exception as e:
+        report_error(get_text('error_pdf_extract').format(e))
+        return 0
+
+
+@timed('extract')
+def extract_pages_from_pdf(pdf_file, workers=0):
+    """Extract the text of each page of an uploaded PDF file
+
+    ``workers`` > 0 extracts page ranges in that many processes.
+    """
+    try:
+        if workers:
+            pages = iter_pdf_pages_parallel(pdf_file, workers)
+        else:
+            pages = iter_pdf_pages(pdf_file)
+        return [text for _, text in pages]
+    except Exception as e:
+        report_error(get_text('error_pdf_extract').format(e))
+        return None
+
+
+def extract_text_from_pdf(pdf_file, workers=0):
+    """Extract text content from uploaded PDF file"""
+    pages = extract_pages_from_pdf(pdf_file, workers)
+    if pages is None:
+        return None, 0
+    return "".join(page_text + "\n" for page_text in pages), len(pages)
+
+
+@timed('save')
+def save_uploaded_file(uploaded_file):
+    """Save uploaded file to temporary location
+
+    The file is copied in SPOOL_CHUNK_BYTES chunks from its start, so no
+    extra in-memory copy of the whole upload is made. The caller deletes it.
+    """
+    try:
+        if hasattr(uploaded_file, 'seek'):
+            uploaded_file.seek(0)
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+            shutil.copyfileobj(uploaded_file, tmp_file, SPOOL_CHUNK_BYTES)
+            return tmp_file.name
+    except Exception as e:
+        report_error(get_text('error_save_file').format(e))
+        return None
@@ -0,0 +1,112 @@
+"""Speculative answers to the suggested questions of a new collection
+
+The suggested questions are the same for every document and are usually the
+first thing a user asks. As soon as a collection is ready, the Prefetcher
+answers them on a small background pool and the service stores the results in
+the answer cache, so clicking a suggestion is a cache hit, or follows the answer
+while it is still streaming. Work for a handle is cancelled when it is
+released: queued questions are dropped and streaming ones stop at the next
+chunk without caching anything.
+
+Metrics: ``pdfchat_prefetch_total{outcome}`` (answered, cached, cancelled,
+failed), ``pdfchat_prefetch_tokens_total`` (tokens spent on prefetching) and
+``pdfchat_prefetch_hits_total`` (prefetched answers later asked for).
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import REGISTRY
+
+# Prefetched answers remembered for hit counting; older ones are forgotten
+MAX_UNCLAIMED = 1000
+
+
+class _Batch:
+    """The prefetch work of one handle"""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.futures = {}
+
+
+class Prefetcher:
+    """Runs prefetch tasks per handle and counts how many answers get used"""
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pdfchat-prefetch')
+        self._lock = threading.Lock()
+        self._batches = {}
+        self._unclaimed = OrderedDict()
+
+    def start(self, handle, tasks):
+        """Run ``fn(cancelled)`` for every (key, fn) in tasks in the background
+
+        ``fn`` returns the token usage dict of a fresh answer, or None if the
+        answer was already cached. ``key`` identifies the answer for claim().
+        """
+        with self._lock:
+            self._prune()
+            batch = self._batches.setdefault(handle, _Batch())
+            for key, fn in tasks:
+                if key not in batch.futures:
+                    batch.futures[key] = self._executor.submit(self._run, handle, batch, key, fn)
+
+    def claim(self, key):
+        """Count a hit on a prefetched or still streaming answer (once per answer)"""
+        with self._lock:
+            handle = self._unclaimed.pop(key, None)
+        if handle is not None:
+            REGISTRY.inc('pdfchat_prefetch_hits_total')
+
+    def cancel(self, handle):
+        """Stop all prefetch work for a handle and forget its unclaimed answers"""
+        with self._lock:
+            batch = self._batches.pop(handle, None)
+            for key in [k for k, h in self._unclaimed.items() if h == handle]:
+                del self._unclaimed[key]
+        if batch is None:
+            return
+        batch.cancelled.set()
+        for future in batch.futures.values():
+            if future.cancel():
+                REGISTRY.inc('pdfchat_prefetch_total', outcome='cancelled')
+
+    def pending(self, handle):
+        """Number of prefetch tasks of a handle that have not finished"""
+        with self._lock:
+            batch = self._batches.get(handle)
+            return sum(not f.done() for f in batch.futures.values()) if batch else 0
+
+    def _prune(self):
+        for handle in [h for h, b in self._batches.items() if all(f.done() for f in b.futures.values())]:
+            del self._batches[handle]
+
+    def _run(self, handle, batch, key, fn):
+        if batch.cancelled.is_set():
+            outcome = 'cancelled'
+        else:
+            # Claimable while streaming, since a question can follow the answer
+            self._remember(handle, key)
+            try:
+                usage = fn(batch.cancelled)
+                if batch.cancelled.is_set():
+                    outcome = 'cancelled'
+                elif usage is None:
+                    outcome = 'cached'
+                else:
+                    outcome = 'answered'
+                if usage:
+                    REGISTRY.inc('pdfchat_prefetch_tokens_total', usage.get('total', 0))
+            except Exception:
+                outcome = 'failed'
+        REGISTRY.inc('pdfchat_prefetch_total', outcome=outcome)
+        if outcome != 'answered':
+            with self._lock:
+                self._unclaimed.pop(key, None)
+
+    def _remember(self, handle, key):
+        with self._lock:
+            self._unclaimed[key] = handle
+            while len(self._unclaimed) > MAX_UNCLAIMED:
+                self._unclaimed.popitem(last=False)
@@ -0,0 +1,57 @@
+"""Route user-facing messages to the page, or to whoever is capturing them
+
+Helpers report problems with report_error/report_warning instead of calling
+st.error directly, so the same code can run on a background thread where no
+Streamlit page is attached. The capture is held in a context variable, so it is
+per thread and also per asyncio task when helpers run inside the HTTP API.
+"""
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import streamlit as st
+
+_sink = ContextVar('pdfchat_message_sink', default=None)
+
+
+def _emit(level, message):
+    sink = _sink.get()
+    if sink is not None:
+        sink(level, message)
+    elif level == 'error':
+        st.error(message)
+    else:
+        st.warning(message)
+
+
+def report_error(message):
+    """Show an error on the page or pass it to the active capture"""
+    _emit('error', message)
+
+
+def report_warning(message):
+    """Show a warning on the page or pass it to the active capture"""
+    _emit('warning', message)
+
+
+def propagate_messages(fn):
+    """Wrap fn so it reports to this thread's capture when run on another thread"""
+    sink = _sink.get()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if sink is None:
+            return fn(*args, **kwargs)
+        with capture_messages(sink):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def capture_messages(sink):
+    """Send messages reported on this thread to sink(level, message)"""
+    token = _sink.set(sink)
+    try:
+        yield
+    finally:
+        _sink.reset(token)
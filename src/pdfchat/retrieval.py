@@ -0,0 +1,592 @@
+"""Pluggable retrieval backends that ground answers in an uploaded document
+
+A backend ingests a document once and returns a handle. For each question it
+builds the model request: a File Search tool pointing at a remote store, a
+prompt carrying the best matching passages retrieved locally, or the whole
+document held in a Gemini cached context.
+"""
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .bm25 import Bm25Index, chunk_pages
+from .gemini import (
+    STORE_NAME_PREFIX,
+    cached_context_config,
+    cleanup_store,
+    context_cache_exists,
+    create_context_cache,
+    create_file_search_store,
+    delete_context_cache,
+    extend_context_cache,
+    file_search_config,
+    generate_random_id,
+    store_exists,
+    upload_file_to_store,
+)
+from .lifecycle import DELETED, FAILED, READY, UPLOADING
+from .metrics import span
+from .pdf import PdfPart, count_pdf_pages, extract_pages_from_pdf, split_pdf
+from .report import capture_messages, propagate_messages, report_error, report_warning
+from .store_index import compute_collection_key
+from .text import get_text
+
+# An uploaded PDF: file name, path of its spooled copy, size in bytes and
+# extracted page text (None if not needed)
+Document = namedtuple('Document', ['name', 'path', 'size', 'pages'])
+
+# Result of ingestion: backend handle, whether existing work was reused and
+# the names of documents that could not be indexed
+IngestResult = namedtuple('IngestResult', ['handle', 'reused', 'failed'])
+
+# Arguments for generate_content plus locally known sources, if any, and the
+# model the request is bound to (cached contexts only work with their model)
+RetrievalRequest = namedtuple('RetrievalRequest', ['contents', 'config', 'sources', 'model'], defaults=[None])
+
+LOCAL_PROMPT = """Answer the question using only the document excerpts below.
+Cite the documents and page numbers you rely on, for example (report.pdf, p. 3). If the excerpts do not
+contain the answer, say so.
+
+{passages}
+
+Question: {question}"""
+
+DIRECT_INSTRUCTION = """Answer questions using only the documents provided.
+Cite the documents and page numbers you rely on, for example (report.pdf, p. 3). If the documents do not
+contain the answer, say so."""
+
+DIRECT_PROMPT = """{instruction}
+
+{documents}
+
+Question: {question}"""
+
+
+def format_document_context(documents):
+    """Full text of documents with a [name, page N] marker before every page"""
+    return '\n\n'.join(
+        f'[{document.name}, page {number}]\n{text}'
+        for document in documents
+        for number, text in enumerate(document.pages, start=1)
+    )
+
+
+def estimate_tokens(text):
+    """Rough token count of English text, about four characters per token"""
+    return len(text) // 4 + 1
+
+
+class RetrievalBackend:
+    """Interface implemented by every retrieval backend"""
+
+    name = None
+    # Whether ingest needs the extracted page text or only the PDF bytes
+    needs_text = False
+
+    def ingest(self, client, documents, model, progress=None, owner=None):
+        """Index a collection of documents together and return an IngestResult
+
+        Returns None if nothing could be indexed. ``progress(stage, item=None)``
+        is called as the backend moves through its stages, with ``item`` set to
+        a document name for per-document progress. ``owner`` is the
+        lifecycle.Owner recorded for any remote resources created.
+        """
+        raise NotImplementedError
+
+    def build_request(self, handle, question):
+        """Build the RetrievalRequest answering question from ingested documents"""
+        raise NotImplementedError
+
+    def keep_alive(self, client, handle):
+        """Called before each question; extends remote resources that expire"""
+
+    def available(self, handle):
+        """Whether this process can answer from a handle, e.g. one a resumed session brings"""
+        return True
+
+    def release(self, client, handle):
+        """Release a handle; return True once its resources are freed"""
+        raise NotImplementedError
+
+
+class FileSearchBackend(RetrievalBackend):
+    """Gemini File Search Stores, deduplicated through the store index"""
+
+    name = 'file_search'
+
+    def __init__(self, store_index, chunking_config=None, upload_concurrency=4, lifecycle=None,
+                 max_part_bytes=None, upload_retries=2):
+        self.store_index = store_index
+        self.chunking_config = chunking_config
+        self.upload_concurrency = upload_concurrency
+        # Optional lifecycle.StoreRegistry recording every store created
+        self.lifecycle = lifecycle
+        # PDFs larger than this are uploaded as page-range parts; None never splits
+        self.max_part_bytes = max_part_bytes
+        # Further attempts of an upload (file or part) that failed
+        self.upload_retries = upload_retries
+
+    def ingest(self, client, documents, model, progress=None, owner=None):
+        progress = progress or (lambda stage, item=None: None)
+
+        # Reuse a store this project already indexed from the same content.
+        # The key includes the project, so a not-found lookup means the store is gone.
+        project = _project(owner)
+        content_key = compute_collection_key([d.path for d in documents], model, self.chunking_config, project)
+        store_name = self.store_index.acquire(content_key)
+        if store_name:
+            exists = _check_reused(self.store_index, store_name, lambda: store_exists(client, store_name))
+            if exists is None:
+                return None
+            if not exists:
+                store_name = None
+        if store_name:
+            self._touch(store_name)
+            return IngestResult(store_name, True, [])
+
+        progress('creating_store')
+        store_display_name = f'{STORE_NAME_PREFIX}{generate_random_id()}'
+        store = create_file_search_store(client, store_display_name)
+        if not store:
+            return None
+        if self.lifecycle:
+            self.lifecycle.record(store.name, store_display_name, owner, UPLOADING)
+
+        # Upload every file, or every part of an oversized one, concurrently;
+        # each waits on its own operation and is retried on its own
+        progress('uploading')
+        tasks = []
+        failed = set()
+        # Failed documents with some pages in the store anyway
+        partial = set()
+        with ThreadPoolExecutor(max_workers=max(self.upload_concurrency, 1), thread_name_prefix='pdfchat-upload') as pool:
+            upload = propagate_messages(self._upload_part)
+            for document in documents:
+                submitted = []
+                try:
+                    for part in self._parts(document, progress):
+                        submitted.append((part, pool.submit(upload, client, store.name, document, part, progress)))
+                except Exception as e:
+                    if self._abandon(document, submitted):
+                        partial.add(document.name)
+                    report_error(get_text('error_split_pdf').format(document.name, e))
+                    failed.add(document.name)
+                    continue
+                if not submitted:
+                    failed.add(document.name)
+                tasks.extend((document.name, part, future) for part, future in submitted)
+            outcomes = [(name, part, future.result()) for name, part, future in tasks]
+
+        missing = {}
+        split = set()
+        for name, part, ok in outcomes:
+            if part.last_page:
+                split.add(name)
+            if not ok:
+                failed.add(name)
+                if part.last_page:
+                    missing.setdefault(name, []).append(f'{part.first_page}-{part.last_page}')
+        partial.update(name for name, part, ok in outcomes if ok and name in failed)
+        for name in split:
+            progress('failed' if name in failed else 'done', name)
+        for name, ranges in missing.items():
+            report_warning(get_text('upload_parts_failed').format(name, ', '.join(ranges)))
+        uploaded = [d for d in documents if d.name not in failed]
+        failed = [d.name for d in documents if d.name in failed]
+        if not uploaded:
+            self._delete(client, store.name)
+            return None
+        if partial:
+            # Stray pages of failed documents: no other upload may reuse this store
+            content_key = f'partial:{store.name}'
+        elif failed:
+            # The store holds a different collection than was asked for
+            content_key = compute_collection_key([d.path for d in uploaded], model, self.chunking_config, project)
+
+        # Another session may have indexed the same content meanwhile
+        store_name = self.store_index.register(content_key, store.name, store_display_name)
+        if store_name != store.name:
+            self._delete(client, store.name)
+        else:
+            self._set_state(store.name, READY)
+        return IngestResult(store_name, False, failed)
+
+    def _parts(self, document, progress):
+        """Yield the PdfParts to upload for a document
+
+        A document within max_part_bytes is uploaded from its spooled file as
+        one part without a page range; larger ones are split into temporary
+        part files.
+        """
+        if not self.max_part_bytes or document.size <= self.max_part_bytes:
+            yield PdfPart(document.path, 1, None)
+            return
+        progress('splitting', document.name)
+        with span('split'):
+            yield from split_pdf(document.path, self.max_part_bytes)
+
+    @staticmethod
+    def _abandon(document, submitted):
+        """Stop the submitted parts of a document that failed to split
+
+        Queued parts are cancelled (and their files removed); the ones already
+        uploading are awaited. Returns whether any of them reached the store.
+        """
+        uploaded = False
+        for part, future in submitted:
+            if future.cancel():
+                if part.path != document.path:
+                    try:
+                        os.unlink(part.path)
+                    except OSError:
+                        pass
+            elif future.result():
+                uploaded = True
+        return uploaded
+
+    def _upload_part(self, client, store_name, document, part, progress):
+        """Upload one document or page-range part into the store, with retries; True on success
+
+        Parts carry their page range in the display name, which citations
+        show, and in their metadata, so answers map to the original pages.
+        """
+        stem = Path(document.name).stem
+        if part.last_page:
+            item = get_text('part_pages').format(document.name, part.first_page, part.last_page)
+            display_name = get_text('part_pages').format(stem, part.first_page, part.last_page)
+            metadata = [
+                {'key': 'source_file', 'string_value': document.name},
+                {'key': 'first_page', 'numeric_value': part.first_page},
+                {'key': 'last_page', 'numeric_value': part.last_page},
+            ]
+        else:
+            item, display_name, metadata = document.name, stem, None
+        try:
+            for attempt in range(self.upload_retries + 1):
+                messages = []
+                progress('uploading', item)
+                # Only the last attempt's errors are worth showing
+                with capture_messages(lambda level, message: messages.append((level, message))):
+                    uploaded = upload_file_to_store(
+                        client,
+                        part.path,
+                        store_name,
+                        display_name,
+                        self.chunking_config,
+                        lambda stage: progress(stage, item),
+                        metadata
+                    )
+                if uploaded:
+                    progress('done', item)
+                    return True
+                if attempt < self.upload_retries:
+                    progress('retrying', item)
+                    time.sleep(random.uniform(0.5, 1.0) * 2 ** attempt)
+            for level, message in messages:
+                (report_error if level == 'error' else report_warning)(message)
+            progress('failed', item)
+            return False
+        finally:
+            if part.path != document.path:
+                try:
+                    os.unlink(part.path)
+                except OSError:
+                    pass
+
+    def build_request(self, handle, question):
+        self._touch(handle)
+        return RetrievalRequest(question, file_search_config(handle), None)
+
+    def release(self, client, handle):
+        remaining = self.store_index.release(handle)
+        # None: not tracked here, so other sessions may still use it; the reaper decides
+        if remaining is None or remaining:
+            return False
+        return self._delete(client, handle)
+
+    def _delete(self, client, store_name):
+        """Delete a store; leave it marked failed for the reaper if that fails"""
+        deleted = cleanup_store(client, store_name)
+        self._set_state(store_name, DELETED if deleted else FAILED)
+        return deleted
+
+    def _set_state(self, store_name, state):
+        if self.lifecycle:
+            self.lifecycle.set_state(store_name, state)
+
+    def _touch(self, store_name):
+        if self.lifecycle:
+            self.lifecycle.touch(store_name)
+
+
+class LocalBm25Backend(RetrievalBackend):
+    """In-process BM25 over the extracted page text; no remote indexing"""
+
+    name = 'local'
+    needs_text = True
+
+    def __init__(self, top_k=5, chunk_words=200, overlap_words=40):
+        self.top_k = top_k
+        self.chunk_words = chunk_words
+        self.overlap_words = overlap_words
+        self._indexes = {}
+        self._refs = {}
+        self._lock = threading.Lock()
+
+    def ingest(self, client, documents, model, progress=None, owner=None):
+        usable = [d for d in documents if d.pages]
+        failed = [d.name for d in documents if not d.pages]
+        if not usable:
+            return None
+        handle = 'local:' + compute_collection_key([d.path for d in usable], None)[:32]
+        with self._lock:
+            reused = handle in self._indexes
+            if not reused:
+                if progress:
+                    progress('indexing')
+                with span('local_index'):
+                    chunks = []
+                    for document in usable:
+                        chunks.extend(chunk_pages(document.pages, self.chunk_words, self.overlap_words, document.name))
+                    self._indexes[handle] = Bm25Index(chunks)
+            self._refs[handle] = self._refs.get(handle, 0) + 1
+        return IngestResult(handle, reused, failed)
+
+    def available(self, handle):
+        # The index lives in the process that built it
+        return handle in self._indexes
+
+    def search(self, handle, question):
+        """Return the top-k (score, document, page_number, text) passages for a question"""
+        index = self._indexes.get(handle)
+        if index is None:
+            return []
+        return index.search(question, self.top_k)
+
+    def build_request(self, handle, question):
+        with span('local_search'):
+            hits = self.search(handle, question)
+        passages = '\n\n'.join(f'[{source}, page {page}]\n{text}' for _, source, page, text in hits)
+        contents = LOCAL_PROMPT.format(passages=passages or '(no matching passages)', question=question)
+        sources = {
+            'retrieved_passages': [
+                {'document': source, 'page': page, 'score': round(score, 3), 'text': text}
+                for score, source, page, text in hits
+            ]
+        }
+        return RetrievalRequest(contents, None, sources)
+
+    def release(self, client, handle):
+        with self._lock:
+            remaining = self._refs.get(handle, 0) - 1
+            if remaining > 0:
+                self._refs[handle] = remaining
+                return False
+            self._refs.pop(handle, None)
+            self._indexes.pop(handle, None)
+        return True
+
+
+class ContextCacheBackend(RetrievalBackend):
+    """Whole documents in a Gemini cached context; no retrieval step per question
+
+    The page text is uploaded once into a cached context that expires after
+    ``ttl_sec`` unless questions keep extending it. Collections below the
+    service's minimum cache size (``min_tokens``) are sent inline with each
+    question instead. Caches are shared through the store index like File
+    Search Stores; an expired cache simply disappears remotely.
+    """
+
+    name = 'context_cache'
+    needs_text = True
+
+    CACHE_PREFIX = 'cachedContents/'
+    INLINE_PREFIX = 'inline:'
+
+    def __init__(self, store_index, ttl_sec=3600, min_tokens=1024):
+        self.store_index = store_index
+        self.ttl_sec = ttl_sec
+        self.min_tokens = min_tokens
+        self._inline = {}
+        self._refs = {}
+        self._models = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def owns(self, handle):
+        return handle.startswith((self.CACHE_PREFIX, self.INLINE_PREFIX))
+
+    def ingest(self, client, documents, model, progress=None, owner=None):
+        usable = [d for d in documents if d.pages]
+        failed = [d.name for d in documents if not d.pages]
+        if not usable:
+            return None
+        context = format_document_context(usable)
+        content_key = compute_collection_key([d.path for d in usable], model, {'mode': self.name}, _project(owner))
+
+        if estimate_tokens(context) < self.min_tokens:
+            handle = self.INLINE_PREFIX + content_key[:32]
+            with self._lock:
+                reused = handle in self._inline
+                self._inline[handle] = context
+                self._refs[handle] = self._refs.get(handle, 0) + 1
+            return IngestResult(handle, reused, failed)
+
+        cache_name = self.store_index.acquire(content_key)
+        if cache_name:
+            exists = _check_reused(self.store_index, cache_name, lambda: context_cache_exists(client, cache_name))
+            if exists is None:
+                return None
+            if not exists:
+                cache_name = None
+        if cache_name:
+            self._models[cache_name] = model
+            return IngestResult(cache_name, True, failed)
+
+        if progress:
+            progress('caching')
+        display_name = f'pdf-chat-cache-{generate_random_id()}'
+        cache = create_context_cache(client, model, context, DIRECT_INSTRUCTION, self.ttl_sec, display_name)
+        if not cache:
+            return None
+        cache_name = self.store_index.register(content_key, cache.name, display_name)
+        if cache_name != cache.name:
+            delete_context_cache(client, cache.name)
+        else:
+            self._expires[cache_name] = time.time() + self.ttl_sec
+        self._models[cache_name] = model
+        return IngestResult(cache_name, False, failed)
+
+    def keep_alive(self, client, handle):
+        # Extend once half of the TTL has passed, not on every question
+        if not handle.startswith(self.CACHE_PREFIX):
+            return
+        if self._expires.get(handle, 0) - time.time() > self.ttl_sec / 2:
+            return
+        if extend_context_cache(client, handle, self.ttl_sec):
+            self._expires[handle] = time.time() + self.ttl_sec
+
+    def available(self, handle):
+        return not handle.startswith(self.INLINE_PREFIX) or handle in self._inline
+
+    def build_request(self, handle, question):
+        if handle.startswith(self.INLINE_PREFIX):
+            contents = DIRECT_PROMPT.format(
+                instruction=DIRECT_INSTRUCTION, documents=self._inline.get(handle, ''), question=question
+            )
+            return RetrievalRequest(contents, None, None)
+        return RetrievalRequest(question, cached_context_config(handle), None, self._models.get(handle))
+
+    def release(self, client, handle):
+        if handle.startswith(self.INLINE_PREFIX):
+            with self._lock:
+                remaining = self._refs.get(handle, 0) - 1
+                if remaining > 0:
+                    self._refs[handle] = remaining
+                    return False
+                self._refs.pop(handle, None)
+                self._inline.pop(handle, None)
+            return True
+        remaining = self.store_index.release(handle)
+        if remaining is None or remaining:
+            return False
+        self._models.pop(handle, None)
+        self._expires.pop(handle, None)
+        return delete_context_cache(client, handle)
+
+
+class AutoBackend(RetrievalBackend):
+    """Direct context for small collections, File Search for everything else
+
+    A collection goes to ``small`` (a ContextCacheBackend) when its total page
+    count is at most ``max_pages`` and its text is at most ``max_tokens``;
+    otherwise to ``large``. Only small collections have their text extracted.
+    A document averaging fewer than ``min_tokens_per_page`` extracted tokens
+    per page (e.g. a scan without a text layer) also sends the collection to
+    ``large``, whose service parses PDFs itself.
+    """
+
+    name = 'auto'
+    needs_text = False
+
+    def __init__(self, small, large, max_pages=30, max_tokens=100000, min_tokens_per_page=20):
+        self.small = small
+        self.large = large
+        self.max_pages = max_pages
+        self.max_tokens = max_tokens
+        self.min_tokens_per_page = min_tokens_per_page
+
+    def choose(self, documents):
+        """Return (backend, documents) for a collection, extracting text if small"""
+        page_counts = [_page_count(d.path) for d in documents]
+        if sum(page_counts) > self.max_pages:
+            return self.large, documents
+        with_text = [
+            Document(d.name, d.path, d.size, extract_pages_from_pdf(d.path) if pages else None)
+            for d, pages in zip(documents, page_counts)
+        ]
+        for document in with_text:
+            if document.pages is not None and self._text_poor(document.pages):
+                return self.large, documents
+        text = format_document_context([d for d in with_text if d.pages])
+        if estimate_tokens(text) > self.max_tokens:
+            return self.large, documents
+        return self.small, with_text
+
+    def _text_poor(self, pages):
+        tokens = sum(len(page.strip()) for page in pages) // 4
+        return tokens < self.min_tokens_per_page * max(len(pages), 1)
+
+    def ingest(self, client, documents, model, progress=None, owner=None):
+        backend, documents = self.choose(documents)
+        return backend.ingest(client, documents, model, progress, owner)
+
+    def _route(self, handle):
+        return self.small if self.small.owns(handle) else self.large
+
+    def keep_alive(self, client, handle):
+        self._route(handle).keep_alive(client, handle)
+
+    def available(self, handle):
+        return self._route(handle).available(handle)
+
+    def build_request(self, handle, question):
+        return self._route(handle).build_request(handle, question)
+
+    def release(self, client, handle):
+        return self._route(handle).release(client, handle)
+
+
+def _project(owner):
+    """Who can see remote resources created for owner: the hash of its API key"""
+    return owner.key_hash if owner else None
+
+
+def _check_reused(store_index, name, exists):
+    """Whether an acquired store or cache still exists; None if that is unknown
+
+    Only a not-found answer drops the index entry. Any other error leaves the
+    entry to the sessions still using it, gives back the reference just taken
+    and fails the ingestion rather than creating a duplicate.
+    """
+    try:
+        if exists():
+            return True
+    except Exception as e:
+        store_index.release(name)
+        report_error(get_text('error_check_reuse').format(e))
+        return None
+    store_index.forget(name)
+    return False
+
+
+def _page_count(path):
+    # Unreadable files count as empty; ingest_documents already reported them
+    try:
+        return count_pdf_pages(path)
+    except Exception:
+        return 0
@@ -0,0 +1,323 @@
+"""Process-wide admission control and request coalescing in front of model calls
+
+Every answer the service generates passes through one QueryScheduler:
+
+- Each API key (client) gets at most ``max_concurrent`` model calls at once
+  and, if ``tokens_per_minute`` is set, at most that many tokens per sliding
+  minute. A call reserves its estimated prompt tokens when it is admitted and
+  the reservation is corrected to the reported usage when it finishes.
+- Waiting calls are admitted round-robin across sessions, so one session
+  firing many questions cannot starve the others.
+- Identical questions in flight at the same time are coalesced by
+  SingleFlight: the first caller asks the model and the others follow its
+  stream instead of making their own call.
+
+Waiters are granted a slot and woken by whoever frees capacity, so the same
+scheduler serves threads (Streamlit) and coroutines (the HTTP API).
+
+Metrics: ``pdfchat_scheduler_queue_depth`` and ``pdfchat_scheduler_active``
+(gauges), ``pdfchat_scheduler_wait_seconds`` (histogram) and
+``pdfchat_scheduler_coalesced_total``.
+"""
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from .metrics import REGISTRY
+
+# Length of the tokens-per-minute window in seconds
+WINDOW_SEC = 60
+
+
+class _Waiter:
+    __slots__ = ('session', 'tokens', 'wake', 'granted', 'entry', 'enqueued_at')
+
+    def __init__(self, session, tokens, wake):
+        self.session = session
+        self.tokens = tokens
+        self.wake = wake
+        self.granted = False
+        self.entry = None
+        self.enqueued_at = time.perf_counter()
+
+
+class _KeyState:
+    """Active calls, recent token use and per-session queues of one API key"""
+
+    def __init__(self):
+        self.active = 0
+        # [admitted_at, tokens] per call admitted within the window
+        self.window = deque()
+        # session -> deque of waiters; iteration order is the round-robin turn
+        self.queues = OrderedDict()
+        # Dispatches again once the token budget frees up
+        self.timer = None
+
+
+class Ticket:
+    """An admitted call; report its actual token usage with used()"""
+
+    def __init__(self, lock, entry):
+        self._lock = lock
+        self._entry = entry
+
+    def used(self, usage):
+        """Replace the token estimate with a usage dict from metrics.usage_counts"""
+        if usage:
+            with self._lock:
+                self._entry[1] = usage.get('total', 0)
+
+
+class QueryScheduler:
+    """Per-API-key concurrency and token budgets with fair queueing across sessions"""
+
+    def __init__(self, max_concurrent=16, tokens_per_minute=0):
+        self.max_concurrent = max(max_concurrent, 1)
+        self.tokens_per_minute = tokens_per_minute
+        self.flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._states = weakref.WeakKeyDictionary()
+        self._waiting = 0
+        self._active = 0
+
+    @contextmanager
+    def slot(self, client, session, tokens):
+        """Block until a call with about ``tokens`` prompt tokens may run; yield a Ticket"""
+        event = threading.Event()
+        state, waiter = self._enqueue(client, session, tokens, event.set)
+        try:
+            delay = self._dispatch(state)
+            while not waiter.granted:
+                event.wait(delay)
+                delay = self._dispatch(state)
+        except BaseException:
+            self._abandon(state, waiter)
+            raise
+        try:
+            yield self._admitted(waiter)
+        finally:
+            self._release(state)
+
+    @asynccontextmanager
+    async def aslot(self, client, session, tokens):
+        """Asynchronous slot(): waits on the event loop instead of a thread"""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        state, waiter = self._enqueue(client, session, tokens, lambda: loop.call_soon_threadsafe(event.set))
+        try:
+            delay = self._dispatch(state)
+            while not waiter.granted:
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = self._dispatch(state)
+        except BaseException:
+            self._abandon(state, waiter)
+            raise
+        try:
+            yield self._admitted(waiter)
+        finally:
+            self._release(state)
+
+    def stats(self):
+        """Calls waiting and running across all API keys"""
+        with self._lock:
+            return {'waiting': self._waiting, 'active': self._active}
+
+    def _admitted(self, waiter):
+        REGISTRY.observe('pdfchat_scheduler_wait_seconds', time.perf_counter() - waiter.enqueued_at)
+        return Ticket(self._lock, waiter.entry)
+
+    def _enqueue(self, client, session, tokens, wake):
+        waiter = _Waiter(session, tokens, wake)
+        with self._lock:
+            state = self._states.get(client)
+            if state is None:
+                state = self._states[client] = _KeyState()
+            state.queues.setdefault(session, deque()).append(waiter)
+            self._waiting += 1
+            self._publish()
+        return state, waiter
+
+    def _dispatch(self, state):
+        """Admit waiters in round-robin order while capacity lasts
+
+        Returns how long until token budget frees up if the next waiter is
+        held back by it, else None.
+        """
+        retry_after = None
+        with self._lock:
+            now = time.monotonic()
+            while state.window and state.window[0][0] <= now - WINDOW_SEC:
+                state.window.popleft()
+            used = sum(tokens for _, tokens in state.window)
+            while state.queues and state.active < self.max_concurrent:
+                session, queue = next(iter(state.queues.items()))
+                waiter = queue[0]
+                if self.tokens_per_minute and state.window and used + waiter.tokens > self.tokens_per_minute:
+                    retry_after = max(state.window[0][0] + WINDOW_SEC - now, 0.01)
+                    break
+                queue.popleft()
+                # The session moves to the back of the turn order
+                del state.queues[session]
+                if queue:
+                    state.queues[session] = queue
+                waiter.entry = [now, waiter.tokens]
+                state.window.append(waiter.entry)
+                used += waiter.tokens
+                waiter.granted = True
+                state.active += 1
+                self._waiting -= 1
+                self._active += 1
+                waiter.wake()
+            if retry_after is not None and state.timer is None:
+                # Waiters queued behind a full slot wait without a timeout
+                state.timer = threading.Timer(retry_after, self._dispatch_later, (state,))
+                state.timer.daemon = True
+                state.timer.start()
+            self._publish()
+        return retry_after
+
+    def _dispatch_later(self, state):
+        with self._lock:
+            state.timer = None
+        self._dispatch(state)
+
+    def _abandon(self, state, waiter):
+        """Forget a waiter that gave up; free its slot if it was granted meanwhile"""
+        with self._lock:
+            if not waiter.granted:
+                queue = state.queues.get(waiter.session)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        del state.queues[waiter.session]
+                self._waiting -= 1
+                self._publish()
+                return
+        self._release(state)
+
+    def _release(self, state):
+        with self._lock:
+            state.active -= 1
+            self._active -= 1
+        self._dispatch(state)
+
+    def _publish(self):
+        REGISTRY.set('pdfchat_scheduler_queue_depth', self._waiting)
+        REGISTRY.set('pdfchat_scheduler_active', self._active)
+
+
+class Flight:
+    """One in-flight answer that other callers can follow chunk by chunk"""
+
+    def __init__(self):
+        self.chunks = []
+        self.answer = {}
+        self.done = False
+        # False if the leader stopped or failed before its answer was complete
+        self.ok = True
+        self._lock = threading.Lock()
+        self._wakes = set()
+
+    def publish(self, text):
+        with self._lock:
+            self.chunks.append(text)
+            wakes = list(self._wakes)
+        for wake in wakes:
+            wake()
+
+    def finish(self, answer, ok=True):
+        """Mark the flight finished; followers receive a copy of ``answer``
+
+        With ``ok`` False the chunks published so far are not a complete
+        answer: the leader was closed, raised or the model call failed.
+        """
+        with self._lock:
+            if ok and not self.chunks and answer.get('text'):
+                self.chunks.append(answer['text'])
+            self.answer = dict(answer)
+            self.ok = ok
+            self.done = True
+            wakes = list(self._wakes)
+        for wake in wakes:
+            wake()
+
+    def follow(self):
+        """Yield every chunk published so far and then new ones until finished"""
+        event = threading.Event()
+        with self._lock:
+            self._wakes.add(event.set)
+        try:
+            index = 0
+            while True:
+                event.clear()
+                chunks, done = self._read(index)
+                index += len(chunks)
+                yield from chunks
+                if done:
+                    return
+                if not chunks:
+                    event.wait()
+        finally:
+            with self._lock:
+                self._wakes.discard(event.set)
+
+    async def afollow(self):
+        """Asynchronous follow()"""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(event.set)
+
+        with self._lock:
+            self._wakes.add(wake)
+        try:
+            index = 0
+            while True:
+                event.clear()
+                chunks, done = self._read(index)
+                index += len(chunks)
+                for text in chunks:
+                    yield text
+                if done:
+                    return
+                if not chunks:
+                    await event.wait()
+        finally:
+            with self._lock:
+                self._wakes.discard(wake)
+
+    def _read(self, index):
+        with self._lock:
+            return self.chunks[index:], self.done
+
+
+class SingleFlight:
+    """Coalesces concurrent requests with the same key into one Flight"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def join(self, key):
+        """Return (flight, leader); only the leader makes the call"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                REGISTRY.inc('pdfchat_scheduler_coalesced_total')
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def finish(self, key, flight, answer, ok=True):
+        """Complete the leader's flight and let the next request start a new one"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(answer, ok)
@@ -0,0 +1,410 @@
+"""Ingestion and question answering shared by the Streamlit UI and the HTTP API
+
+ChatService owns the process-wide retrieval backends, ingestion job pool and
+answer cache. Front ends only translate their requests into these calls: the
+Streamlit script uses the synchronous methods, the HTTP API (pdfchat.api) the
+asynchronous ones.
+"""
+import asyncio
+import time
+from contextlib import closing, nullcontext
+
+from . import settings
+from .answer_cache import AnswerCache, make_cache_key
+from .chat import get_suggested_questions
+from .gemini import astream_model, query_model, stream_model
+from .holds import HoldRegistry
+from .ingest import ingest_documents
+from .jobs import JobManager
+from .lifecycle import StoreRegistry, StoreReaper
+from .metrics import usage_counts
+from .prefetch import Prefetcher
+from .report import capture_messages, report_error
+from .retrieval import AutoBackend, ContextCacheBackend, FileSearchBackend, LocalBm25Backend, estimate_tokens
+from .scheduler import QueryScheduler
+from .store_index import StoreIndex
+from .text import get_text
+
+# Scheduling lane shared by all speculative prefetches
+PREFETCH_SESSION = 'prefetch'
+
+
+class ChatService:
+    """Submits ingestion jobs and answers questions against ingested collections"""
+
+    def __init__(self, backends, job_manager, answer_cache, extract_workers=0, store_index=None, lifecycle=None,
+                 prefetcher=None, scheduler=None, holds=None, clients=None):
+        self.backends = backends
+        self.job_manager = job_manager
+        self.answer_cache = answer_cache
+        self.extract_workers = extract_workers
+        self.store_index = store_index
+        self.lifecycle = lifecycle
+        # Optional Prefetcher answering the suggested questions of new collections
+        self.prefetcher = prefetcher
+        # Admission control and coalescing of every model call
+        self.scheduler = scheduler or QueryScheduler()
+        # Optional HoldRegistry tying releases to the owner that ingested
+        self.holds = holds
+        # Optional ClientRegistry whose clients are leased while work uses them
+        self.clients = clients
+
+    @classmethod
+    def from_settings(cls, clients=None):
+        """Build the service from the PDF_CHAT_* settings around a ClientRegistry"""
+        store_index = StoreIndex(settings.STORE_INDEX_PATH)
+        lifecycle = StoreRegistry(settings.STORE_INDEX_PATH)
+        file_search = FileSearchBackend(
+            store_index,
+            settings.get_chunking_config(),
+            settings.UPLOAD_CONCURRENCY,
+            lifecycle,
+            int(settings.UPLOAD_PART_MB * 1024 * 1024) or None,
+            settings.UPLOAD_RETRIES
+        )
+        context_cache = ContextCacheBackend(
+            store_index, settings.CONTEXT_CACHE_TTL_SEC, settings.CONTEXT_CACHE_MIN_TOKENS
+        )
+        backends = {
+            AutoBackend.name: AutoBackend(
+                context_cache, file_search, settings.DIRECT_MAX_PAGES, settings.DIRECT_MAX_TOKENS,
+                settings.DIRECT_MIN_TOKENS_PER_PAGE
+            ),
+            FileSearchBackend.name: file_search,
+            ContextCacheBackend.name: context_cache,
+            LocalBm25Backend.name: LocalBm25Backend(top_k=settings.LOCAL_TOP_K)
+        }
+        answer_cache = AnswerCache(
+            settings.ANSWER_CACHE_PATH,
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_sec=settings.ANSWER_CACHE_TTL_SEC
+        )
+        return cls(
+            backends,
+            JobManager(settings.INGEST_WORKERS),
+            answer_cache,
+            settings.EXTRACT_WORKERS,
+            store_index,
+            lifecycle,
+            Prefetcher(settings.PREFETCH_WORKERS) if settings.PREFETCH_SUGGESTIONS else None,
+            QueryScheduler(settings.SCHEDULER_MAX_CONCURRENT, settings.SCHEDULER_TOKENS_PER_MINUTE),
+            HoldRegistry(settings.STORE_INDEX_PATH),
+            clients
+        )
+
+    def start_reaper(self, client_lookup):
+        """Start deleting expired, failed and stuck stores in the background
+
+        ``client_lookup(key_hash)`` supplies a client for a store's API key,
+        typically ClientRegistry.get_by_hash. Returns None if disabled.
+        """
+        if not settings.REAPER_INTERVAL_SEC:
+            return None
+        reaper = StoreReaper(
+            self.lifecycle,
+            client_lookup,
+            settings.STORE_TTL_SEC,
+            settings.STORE_STUCK_SEC,
+            settings.REAPER_CONCURRENCY,
+            settings.REAPER_BATCH_SIZE,
+            settings.REAPER_RETRIES,
+            on_deleted=self._forget_store,
+            lease=self._lease,
+            references=self.store_index.references if self.store_index else None
+        )
+        return reaper.start(settings.REAPER_INTERVAL_SEC)
+
+    def backend(self, name):
+        """Return the retrieval backend with this name"""
+        try:
+            return self.backends[name]
+        except KeyError:
+            raise ValueError(f"Unknown retrieval backend: {name}") from None
+
+    def available(self, backend_name, handle):
+        """Whether a collection handle can still be asked about from this process"""
+        return self.backend(backend_name).available(handle)
+
+    def submit_ingest(self, client, files, backend_name, model, owner=None):
+        """Start ingesting (name, path) pairs of spooled uploads into one collection; return the job ID
+
+        The job takes over the files (see pdf.save_uploaded_file) and deletes
+        them when it ends. ``owner`` (a lifecycle.Owner) is recorded with any
+        store created. Once the collection is ready, its suggested questions
+        are prefetched. The client is leased until the job ends.
+        """
+        backend = self.backend(backend_name)
+        if self.clients is not None:
+            self.clients.acquire(client)
+        return self.job_manager.submit(self._ingest, client, backend, files, model, owner)
+
+    def _ingest(self, job, client, backend, files, model, owner):
+        try:
+            result = ingest_documents(job, client, backend, files, model, self.extract_workers, owner)
+        finally:
+            if self.clients is not None:
+                self.clients.release(client)
+        if result and owner is not None and self.holds is not None:
+            self.holds.add(result['handle'], owner)
+        if result:
+            names = ', '.join(d['name'] for d in result['documents'])
+            self.prefetch(client, backend.name, result['handle'], model, get_suggested_questions(names))
+        return result
+
+    def get_job(self, job_id):
+        return self.job_manager.get(job_id)
+
+    def pop_job(self, job_id):
+        return self.job_manager.pop(job_id)
+
+    def prefetch(self, client, backend_name, handle, model, questions):
+        """Answer questions into the answer cache in the background, if enabled"""
+        if self.prefetcher is None:
+            return
+        self.prefetcher.start(handle, [
+            (
+                make_cache_key(handle, model, question),
+                lambda cancelled, question=question: self._prefetch_answer(
+                    client, backend_name, handle, model, question, cancelled
+                )
+            )
+            for question in questions
+        ])
+
+    def _prefetch_answer(self, client, backend_name, handle, model, question, cancelled):
+        """Stream one answer into the cache; return its token usage, or None if already cached
+
+        The answer streams as an ordinary flight, so a user who asks the same
+        question meanwhile follows it instead of waiting or asking again. A
+        cancelled or failed prefetch finishes its flight as incomplete.
+        """
+        if self.answer_cache.get(handle, model, question):
+            return None
+        key = make_cache_key(handle, model, question)
+        flight, leader = self.scheduler.flights.join(key)
+        if not leader:
+            return None
+        errors = []
+        answer = {}
+        ok = False
+        try:
+            with self._lease(client), capture_messages(lambda level, message: errors.append(message)):
+                request = self._build_request(client, backend_name, handle, question)
+                chunks = self._stream_model(client, PREFETCH_SESSION, request, model, answer)
+                with closing(chunks):
+                    for text in chunks:
+                        if cancelled.is_set():
+                            break
+                        flight.publish(text)
+            if errors:
+                raise RuntimeError(errors[0])
+            if not cancelled.is_set():
+                ok = True
+                self._store_answer(handle, model, question, request, answer)
+        finally:
+            self.scheduler.flights.finish(key, flight, answer, ok)
+        return answer.get('usage') or {}
+
+    def stream_answer(self, client, backend_name, handle, model, question, answer, session=None):
+        """Yield the answer to a question in text chunks
+
+        Fills ``answer`` like gemini.stream_model, plus ``cached`` (whether it
+        came from the answer cache) and locally known sources as the grounding
+        metadata when the model returns none. ``session`` identifies the caller
+        for fair scheduling. If the same question is already being answered,
+        prefetched included, this follows that answer instead of asking the
+        model again; if that answer stops before any text, this asks itself,
+        and if it stops midway, the interruption is reported.
+        """
+        if self._answer_from_cache(handle, model, question, answer):
+            yield answer['text']
+            return
+        key = make_cache_key(handle, model, question)
+        while True:
+            flight, leader = self.scheduler.flights.join(key)
+            if leader:
+                break
+            shown = False
+            for text in flight.follow():
+                shown = True
+                yield text
+            if flight.ok or shown:
+                self._follow_result(key, flight, answer)
+                return
+        ok = False
+        try:
+            with self._lease(client):
+                request = self._build_request(client, backend_name, handle, question)
+                for text in self._stream_model(client, session, request, model, answer):
+                    flight.publish(text)
+                    yield text
+            ok = not answer['error']
+            self._store_answer(handle, model, question, request, answer)
+        finally:
+            self.scheduler.flights.finish(key, flight, answer, ok)
+
+    async def astream_answer(self, client, backend_name, handle, model, question, answer, session=None):
+        """Asynchronous stream_answer on the SDK's asyncio client
+
+        Answer cache lookups, keep-alives and other blocking calls (SQLite,
+        synchronous SDK requests) run in worker threads, so the event loop
+        keeps serving other requests meanwhile.
+        """
+        if await asyncio.to_thread(self._answer_from_cache, handle, model, question, answer):
+            yield answer['text']
+            return
+        key = make_cache_key(handle, model, question)
+        while True:
+            flight, leader = self.scheduler.flights.join(key)
+            if leader:
+                break
+            shown = False
+            async for text in flight.afollow():
+                shown = True
+                yield text
+            if flight.ok or shown:
+                self._follow_result(key, flight, answer)
+                return
+        ok = False
+        try:
+            with self._lease(client):
+                request = await asyncio.to_thread(self._build_request, client, backend_name, handle, question)
+                async with self.scheduler.aslot(client, session, estimate_tokens(request.contents)) as ticket:
+                    try:
+                        async for text in astream_model(
+                            client, request.model or model, request.contents, request.config, answer
+                        ):
+                            flight.publish(text)
+                            yield text
+                    finally:
+                        ticket.used(answer.get('usage'))
+            ok = not answer['error']
+            await asyncio.to_thread(self._store_answer, handle, model, question, request, answer)
+        finally:
+            self.scheduler.flights.finish(key, flight, answer, ok)
+
+    def answer(self, client, backend_name, handle, model, question, session=None):
+        """Answer a question in one blocking call; return the answer dict"""
+        answer = {}
+        if self._answer_from_cache(handle, model, question, answer):
+            return answer
+        key = make_cache_key(handle, model, question)
+        while True:
+            flight, leader = self.scheduler.flights.join(key)
+            if leader:
+                break
+            for _ in flight.follow():
+                pass
+            if flight.ok:
+                self._follow_result(key, flight, answer)
+                return answer
+        ok = False
+        try:
+            with self._lease(client):
+                request = self._build_request(client, backend_name, handle, question)
+                with self.scheduler.slot(client, session, estimate_tokens(request.contents)) as ticket:
+                    start = time.perf_counter()
+                    response = query_model(client, request.model or model, request.contents, request.config)
+                    latency = time.perf_counter() - start
+                    try:
+                        gm = response.candidates[0].grounding_metadata
+                    except (IndexError, TypeError, AttributeError):
+                        gm = None
+                    answer.update({
+                        'text': (response.text if response else None) or '',
+                        'grounding_metadata': gm,
+                        'ttft': None,
+                        'latency': latency,
+                        'usage': usage_counts(getattr(response, 'usage_metadata', None))
+                    })
+                    ticket.used(answer['usage'])
+            ok = response is not None
+            self._store_answer(handle, model, question, request, answer)
+        finally:
+            self.scheduler.flights.finish(key, flight, answer, ok)
+        return answer
+
+    def _stream_model(self, client, session, request, model, answer):
+        """gemini.stream_model once the scheduler admits the call"""
+        with self.scheduler.slot(client, session, estimate_tokens(request.contents)) as ticket:
+            try:
+                yield from stream_model(client, request.model or model, request.contents, request.config, answer)
+            finally:
+                ticket.used(answer.get('usage'))
+
+    def _follow_result(self, key, flight, answer):
+        """Copy the answer of a followed flight; its tokens were spent by the leader
+
+        A flight that did not complete leaves an empty answer and reports the
+        interruption, since its partial text was already shown.
+        """
+        if not flight.ok:
+            answer.update({'text': '', 'grounding_metadata': None, 'error': get_text('error_interrupted')})
+            report_error(answer['error'])
+        else:
+            if self.prefetcher is not None:
+                self.prefetcher.claim(key)
+            answer.update(flight.answer)
+        answer.update({'cached': False, 'usage': None})
+        for name in ('ttft', 'latency', 'error'):
+            answer.setdefault(name, None)
+        answer.setdefault('text', '')
+        answer.setdefault('grounding_metadata', None)
+
+    def release(self, client, backend_name, handle, owner=None):
+        """Release a collection; drop its cached answers once it is freed
+
+        With an ``owner`` (a lifecycle.Owner), only a reference that owner's
+        ingestion acquired is released; otherwise nothing happens and False is
+        returned. Prefetching for the collection stops once it is freed; until
+        then other owners may still be following its prefetched answers.
+        """
+        if owner is not None and self.holds is not None and not self.holds.remove(handle, owner):
+            return False
+        with self._lease(client):
+            released = self.backend(backend_name).release(client, handle)
+        if released:
+            if self.prefetcher is not None:
+                self.prefetcher.cancel(handle)
+            self.answer_cache.invalidate_store(handle)
+        return released
+
+    def transfer_holds(self, owner, new_owner):
+        """Let new_owner release the collections owner's ingestions acquired"""
+        if self.holds is not None:
+            self.holds.transfer(owner, new_owner)
+
+    def _build_request(self, client, backend_name, handle, question):
+        backend = self.backend(backend_name)
+        backend.keep_alive(client, handle)
+        return backend.build_request(handle, question)
+
+    def _lease(self, client):
+        """Keep a pooled client from being evicted while a block uses it"""
+        return self.clients.lease(client) if self.clients is not None else nullcontext(client)
+
+    def _forget_store(self, store_name):
+        self.store_index.forget(store_name)
+        if self.holds is not None:
+            self.holds.forget(store_name)
+        self.answer_cache.invalidate_store(store_name)
+
+    def _answer_from_cache(self, handle, model, question, answer):
+        cached = self.answer_cache.get(handle, model, question)
+        answer['cached'] = bool(cached)
+        if cached:
+            if self.prefetcher is not None:
+                self.prefetcher.claim(make_cache_key(handle, model, question))
+            answer.update({
+                'text': cached['text'],
+                'grounding_metadata': cached['grounding_metadata'],
+                'ttft': None,
+                'latency': None,
+                'usage': None
+            })
+        return answer['cached']
+
+    def _store_answer(self, handle, model, question, request, answer):
+        answer['grounding_metadata'] = answer['grounding_metadata'] or request.sources
+        if answer['text'] and not answer.get('error'):
+            self.answer_cache.put(handle, model, question, answer['text'], answer['grounding_metadata'])
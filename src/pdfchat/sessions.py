@@ -0,0 +1,393 @@
+"""Session state kept outside the process so sessions survive restarts and replicas
+
+A session is identified by a random token carried in the page URL. Its state
+(a small JSON dict: collection handle, document details, counters) and its
+chat messages are written to a SessionStore that every replica shares, so a
+session resumes wherever the load balancer sends it next and after restarts:
+
+- SqliteSessionStore: a SQLite file, for replicas on one host or a shared volume
+- RedisSessionStore: any server speaking the Redis protocol (Redis, Valkey,
+  KeyDB, ...) through a minimal built-in client, for replicas on many hosts
+
+Writes go through a SessionWriter, which queues them and applies them in
+batches from a background thread (write-behind), so a rerun never waits on
+the store. Several state updates of one session between flushes collapse into
+the last one. Sessions not written for ``ttl_sec`` expire.
+
+Metrics: ``pdfchat_session_flush_seconds`` (histogram),
+``pdfchat_session_writes_total`` (sessions written) and
+``pdfchat_session_write_errors_total``.
+"""
+import atexit
+import json
+import socket
+import threading
+import time
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from . import settings
+from .db import transaction
+from .metrics import REGISTRY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    state TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+MESSAGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_messages (
+    id INTEGER PRIMARY KEY,
+    token TEXT NOT NULL,
+    message TEXT NOT NULL
+)
+"""
+MESSAGES_INDEX = 'CREATE INDEX IF NOT EXISTS session_messages_token ON session_messages (token, id)'
+
+# Seconds between purges of expired sessions from SQLite
+PURGE_INTERVAL_SEC = 600
+
+
+class SessionUpdate:
+    """Pending writes of one session: latest state, new messages, resets"""
+
+    __slots__ = ('state', 'messages', 'reset_messages', 'deleted')
+
+    def __init__(self):
+        self.state = None
+        self.messages = []
+        # Drop the stored messages before appending ``messages``
+        self.reset_messages = False
+        self.deleted = False
+
+    def merge(self, newer):
+        """Fold a later update of the same session into this one"""
+        if newer.deleted:
+            self.delete()
+        if newer.reset_messages:
+            self.messages = []
+            self.reset_messages = True
+        if newer.state is not None:
+            self.set_state(newer.state)
+        self.messages.extend(newer.messages)
+
+    def set_state(self, state):
+        if self.deleted:
+            # A session recreated after deletion starts with an empty chat
+            self.deleted = False
+            self.reset_messages = True
+        self.state = state
+
+    def delete(self):
+        self.state, self.messages, self.reset_messages, self.deleted = None, [], False, True
+
+
+class SessionStore:
+    """Interface implemented by every session store"""
+
+    name = None
+
+    def load(self, token):
+        """Return (state, messages) of a session, or None if unknown or expired"""
+        raise NotImplementedError
+
+    def apply(self, updates):
+        """Write a batch of {token: SessionUpdate} at once"""
+        raise NotImplementedError
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in a SQLite file; one transaction per batch"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path, ttl_sec=86400):
+        self.db_path = Path(db_path)
+        self.ttl_sec = ttl_sec
+        self._purged_at = 0
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+            conn.execute(MESSAGES_SCHEMA)
+            conn.execute(MESSAGES_INDEX)
+
+    def _connect(self):
+        return transaction(self.db_path)
+
+    def load(self, token):
+        with self._connect() as conn:
+            row = conn.execute('SELECT state, updated_at FROM sessions WHERE token = ?', (token,)).fetchone()
+            if row is None or row[1] < time.time() - self.ttl_sec:
+                return None
+            messages = conn.execute(
+                'SELECT message FROM session_messages WHERE token = ? ORDER BY id', (token,)
+            ).fetchall()
+        return json.loads(row[0] or '{}'), [json.loads(message) for message, in messages]
+
+    def apply(self, updates):
+        now = time.time()
+        with self._connect() as conn:
+            for token, update in updates.items():
+                if update.deleted or update.reset_messages:
+                    conn.execute('DELETE FROM session_messages WHERE token = ?', (token,))
+                if update.deleted and update.state is None:
+                    conn.execute('DELETE FROM sessions WHERE token = ?', (token,))
+                    continue
+                if update.state is not None:
+                    conn.execute(
+                        'INSERT INTO sessions VALUES (?, ?, ?) ON CONFLICT (token) '
+                        'DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at',
+                        (token, json.dumps(update.state), now)
+                    )
+                else:
+                    conn.execute(
+                        'INSERT INTO sessions VALUES (?, NULL, ?) ON CONFLICT (token) '
+                        'DO UPDATE SET updated_at = excluded.updated_at',
+                        (token, now)
+                    )
+                conn.executemany(
+                    'INSERT INTO session_messages (token, message) VALUES (?, ?)',
+                    [(token, json.dumps(message)) for message in update.messages]
+                )
+            if now - self._purged_at > PURGE_INTERVAL_SEC:
+                self._purged_at = now
+                cutoff = now - self.ttl_sec
+                conn.execute(
+                    'DELETE FROM session_messages WHERE token IN (SELECT token FROM sessions WHERE updated_at < ?)',
+                    (cutoff,)
+                )
+                conn.execute('DELETE FROM sessions WHERE updated_at < ?', (cutoff,))
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RedisConnection:
+    """Minimal Redis protocol (RESP2) client over one socket with pipelining
+
+    Understands ``redis://[[user]:password@]host[:port][/db]`` URLs. Commands from
+    concurrent threads are serialized; a broken connection is reopened on the
+    next call.
+    """
+
+    def __init__(self, url, timeout=5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def execute(self, *args):
+        """Run one command and return its reply"""
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands):
+        """Send several commands in one round trip; return their replies in order
+
+        An error reply raises RedisError after every reply has been read.
+        """
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._open()
+                return self._roundtrip(commands)
+            except (OSError, ConnectionError):
+                self.close()
+                raise
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = self._file = None
+
+    def _open(self):
+        self._sock = socket.create_connection((self.host, self.port), self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile('rb')
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.username, self.password) if self.username else ('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            self._roundtrip(setup)
+
+    def _roundtrip(self, commands):
+        self._sock.sendall(b''.join(_encode(command) for command in commands))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def _read(self):
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Connection closed by the Redis server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            return RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise ConnectionError(f'Unexpected reply from the Redis server: {line!r}')
+
+
+def _encode(command):
+    parts = [arg if isinstance(arg, bytes) else str(arg).encode() for arg in command]
+    return b'*%d\r\n' % len(parts) + b''.join(b'$%d\r\n%s\r\n' % (len(part), part) for part in parts)
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions as a JSON string and a message list per token; one pipeline per batch"""
+
+    name = 'redis'
+
+    def __init__(self, url, ttl_sec=86400, prefix='pdfchat:session:'):
+        self.connection = RedisConnection(url)
+        self.ttl_sec = int(ttl_sec)
+        self.prefix = prefix
+
+    def load(self, token):
+        state, messages = self.connection.pipeline([
+            ('GET', self.prefix + token),
+            ('LRANGE', self.prefix + token + ':messages', 0, -1),
+        ])
+        if state is None:
+            return None
+        return json.loads(state), [json.loads(message) for message in messages]
+
+    def apply(self, updates):
+        commands = []
+        for token, update in updates.items():
+            key, messages_key = self.prefix + token, self.prefix + token + ':messages'
+            if update.deleted or update.reset_messages:
+                commands.append(('DEL', messages_key))
+            if update.deleted and update.state is None:
+                commands.append(('DEL', key))
+                continue
+            if update.state is not None:
+                commands.append(('SET', key, json.dumps(update.state), 'EX', self.ttl_sec))
+            else:
+                commands.append(('EXPIRE', key, self.ttl_sec))
+            if update.messages:
+                commands.append(('RPUSH', messages_key, *(json.dumps(message) for message in update.messages)))
+            commands.append(('EXPIRE', messages_key, self.ttl_sec))
+        if commands:
+            self.connection.pipeline(commands)
+
+
+class SessionWriter:
+    """Write-behind queue in front of a SessionStore
+
+    update(), append(), reset_messages() and delete() only record the change;
+    a background thread applies everything queued every ``interval_sec`` in
+    one batch. A batch that fails is retried with the next one.
+    """
+
+    def __init__(self, store, interval_sec=0.5):
+        self.store = store
+        self.interval_sec = interval_sec
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._thread = threading.Thread(target=self._run, name='pdfchat-session-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def load(self, token):
+        """Stored (state, messages) of a session, including writes still queued here"""
+        if token in self._pending:
+            self.flush()
+        return self.store.load(token)
+
+    def update(self, token, state):
+        """Replace a session's state dict; only the last update before a flush is written"""
+        with self._lock:
+            self._queued(token).set_state(dict(state))
+
+    def append(self, token, message):
+        """Add one message dict to a session's chat"""
+        with self._lock:
+            self._queued(token).messages.append(message)
+
+    def reset_messages(self, token):
+        """Forget a session's stored chat"""
+        with self._lock:
+            update = self._queued(token)
+            update.messages = []
+            update.reset_messages = True
+
+    def delete(self, token):
+        """Forget a session entirely"""
+        with self._lock:
+            self._queued(token).delete()
+
+    def flush(self):
+        """Apply every queued write now; return the number of sessions written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            start = time.perf_counter()
+            try:
+                self.store.apply(batch)
+            except Exception:
+                REGISTRY.inc('pdfchat_session_write_errors_total')
+                self._requeue(batch)
+                return 0
+            REGISTRY.observe('pdfchat_session_flush_seconds', time.perf_counter() - start)
+            REGISTRY.inc('pdfchat_session_writes_total', len(batch))
+            return len(batch)
+
+    def _queued(self, token):
+        update = self._pending.get(token)
+        if update is None:
+            update = self._pending[token] = SessionUpdate()
+        return update
+
+    def _requeue(self, batch):
+        """Put a failed batch back in front of the writes queued since"""
+        with self._lock:
+            for token, newer in self._pending.items():
+                if token in batch:
+                    batch[token].merge(newer)
+                else:
+                    batch[token] = newer
+            self._pending = batch
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_sec)
+            self.flush()
+
+
+def open_session_store():
+    """The SessionStore selected by PDF_CHAT_SESSION_STORE, or None if disabled"""
+    if settings.SESSION_STORE == SqliteSessionStore.name:
+        return SqliteSessionStore(settings.SESSION_DB_PATH, settings.SESSION_TTL_SEC)
+    if settings.SESSION_STORE == RedisSessionStore.name:
+        return RedisSessionStore(settings.SESSION_REDIS_URL, settings.SESSION_TTL_SEC)
+    if settings.SESSION_STORE in ('', 'none'):
+        return None
+    raise ValueError(f"Unknown session store: {settings.SESSION_STORE}")
@@ -0,0 +1,118 @@
+"""Runtime settings read from environment variables"""
+import os
+from pathlib import Path
+
+# Directory for local state shared by every session of this deployment
+DATA_DIR = Path(os.getenv('PDF_CHAT_DATA_DIR', str(Path.home() / '.pdf-chat-gemini')))
+
+# Content-hash index of File Search Stores (see pdfchat.store_index)
+STORE_INDEX_PATH = Path(os.getenv('PDF_CHAT_STORE_INDEX', str(DATA_DIR / 'store_index.sqlite3')))
+
+# Worker processes for PDF text extraction; 0 extracts on the calling thread
+EXTRACT_WORKERS = int(os.getenv('PDF_CHAT_EXTRACT_WORKERS', '0'))
+
+# Operation polling: first delay, growth factor and cap, in seconds
+POLL_INITIAL_SEC = float(os.getenv('PDF_CHAT_POLL_INITIAL_SEC', '1'))
+POLL_BACKOFF = float(os.getenv('PDF_CHAT_POLL_BACKOFF', '2'))
+POLL_MAX_SEC = float(os.getenv('PDF_CHAT_POLL_MAX_SEC', '15'))
+
+# Background ingestion jobs shared by all sessions
+INGEST_WORKERS = int(os.getenv('PDF_CHAT_INGEST_WORKERS', '4'))
+UPLOAD_CONCURRENCY = int(os.getenv('PDF_CHAT_UPLOAD_CONCURRENCY', '4'))
+# PDFs larger than this are split into page-range parts uploaded in parallel
+# (0 never splits); failed uploads of a file or part are retried this often
+UPLOAD_PART_MB = float(os.getenv('PDF_CHAT_UPLOAD_PART_MB', '10'))
+UPLOAD_RETRIES = int(os.getenv('PDF_CHAT_UPLOAD_RETRIES', '2'))
+JOB_STATUS_POLL_SEC = float(os.getenv('PDF_CHAT_JOB_STATUS_POLL_SEC', '1'))
+
+# Store garbage collection (see pdfchat.lifecycle): unused age and time stuck
+# creating/uploading after which a store is deleted, how often the reaper runs
+# (0 disables it), deletions in parallel, stores per run and retries per store
+STORE_TTL_SEC = float(os.getenv('PDF_CHAT_STORE_TTL_SEC', str(24 * 3600)))
+STORE_STUCK_SEC = float(os.getenv('PDF_CHAT_STORE_STUCK_SEC', '3600'))
+REAPER_INTERVAL_SEC = float(os.getenv('PDF_CHAT_REAPER_INTERVAL_SEC', '600'))
+REAPER_CONCURRENCY = int(os.getenv('PDF_CHAT_REAPER_CONCURRENCY', '4'))
+REAPER_BATCH_SIZE = int(os.getenv('PDF_CHAT_REAPER_BATCH_SIZE', '50'))
+REAPER_RETRIES = int(os.getenv('PDF_CHAT_REAPER_RETRIES', '3'))
+
+# Shared Gemini clients (see pdfchat.clients): connections per client, request
+# timeout, idle time before a client is closed, and keep-alive of idle connections
+CLIENT_POOL_SIZE = int(os.getenv('PDF_CHAT_CLIENT_POOL_SIZE', '10'))
+CLIENT_TIMEOUT_SEC = float(os.getenv('PDF_CHAT_CLIENT_TIMEOUT_SEC', '120'))
+CLIENT_IDLE_TTL_SEC = float(os.getenv('PDF_CHAT_CLIENT_IDLE_TTL_SEC', '1800'))
+CLIENT_KEEPALIVE_SEC = float(os.getenv('PDF_CHAT_CLIENT_KEEPALIVE_SEC', '60'))
+
+# Model used when a request does not name one
+DEFAULT_MODEL = os.getenv('PDF_CHAT_DEFAULT_MODEL', 'gemini-2.5-flash')
+
+# Default retrieval backend: 'auto', 'file_search', 'context_cache' or 'local'
+# (see pdfchat.retrieval)
+RETRIEVAL_BACKEND = os.getenv('PDF_CHAT_RETRIEVAL_BACKEND', 'auto')
+
+# Direct context: 'auto' sends collections up to this many pages and estimated
+# tokens to a cached context instead of File Search. Caches live for the TTL
+# after their last use; text below the minimum cache size is sent inline.
+DIRECT_MAX_PAGES = int(os.getenv('PDF_CHAT_DIRECT_MAX_PAGES', '30'))
+DIRECT_MAX_TOKENS = int(os.getenv('PDF_CHAT_DIRECT_MAX_TOKENS', '100000'))
+# Documents with less extracted text per page (scans) go to File Search
+DIRECT_MIN_TOKENS_PER_PAGE = int(os.getenv('PDF_CHAT_DIRECT_MIN_TOKENS_PER_PAGE', '20'))
+CONTEXT_CACHE_TTL_SEC = int(os.getenv('PDF_CHAT_CONTEXT_CACHE_TTL_SEC', '3600'))
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv('PDF_CHAT_CONTEXT_CACHE_MIN_TOKENS', '4096'))
+
+LOCAL_TOP_K = int(os.getenv('PDF_CHAT_LOCAL_TOP_K', '5'))
+
+# Model call scheduling (see pdfchat.scheduler): concurrent calls and tokens
+# per minute allowed per API key (0 = no token budget), and retries of
+# rate-limited (429) calls with jittered exponential backoff from BACKOFF_SEC
+# up to BACKOFF_MAX_SEC
+SCHEDULER_MAX_CONCURRENT = int(os.getenv('PDF_CHAT_SCHEDULER_MAX_CONCURRENT', '16'))
+SCHEDULER_TOKENS_PER_MINUTE = int(os.getenv('PDF_CHAT_SCHEDULER_TOKENS_PER_MINUTE', '0'))
+RATE_LIMIT_RETRIES = int(os.getenv('PDF_CHAT_RATE_LIMIT_RETRIES', '4'))
+RATE_LIMIT_BACKOFF_SEC = float(os.getenv('PDF_CHAT_RATE_LIMIT_BACKOFF_SEC', '1'))
+RATE_LIMIT_BACKOFF_MAX_SEC = float(os.getenv('PDF_CHAT_RATE_LIMIT_BACKOFF_MAX_SEC', '30'))
+
+# Speculative answers to the suggested questions once a collection is ready
+# (see pdfchat.prefetch): on/off and questions answered in parallel
+PREFETCH_SUGGESTIONS = os.getenv('PDF_CHAT_PREFETCH_SUGGESTIONS', '1') == '1'
+PREFETCH_WORKERS = int(os.getenv('PDF_CHAT_PREFETCH_WORKERS', '4'))
+
+# Answer cache (see pdfchat.answer_cache)
+ANSWER_CACHE_PATH = Path(os.getenv('PDF_CHAT_ANSWER_CACHE', str(DATA_DIR / 'answer_cache.sqlite3')))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('PDF_CHAT_ANSWER_CACHE_MAX_ENTRIES', '1000'))
+ANSWER_CACHE_TTL_SEC = int(os.getenv('PDF_CHAT_ANSWER_CACHE_TTL_SEC', str(24 * 3600)))
+
+# Chat history: turns shown before "load older", messages kept in memory per
+# session before older ones spill to disk (0 keeps everything in memory)
+CHAT_WINDOW_TURNS = int(os.getenv('PDF_CHAT_CHAT_WINDOW_TURNS', '20'))
+CHAT_MEMORY_MESSAGES = int(os.getenv('PDF_CHAT_CHAT_MEMORY_MESSAGES', '200'))
+CHAT_SPILL_DIR = Path(os.getenv('PDF_CHAT_CHAT_SPILL_DIR', str(DATA_DIR / 'history')))
+
+# Session state shared by replicas so sessions resume after restarts and on
+# any replica (see pdfchat.sessions): 'sqlite', 'redis' or 'none'; the SQLite
+# file or Redis URL; idle time after which a session expires (by default when
+# its store would be reaped) and the write-behind flush interval
+SESSION_STORE = os.getenv('PDF_CHAT_SESSION_STORE', 'sqlite')
+SESSION_DB_PATH = Path(os.getenv('PDF_CHAT_SESSION_DB', str(DATA_DIR / 'sessions.sqlite3')))
+SESSION_REDIS_URL = os.getenv('PDF_CHAT_SESSION_REDIS_URL', 'redis://localhost:6379/0')
+SESSION_TTL_SEC = float(os.getenv('PDF_CHAT_SESSION_TTL_SEC', str(STORE_TTL_SEC)))
+SESSION_FLUSH_SEC = float(os.getenv('PDF_CHAT_SESSION_FLUSH_SEC', '0.5'))
+
+# Metrics: Prometheus endpoint port and JSON-lines log path; unset disables each
+METRICS_PORT = os.getenv('PDF_CHAT_METRICS_PORT')
+METRICS_LOG = os.getenv('PDF_CHAT_METRICS_LOG')
+
+# Chunking used when indexing documents; unset means the File Search default
+MAX_TOKENS_PER_CHUNK = os.getenv('PDF_CHAT_MAX_TOKENS_PER_CHUNK')
+MAX_OVERLAP_TOKENS = os.getenv('PDF_CHAT_MAX_OVERLAP_TOKENS')
+
+
+def get_chunking_config():
+    """Return the File Search chunking config, or None for the service default"""
+    if not MAX_TOKENS_PER_CHUNK:
+        return None
+    return {
+        'white_space_config': {
+            'max_tokens_per_chunk': int(MAX_TOKENS_PER_CHUNK),
+            'max_overlap_tokens': int(MAX_OVERLAP_TOKENS or 0)
+        }
+    }
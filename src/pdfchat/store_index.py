@@ -0,0 +1,150 @@
+"""Content-addressed index of File Search Stores shared across sessions
+
+Identical PDFs or collections (same bytes, model and chunking settings) map to
+one store, so a repeated upload can attach to the existing store instead of
+re-indexing. Stores belong to the project of the API key that created them,
+so the key's hash is part of the content key: uploads with another key get
+their own store. Each session holding a store counts as one reference; the store
+is only safe to delete once the last reference is released.
+"""
+import hashlib
+import json
+import time
+from pathlib import Path
+
+from .db import transaction
+from .pdf import SPOOL_CHUNK_BYTES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stores (
+    content_key TEXT PRIMARY KEY,
+    store_name TEXT NOT NULL UNIQUE,
+    display_name TEXT,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+)
+"""
+
+
+def _sha256(source):
+    """SHA-256 of raw bytes or of a file's contents, read in chunks"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source)
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(SPOOL_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest
+
+
+def compute_content_key(data, model, chunking_config=None, project=None):
+    """Hash PDF bytes (or a PDF file) together with the settings that affect indexing
+
+    ``project`` identifies who can see the resulting store, e.g. the hash of
+    the API key (clients.hash_api_key).
+    """
+    digest = _sha256(data)
+    settings = json.dumps({'model': model, 'chunking': chunking_config, 'project': project}, sort_keys=True)
+    digest.update(settings.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def compute_collection_key(datas, model, chunking_config=None, project=None):
+    """Hash a set of PDFs (bytes or paths), independent of order, with the indexing settings
+
+    A single document gets the same key as compute_content_key so stores
+    indexed before collections existed are still found.
+    """
+    if len(datas) == 1:
+        return compute_content_key(datas[0], model, chunking_config, project)
+    digests = sorted(_sha256(data).hexdigest() for data in datas)
+    return compute_content_key('\n'.join(digests).encode('ascii'), model, chunking_config, project)
+
+
+class StoreIndex:
+    """SQLite-backed, reference-counted map of content keys to store names"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    def _connect(self):
+        return transaction(self.db_path)
+
+    def acquire(self, content_key):
+        """Take a reference to the store for content_key, or return None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT store_name FROM stores WHERE content_key = ?', (content_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                'UPDATE stores SET ref_count = ref_count + 1, last_used_at = ? WHERE content_key = ?',
+                (time.time(), content_key)
+            )
+            return row[0]
+
+    def register(self, content_key, store_name, display_name=None):
+        """Record a newly created store holding one reference
+
+        Returns the store name that now owns content_key. If another session
+        registered the same content first, its store wins and a reference to it
+        is taken instead; the caller should then delete its own duplicate.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO stores VALUES (?, ?, ?, 0, ?, ?)',
+                (content_key, store_name, display_name, now, now)
+            )
+            conn.execute(
+                'UPDATE stores SET ref_count = ref_count + 1, last_used_at = ? WHERE content_key = ?',
+                (now, content_key)
+            )
+            row = conn.execute(
+                'SELECT store_name FROM stores WHERE content_key = ?', (content_key,)
+            ).fetchone()
+            return row[0]
+
+    def release(self, store_name):
+        """Drop one reference and return how many remain
+
+        Returns None if the store is not tracked by the index. When the count
+        reaches zero the entry is removed and the caller owns the deletion.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT ref_count FROM stores WHERE store_name = ?', (store_name,)
+            ).fetchone()
+            if row is None:
+                return None
+            remaining = max(row[0] - 1, 0)
+            if remaining == 0:
+                conn.execute('DELETE FROM stores WHERE store_name = ?', (store_name,))
+            else:
+                conn.execute(
+                    'UPDATE stores SET ref_count = ? WHERE store_name = ?',
+                    (remaining, store_name)
+                )
+            return remaining
+
+    def references(self, store_name):
+        """How many sessions hold the store; 0 if it is not tracked"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT ref_count FROM stores WHERE store_name = ?', (store_name,)
+            ).fetchone()
+            return row[0] if row else 0
+
+    def forget(self, store_name):
+        """Remove an entry whose store no longer exists remotely
+
+        Only call this after the store's own project (a client with the key in
+        its content key) failed to find it; other keys cannot see it anyway.
+        """
+        with self._connect() as conn:
+            conn.execute('DELETE FROM stores WHERE store_name = ?', (store_name,))
+
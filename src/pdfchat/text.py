@@ -0,0 +1,105 @@
+"""User-facing text and formatting helpers"""
+
+APP_TEXT = {
+    'page_title': 'PDF Chat with Gemini AI',
+    'page_icon': '📚',
+    'main_title': '📚 Intelligent PDF Chat Assistant',
+    'subtitle': "Powered by Google's Gemini AI - Upload any PDF and have an intelligent conversation about its content",
+    'model': 'AI Model',
+    'api_key_label': 'Enter your Gemini API Key',
+    'api_key_help': 'Get your free API key from https://makersuite.google.com/app/apikey',
+    'api_key_warning': 'Security Notice',
+    'api_key_warning_text': 'Your API key is stored only in your browser session and is never saved or shared. Keep your API key private.',
+    'api_key_required': 'Please enter your Gemini API key in the sidebar to get started',
+    'sidebar_header': 'Document Upload',
+    'choose_file': 'Choose one or more PDF files',
+    'processing': 'Processing your document...',
+    'ingest_progress': '{} ({:.0f}s)',
+    'stage_queued': 'Waiting for a free worker...',
+    'stage_extracting': 'Reading PDF...',
+    'stage_saving': 'Preparing upload...',
+    'stage_splitting': 'Splitting into parts...',
+    'stage_retrying': 'Upload failed, retrying...',
+    'stage_caching': 'Caching document context...',
+    'stage_creating_store': 'Creating search store...',
+    'stage_uploading': 'Uploading document...',
+    'stage_indexing': 'Indexing document...',
+    'stage_done': 'Indexed',
+    'stage_failed': 'Failed',
+    'upload_success': 'Successfully uploaded: {}',
+    'upload_partial': 'Some documents could not be indexed and were skipped: {}',
+    'upload_parts_failed': '{}: pages {} could not be indexed',
+    'part_pages': '{} (pages {}-{})',
+    'upload_reused': 'Already indexed, reusing existing store: {}',
+    'session_resumed': 'Resumed your previous session: {}',
+    'session_resumed_reupload': 'Resumed your previous chat. {} is no longer loaded here; upload it again to keep asking.',
+    'current_pdf': 'Current Documents:',
+    'clear_button': 'Clear Document & Start Over',
+    'about_header': 'About This App',
+    'about_text': "This intelligent assistant uses Google's Gemini AI with advanced File Search capabilities to help you explore and understand your PDF documents through natural conversation.",
+    'upload_prompt': 'Upload a PDF file from the sidebar to begin your intelligent conversation',
+    'chat_input': 'Ask me anything about your document...',
+    'thinking': 'Analyzing...',
+    'view_sources': 'View Source References',
+    'stream_responses': 'Stream responses',
+    'retrieval_backend': 'Retrieval',
+    'retrieval_backend_help': 'Automatic caches short documents whole and uses File Search for long ones; File Search indexes the document with Gemini; Direct context sends the whole document from a cache; Local searches the extracted text in-process and is ready instantly',
+    'backend_auto': 'Automatic',
+    'backend_context_cache': 'Direct context (cached)',
+    'backend_file_search': 'Gemini File Search',
+    'backend_local': 'Local (BM25)',
+    'answer_timing': 'First token {:.1f}s · Total {:.1f}s',
+    'answer_latency': 'Total {:.1f}s',
+    'cached_answer': '⚡ Cached answer',
+    'cache_hits': 'Cache Hits',
+    'median_latency': 'Median Latency',
+    'tokens_used': 'Tokens Used',
+    'latency_details': 'Latency & Token Details',
+    'latency_percentiles': 'Answer latency p50 {:.1f}s · p95 {:.1f}s · p99 {:.1f}s',
+    'ttft_median': 'Median time to first token {:.1f}s',
+    'token_breakdown': 'Prompt tokens {:,} · Output tokens {:,}',
+    'cache_hit_rate': '{:.0%} hit rate · {} API calls saved',
+    'error_response': "I couldn't generate a response. Please try rephrasing your question.",
+    'footer': 'Built with Streamlit and Google Gemini AI',
+    'error_api_key': 'API key is required.',
+    'error_pdf_extract': 'Error extracting text from PDF: {}',
+    'error_save_file': 'Error saving file: {}',
+    'error_create_store': 'Error creating file search store: {}',
+    'error_upload_store': 'Error uploading file to store: {}',
+    'error_split_pdf': 'Error splitting {} into parts: {}',
+    'error_query': 'Error querying file search: {}',
+    'error_rate_limited': 'The Gemini API is rate limiting this API key. Please wait a moment and ask again.',
+    'error_cleanup': 'Error cleaning up store: {}',
+    'error_create_cache': 'Error caching document context: {}',
+    'error_extend_cache': 'Could not extend the cached document context: {}',
+    'error_interrupted': 'The answer to this question was interrupted. Please ask again.',
+    'error_check_reuse': 'Could not check the previously indexed copy of these documents: {}',
+    'pdf_info': 'Document Information',
+    'pages': 'Pages',
+    'file_size': 'File Size',
+    'uploaded_at': 'Uploaded',
+    'export_chat': 'Export Chat History',
+    'clear_chat': 'Clear Chat History',
+    'suggested_questions': 'Suggested Questions',
+    'stats_header': 'Session Statistics',
+    'total_questions': 'Questions Asked',
+    'history_hidden': '🗂️ {} earlier messages',
+    'history_more': '…and {} older messages',
+    'load_older': '⬆️ Load older messages',
+    'copy_response': 'Copy',
+    'copied': 'Copied!'
+}
+
+
+def get_text(key):
+    """Get text for the given key"""
+    return APP_TEXT.get(key, key)
+
+
+def format_file_size(size_bytes):
+    """Format file size in human-readable format"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_bytes < 1024.0:
+            return f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024.0
+    return f"{size_bytes:.1f} TB"
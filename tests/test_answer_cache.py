@@ -0,0 +1,66 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.answer_cache import AnswerCache  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def _cache(tmp_path, monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr('pdfchat.answer_cache.time', SimpleNamespace(time=clock.time))
+    return AnswerCache(tmp_path / 'answers.sqlite3', **kwargs), clock
+
+
+def test_question_variants_share_an_entry(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    cache.put('store', 'model', 'What is this?', 'A report', {'retrieved_passages': []})
+
+    assert cache.get('store', 'model', '  what IS this ') == {
+        'text': 'A report', 'grounding_metadata': {'retrieved_passages': []}
+    }
+    assert cache.get('store', 'other-model', 'What is this?') is None
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, ttl_sec=60)
+    cache.put('store', 'model', 'Old?', 'old answer')
+
+    clock.now += 30
+    assert cache.get('store', 'model', 'Old?')['text'] == 'old answer'
+    clock.now += 31
+    assert cache.get('store', 'model', 'Old?') is None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, max_entries=2)
+    cache.put('store', 'model', 'First?', '1')
+    clock.now += 1
+    cache.put('store', 'model', 'Second?', '2')
+    clock.now += 1
+    cache.get('store', 'model', 'First?')
+    clock.now += 1
+    cache.put('store', 'model', 'Third?', '3')
+
+    assert cache.get('store', 'model', 'Second?') is None
+    assert cache.get('store', 'model', 'First?')['text'] == '1'
+    assert cache.get('store', 'model', 'Third?')['text'] == '3'
+
+
+def test_invalidate_store_drops_only_its_answers(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    cache.put('store', 'model', 'Q?', 'a')
+    cache.put('other', 'model', 'Q?', 'b')
+
+    cache.invalidate_store('store')
+    assert cache.get('store', 'model', 'Q?') is None
+    assert cache.get('other', 'model', 'Q?')['text'] == 'b'
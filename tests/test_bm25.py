@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.bm25 import Bm25Index, chunk_pages  # noqa: E402
+
+
+def test_chunks_stay_on_their_page():
+    chunks = chunk_pages(['one two three four five', 'six seven'], chunk_words=3, overlap_words=1, source='a.pdf')
+
+    assert chunks == [
+        ('a.pdf', 1, 'one two three'),
+        ('a.pdf', 1, 'three four five'),
+        ('a.pdf', 2, 'six seven'),
+    ]
+
+
+def test_rare_matching_terms_rank_first():
+    index = Bm25Index([
+        ('a.pdf', 1, 'the quarterly revenue grew in every region'),
+        ('a.pdf', 2, 'the the the the the the'),
+        ('a.pdf', 3, 'revenue revenue of the subsidiary'),
+        ('a.pdf', 4, 'staff headcount and office locations'),
+    ])
+
+    results = index.search('Subsidiary revenue?', top_k=3)
+    assert [page for _, _, page, _ in results] == [3, 1]
+    assert results[0][0] > results[1][0] > 0
+    assert index.search('unknown words') == []
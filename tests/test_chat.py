@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime  # noqa: E402
+
+from pdfchat.chat import export_chat_history  # noqa: E402
+from pdfchat.history import ChatHistory  # noqa: E402
+
+
+def test_export_is_accepted_by_download_button(tmp_path):
+    history = ChatHistory(tmp_path / 'spill.jsonl', keep_in_memory=2)
+    sources = [{'document': 'report.pdf', 'page': 3, 'chunk': 'A passage'}]
+    for i in range(3):
+        history.append('user', f'Question {i}?')
+        history.append('assistant', f'Answer {i}', sources=sources)
+
+    data, _ = convert_data_to_bytes_and_infer_mime(
+        export_chat_history(history), unsupported_error=TypeError('unsupported export type')
+    )
+
+    lines = data.decode('utf-8').splitlines()
+    assert len(lines) == 7
+    assert lines[0].startswith('{"exported_at"')
+    assert lines[2] == '{"role":"assistant","content":"Answer 0","sources":[{"document":"report.pdf","page":3,"chunk":"A passage"}]}'
@@ -0,0 +1,30 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import fake_gemini  # noqa: E402
+
+from pdfchat.clients import ClientRegistry  # noqa: E402
+
+
+def test_leased_client_is_not_evicted(monkeypatch):
+    monkeypatch.setattr('google.genai.Client', fake_gemini.FakeClient)
+    closed = []
+    monkeypatch.setattr(fake_gemini.FakeClient, 'close', lambda self: closed.append(self), raising=False)
+    registry = ClientRegistry(idle_ttl_sec=0.05)
+    busy = registry.get('busy-key')
+    idle = registry.get('idle-key')
+
+    with registry.lease(busy):
+        time.sleep(0.1)
+        registry.get('other-key')
+        assert closed == [idle]
+        assert registry.stats()['leased'] == 1
+
+    assert registry.get('busy-key') is busy
+    time.sleep(0.1)
+    registry.get('other-key')
+    assert busy in closed
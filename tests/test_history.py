@@ -0,0 +1,42 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.history import ChatHistory  # noqa: E402
+
+
+def _history(tmp_path, count):
+    history = ChatHistory(tmp_path / 'spill' / 'session.jsonl', keep_in_memory=4)
+    for i in range(count):
+        history.append('user' if i % 2 == 0 else 'assistant', f'message {i}', latency=i / 10)
+    return history
+
+
+def test_older_messages_spill_to_disk_and_read_back_in_order(tmp_path):
+    history = _history(tmp_path, 11)
+
+    assert len(history._recent) <= 4
+    assert (tmp_path / 'spill' / 'session.jsonl').exists()
+    assert len(history) == 11
+    assert [m.content for m in history] == [f'message {i}' for i in range(11)]
+    assert history[0].role == 'user' and history[3].latency == 0.3
+    assert history[-1].content == 'message 10'
+    assert [m.content for m in history.slice(2, 7)] == [f'message {i}' for i in range(2, 7)]
+
+
+def test_reloaded_dicts_rebuild_the_same_history(tmp_path):
+    history = _history(tmp_path, 9)
+    copy = ChatHistory(tmp_path / 'spill' / 'copy.jsonl', keep_in_memory=4)
+    for data in history.to_dicts():
+        copy.append(data.pop('role'), data.pop('content'), **data)
+
+    assert copy.to_dicts() == history.to_dicts()
+
+
+def test_clear_removes_the_spill_file(tmp_path):
+    history = _history(tmp_path, 11)
+    history.clear()
+
+    assert len(history) == 0 and not history
+    assert not (tmp_path / 'spill' / 'session.jsonl').exists()
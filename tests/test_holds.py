@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.holds import HoldRegistry  # noqa: E402
+from pdfchat.lifecycle import Owner  # noqa: E402
+
+
+def test_transferred_holds_are_released_by_the_new_owner_only(tmp_path):
+    holds = HoldRegistry(tmp_path / 'index.sqlite3')
+    old, new = Owner('old-token', 'key'), Owner('new-token', 'key')
+    holds.add('stores/a', old)
+    holds.add('stores/a', old)
+    holds.add('stores/a', new)
+
+    holds.transfer(old, new)
+
+    assert not holds.remove('stores/a', old)
+    assert [holds.remove('stores/a', new) for _ in range(4)] == [True, True, True, False]
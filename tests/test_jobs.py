@@ -0,0 +1,53 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.jobs import JobManager  # noqa: E402
+from pdfchat.report import report_warning  # noqa: E402
+
+
+def _wait(job):
+    deadline = time.time() + 5
+    while not job.done and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_runs_through_its_stages_to_done():
+    jobs = JobManager(1)
+    proceed = threading.Event()
+
+    def work(job):
+        job.set_stage('uploading')
+        job.set_stage('done', 'a.pdf')
+        report_warning('slow upload')
+        proceed.wait(5)
+        return {'handle': 'stores/a'}
+
+    job = jobs.get(jobs.submit(work))
+    time.sleep(0.1)
+    assert job.status == 'running' and not job.done
+    assert job.stage == 'uploading' and job.items == {'a.pdf': 'done'}
+    proceed.set()
+
+    _wait(job)
+    assert job.status == 'done' and job.result == {'handle': 'stores/a'}
+    assert job.messages == [('warning', 'slow upload')]
+    assert job.finished_at >= job.started_at
+    assert jobs.pop(job.id) is job and jobs.get(job.id) is None
+
+
+def test_falsy_result_or_exception_fails_the_job():
+    jobs = JobManager(2)
+
+    def fail(job):
+        raise RuntimeError('store quota exceeded')
+
+    empty = _wait(jobs.get(jobs.submit(lambda job: None)))
+    broken = _wait(jobs.get(jobs.submit(fail)))
+
+    assert empty.status == 'failed' and empty.finished_at is not None
+    assert broken.status == 'failed' and broken.messages == [('error', 'store quota exceeded')]
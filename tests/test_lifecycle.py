@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.lifecycle import READY, StoreRegistry, StoreReaper  # noqa: E402
+from pdfchat.store_index import StoreIndex  # noqa: E402
+
+
+class Client:
+    def __init__(self):
+        self.deleted = []
+        self.file_search_stores = SimpleNamespace(delete=lambda name, config: self.deleted.append(name))
+
+
+def test_expired_store_still_referenced_is_kept_and_its_ttl_restarts(tmp_path):
+    registry = StoreRegistry(tmp_path / 'index.sqlite3')
+    index = StoreIndex(tmp_path / 'index.sqlite3')
+    for name in ('stores/held', 'stores/released'):
+        registry.record(name, name, state=READY)
+        index.register(name, name)
+    index.release('stores/released')
+    client = Client()
+    reaper = StoreReaper(registry, lambda key_hash: client, 0, 3600, references=index.references)
+    time.sleep(0.01)
+
+    report = reaper.run_once()
+
+    assert client.deleted == ['stores/released']
+    assert report['skipped'] == ['stores/held']
+    reaper.ttl_sec = 60
+    assert registry.candidates(reaper.ttl_sec, reaper.stuck_sec) == []
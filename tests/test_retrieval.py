@@ -0,0 +1,100 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import fake_gemini  # noqa: E402
+from synthetic_pdf import make_pdf  # noqa: E402
+
+from pdfchat.clients import hash_api_key  # noqa: E402
+from pdfchat.lifecycle import Owner  # noqa: E402
+from pdfchat.retrieval import AutoBackend, Document, FileSearchBackend  # noqa: E402
+from pdfchat.store_index import StoreIndex  # noqa: E402
+
+
+def _document(tmp_path, name, **kwargs):
+    path = tmp_path / name
+    path.write_bytes(make_pdf(5, **kwargs))
+    return Document(name, str(path), path.stat().st_size, None)
+
+
+def test_short_scan_goes_to_large_backend(tmp_path):
+    auto = AutoBackend('small', 'large')
+    text = _document(tmp_path, 'text.pdf')
+    scan = _document(tmp_path, 'scan.pdf', words_per_page=0, image_kb=4)
+
+    assert auto.choose([text])[0] == 'small'
+    assert auto.choose([scan])[0] == 'large'
+    assert auto.choose([text, scan])[0] == 'large'
+
+
+def _fast_client():
+    fake_gemini.configure(**{key: 0 for key in ('connect', 'create_store', 'upload', 'indexing', 'poll', 'get', 'delete')})
+    try:
+        return fake_gemini.FakeClient(api_key='key')
+    finally:
+        fake_gemini.configure()
+
+
+def test_store_survives_a_transient_error_while_checking_reuse(tmp_path):
+    client = _fast_client()
+    index = StoreIndex(tmp_path / 'index.sqlite3')
+    backend = FileSearchBackend(index)
+    owner = Owner('session', hash_api_key('key'))
+    documents = [_document(tmp_path, 'report.pdf')]
+    first = backend.ingest(client, documents, 'model', owner=owner)
+
+    def unavailable(name=None, config=None):
+        raise fake_gemini.FakeAPIError('503 UNAVAILABLE: simulated outage')
+
+    client.file_search_stores.get = unavailable
+    assert backend.ingest(client, documents, 'model', owner=owner) is None
+    assert index.release(first.handle) == 0
+    assert len(client.file_search_stores._stores) == 1
+
+
+def test_store_with_a_partly_uploaded_document_is_not_reused(tmp_path):
+    client = _fast_client()
+    stores = client.file_search_stores
+    upload = stores.upload_to_file_search_store
+
+    def first_part_only_of_large_files(file=None, file_search_store_name=None, config=None):
+        if '(pages' in config['display_name'] and '(pages 1-' not in config['display_name']:
+            raise fake_gemini.FakeAPIError('500 INTERNAL: simulated upload failure')
+        return upload(file, file_search_store_name, config)
+
+    stores.upload_to_file_search_store = first_part_only_of_large_files
+    backend = FileSearchBackend(StoreIndex(tmp_path / 'index.sqlite3'), max_part_bytes=8192, upload_retries=0)
+    owner = Owner('session', hash_api_key('key'))
+    documents = [_document(tmp_path, 'report.pdf', words_per_page=20), _document(tmp_path, 'large.pdf')]
+
+    first = backend.ingest(client, documents, 'model', owner=owner)
+    assert first.failed == ['large.pdf']
+    second = backend.ingest(client, documents, 'model', owner=owner)
+    assert not second.reused and second.handle != first.handle
+
+
+def test_document_that_fails_to_split_midway_keeps_its_store_private(tmp_path, monkeypatch):
+    client = _fast_client()
+    backend = FileSearchBackend(StoreIndex(tmp_path / 'index.sqlite3'), max_part_bytes=8192, upload_retries=0)
+    split = backend._parts
+
+    def split_then_fail(document, progress):
+        parts = split(document, progress)
+        if document.name != 'large.pdf':
+            yield from parts
+            return
+        yield next(parts)
+        yield next(parts)
+        raise ValueError('damaged page')
+
+    report = _document(tmp_path, 'report.pdf', words_per_page=20)
+    first = backend.ingest(client, [report], 'model')
+    monkeypatch.setattr(backend, '_parts', split_then_fail)
+
+    result = backend.ingest(client, [_document(tmp_path, 'large.pdf'), report], 'model')
+    assert result.failed == ['large.pdf'] and not result.reused
+    assert result.handle != first.handle
+    monkeypatch.undo()
+    assert backend.ingest(client, [report], 'model').handle == first.handle
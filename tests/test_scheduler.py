@@ -0,0 +1,36 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat import scheduler  # noqa: E402
+from pdfchat.scheduler import QueryScheduler  # noqa: E402
+
+
+class Client:
+    """Stands in for a Gemini client; the scheduler keys its state by object"""
+
+
+def test_waiter_behind_full_slot_is_admitted_when_the_token_budget_frees_up(monkeypatch):
+    monkeypatch.setattr(scheduler, 'WINDOW_SEC', 1)
+    queries = QueryScheduler(max_concurrent=1, tokens_per_minute=100)
+    client = Client()
+    admitted = threading.Event()
+
+    def second_call():
+        with queries.slot(client, 'b', 50):
+            admitted.set()
+
+    with queries.slot(client, 'a', 80):
+        thread = threading.Thread(target=second_call, daemon=True)
+        thread.start()
+        time.sleep(0.1)
+        assert queries.stats() == {'waiting': 1, 'active': 1}
+
+    # The budget is used up until the first call's tokens leave the window
+    assert not admitted.wait(0.5)
+    assert admitted.wait(2)
+    thread.join(1)
+    assert queries.stats() == {'waiting': 0, 'active': 0}
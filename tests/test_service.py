@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.answer_cache import AnswerCache  # noqa: E402
+from pdfchat.prefetch import Prefetcher  # noqa: E402
+from pdfchat.report import capture_messages  # noqa: E402
+from pdfchat.retrieval import RetrievalRequest  # noqa: E402
+from pdfchat.service import ChatService  # noqa: E402
+
+
+class Backend:
+    name = 'test'
+
+    def keep_alive(self, client, handle):
+        pass
+
+    def build_request(self, handle, question):
+        return RetrievalRequest(question, None, None)
+
+
+class Client:
+    """Streams a fixed answer, holding the second chunk until released"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self.models = SimpleNamespace(generate_content_stream=self._stream)
+
+    def _stream(self, model, contents, config):
+        self.calls += 1
+        yield SimpleNamespace(text='Prefetched ', candidates=[], usage_metadata=None)
+        self.release.wait(5)
+        yield SimpleNamespace(text='answer', candidates=[], usage_metadata=None)
+
+
+def test_question_follows_its_streaming_prefetch(tmp_path):
+    service = ChatService(
+        {Backend.name: Backend()}, None, AnswerCache(tmp_path / 'answers.db'), prefetcher=Prefetcher(1)
+    )
+    client = Client()
+    service.prefetch(client, Backend.name, 'store', 'model', ['What is this?'])
+    while not client.calls:
+        time.sleep(0.01)
+
+    answer = {}
+    chunks = service.stream_answer(client, Backend.name, 'store', 'model', 'What is this?', answer)
+    start = time.perf_counter()
+    assert next(chunks) == 'Prefetched '
+    assert time.perf_counter() - start < 1
+    client.release.set()
+    assert list(chunks) == ['answer']
+
+    assert answer['text'] == 'Prefetched answer'
+    assert client.calls == 1
+
+
+class FlakyClient:
+    """Fails its first stream once released; later streams answer at once"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self.models = SimpleNamespace(generate_content_stream=self._stream)
+
+    def _stream(self, model, contents, config):
+        self.calls += 1
+        if self.calls == 1:
+            self.release.wait(5)
+            raise RuntimeError('500 INTERNAL: simulated failure')
+        yield SimpleNamespace(text='Fresh answer', candidates=[], usage_metadata=None)
+
+
+def _service(tmp_path):
+    return ChatService({Backend.name: Backend()}, None, AnswerCache(tmp_path / 'answers.db'))
+
+
+def _ask(service, client, answer, messages):
+    with capture_messages(lambda level, message: messages.append(message)):
+        return list(service.stream_answer(client, Backend.name, 'store', 'model', 'Why?', answer))
+
+
+def test_follower_asks_again_when_the_leader_fails_before_any_text(tmp_path):
+    service = _service(tmp_path)
+    client = FlakyClient()
+    leader_answer, leader_messages = {}, []
+    leader = threading.Thread(target=_ask, args=(service, client, leader_answer, leader_messages))
+    leader.start()
+    while not client.calls:
+        time.sleep(0.01)
+
+    answer, messages = {}, []
+    follower = threading.Thread(target=_ask, args=(service, client, answer, messages))
+    follower.start()
+    time.sleep(0.1)
+    client.release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert leader_answer['error'] and leader_messages
+    assert answer['text'] == 'Fresh answer' and not messages
+    assert client.calls == 2
+
+
+def test_follower_reports_an_answer_cut_off_midway(tmp_path):
+    service = _service(tmp_path)
+    client = Client()
+    leader = service.stream_answer(client, Backend.name, 'store', 'model', 'Why?', {})
+    assert next(leader) == 'Prefetched '
+
+    answer, messages, chunks = {}, [], []
+    follower = threading.Thread(target=lambda: chunks.extend(_ask(service, client, answer, messages)))
+    follower.start()
+    time.sleep(0.1)
+    leader.close()
+    follower.join(5)
+
+    assert chunks == ['Prefetched ']
+    assert answer['text'] == '' and answer['latency'] is None and answer['ttft'] is None
+    assert messages == [answer['error']]
+    assert service.answer_cache.get('store', 'model', 'Why?') is None
+
+
+def test_cancelled_prefetch_is_not_passed_off_as_complete(tmp_path):
+    service = ChatService(
+        {Backend.name: Backend()}, None, AnswerCache(tmp_path / 'answers.db'), prefetcher=Prefetcher(1)
+    )
+    client = Client()
+    service.prefetch(client, Backend.name, 'store', 'model', ['Why?'])
+    while not client.calls:
+        time.sleep(0.01)
+
+    answer, messages, chunks = {}, [], []
+    follower = threading.Thread(target=lambda: chunks.extend(_ask(service, client, answer, messages)))
+    follower.start()
+    time.sleep(0.1)
+    service.prefetcher.cancel('store')
+    client.release.set()
+    follower.join(5)
+
+    assert chunks == ['Prefetched ']
+    assert answer['text'] == '' and messages == [answer['error']]
+    assert service.answer_cache.get('store', 'model', 'Why?') is None
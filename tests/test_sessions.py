@@ -0,0 +1,69 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.sessions import SessionWriter, SqliteSessionStore  # noqa: E402
+
+
+def _writer(tmp_path):
+    # A long interval so only explicit flushes and loads write
+    return SessionWriter(SqliteSessionStore(tmp_path / 'sessions.sqlite3'), interval_sec=3600)
+
+
+def test_writes_are_queued_until_flushed(tmp_path):
+    writer = _writer(tmp_path)
+    writer.update('token', {'store_name': 'stores/a'})
+    writer.update('token', {'store_name': 'stores/b'})
+    writer.append('token', {'role': 'user', 'content': 'Hi?'})
+
+    assert writer.store.load('token') is None
+    assert writer.flush() == 1
+    assert writer.store.load('token') == ({'store_name': 'stores/b'}, [{'role': 'user', 'content': 'Hi?'}])
+
+
+def test_session_resumes_from_a_new_process(tmp_path):
+    writer = _writer(tmp_path)
+    writer.update('token', {'store_name': 'stores/a'})
+    writer.append('token', {'role': 'user', 'content': 'Hi?'})
+    writer.append('token', {'role': 'assistant', 'content': 'Hello'})
+    writer.flush()
+
+    # Another replica or a restart sees the same session
+    resumed = _writer(tmp_path)
+    resumed.append('token', {'role': 'user', 'content': 'More?'})
+    state, messages = resumed.load('token')
+    assert state == {'store_name': 'stores/a'}
+    assert [m['content'] for m in messages] == ['Hi?', 'Hello', 'More?']
+    assert resumed.load('unknown') is None
+
+
+def test_reset_and_delete(tmp_path):
+    writer = _writer(tmp_path)
+    writer.update('token', {'store_name': 'stores/a'})
+    writer.append('token', {'role': 'user', 'content': 'Hi?'})
+    writer.flush()
+
+    writer.reset_messages('token')
+    writer.append('token', {'role': 'user', 'content': 'Fresh start?'})
+    assert writer.load('token')[1] == [{'role': 'user', 'content': 'Fresh start?'}]
+
+    writer.delete('token')
+    assert writer.load('token') is None
+
+
+def test_failed_batch_is_retried_with_later_writes(tmp_path):
+    writer = _writer(tmp_path)
+    apply = writer.store.apply
+
+    def unavailable(updates):
+        raise OSError('disk full')
+
+    writer.store.apply = unavailable
+    writer.append('token', {'role': 'user', 'content': 'First?'})
+    assert writer.flush() == 0
+
+    writer.store.apply = apply
+    writer.append('token', {'role': 'user', 'content': 'Second?'})
+    assert writer.flush() == 1
+    assert [m['content'] for m in writer.store.load('token')[1]] == ['First?', 'Second?']
@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdfchat.store_index import StoreIndex, compute_collection_key, compute_content_key  # noqa: E402
+
+
+def test_references_are_counted_until_the_last_release(tmp_path):
+    index = StoreIndex(tmp_path / 'index.sqlite3')
+    assert index.acquire('key') is None
+
+    assert index.register('key', 'stores/a') == 'stores/a'
+    assert index.acquire('key') == 'stores/a'
+    assert index.release('stores/a') == 1
+    assert index.release('stores/a') == 0
+    assert index.acquire('key') is None
+    assert index.release('stores/a') is None
+
+
+def test_second_registration_of_the_same_content_joins_the_first_store(tmp_path):
+    index = StoreIndex(tmp_path / 'index.sqlite3')
+    index.register('key', 'stores/a')
+
+    assert index.register('key', 'stores/b') == 'stores/a'
+    assert index.release('stores/a') == 1
+
+
+def test_forget_drops_the_entry_and_all_references(tmp_path):
+    index = StoreIndex(tmp_path / 'index.sqlite3')
+    index.register('key', 'stores/a')
+    index.acquire('key')
+
+    index.forget('stores/a')
+    assert index.acquire('key') is None
+    assert index.release('stores/a') is None
+
+
+def test_content_key_depends_on_settings_and_project_not_document_order():
+    assert compute_content_key(b'pdf', 'model') != compute_content_key(b'pdf', 'other-model')
+    assert compute_content_key(b'pdf', 'model', project='a') != compute_content_key(b'pdf', 'model', project='b')
+    assert compute_collection_key([b'one', b'two'], 'model') == compute_collection_key([b'two', b'one'], 'model')
+    assert compute_collection_key([b'one'], 'model') == compute_content_key(b'one', 'model')